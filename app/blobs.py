@@ -0,0 +1,308 @@
+import atexit
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from app.metrics import register_collector
+
+
+class BlobRef:
+    """Handle to a byte range of a UTF-8 text blob in the blob store.
+
+    Large state values are carried as these instead of strings: they pickle and
+    serialize in a few bytes, and text() decodes the range only when a tool needs it.
+    """
+
+    __slots__ = ("digest", "offset", "length")
+
+    def __init__(self, digest: str, offset: int, length: int):
+        self.digest = digest
+        self.offset = offset
+        self.length = length
+
+    def data(self) -> bytes:
+        return get_blob_store().buffer(self.digest)[self.offset:self.offset + self.length]
+
+    def text(self) -> str:
+        with memoryview(get_blob_store().buffer(self.digest)) as view:
+            return str(view[self.offset:self.offset + self.length], "utf-8", "surrogatepass")
+
+    def views(self, pieces: List[str]) -> List["BlobRef"]:
+        """Handles for consecutive pieces of this blob's text, e.g. the chunks it was split into."""
+        views = []
+        offset = self.offset
+        for piece in pieces:
+            length = len(piece) if piece.isascii() else len(piece.encode("utf-8", "surrogatepass"))
+            views.append(BlobRef(self.digest, offset, length))
+            offset += length
+        return views
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"$blob": self.digest, "offset": self.offset, "length": self.length}
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, BlobRef) and \
+            (self.digest, self.offset, self.length) == (other.digest, other.offset, other.length)
+
+    def __hash__(self) -> int:
+        return hash((self.digest, self.offset, self.length))
+
+    def __repr__(self) -> str:
+        return f"BlobRef({self.digest!r}, {self.offset}, {self.length})"
+
+    def __reduce__(self):
+        return BlobRef, (self.digest, self.offset, self.length)
+
+
+def decode_ref(value: Dict[str, Any]) -> Any:
+    """json object_hook turning BlobRef.to_json() output back into a handle."""
+    if "$blob" in value:
+        return BlobRef(value["$blob"], value["offset"], value["length"])
+    return value
+
+
+def iter_refs(value: Any) -> Iterator[BlobRef]:
+    """Every handle in a state (or any JSON-like value)."""
+    if isinstance(value, BlobRef):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from iter_refs(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from iter_refs(item)
+
+
+def resolve(value: Any) -> Any:
+    """The text behind a handle; any other value as is. Tools call this on inputs that may be large."""
+    return value.text() if isinstance(value, BlobRef) else value
+
+
+def resolve_refs(value: Any) -> Any:
+    """Copy of a state (or any JSON-like value) with every handle replaced by its text."""
+    if isinstance(value, BlobRef):
+        return value.text()
+    if isinstance(value, dict):
+        return {key: resolve_refs(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_refs(item) for item in value]
+    return value
+
+
+class BlobStore:
+    """Content-addressed files holding large state values, memory-mapped once per process.
+
+    Processes sharing the directory (API, pool and worker processes on one host) share
+    the blobs, and the OS page cache keeps a single copy of each. Strings of at least
+    min_bytes characters are moved here by externalize(); 0 (the default) disables that,
+    since every tool reading such a value must then accept handles (see resolve()).
+
+    Blobs live as long as something references them: sweep() unmaps and deletes the
+    ones no stored run or cache entry refers to. max_maps bounds the blobs kept mapped,
+    least recently used first out (pool processes, which never sweep). A private
+    directory belongs to this process alone (and its pools) and is removed at exit.
+    """
+
+    def __init__(self, directory: str, min_bytes: int = 0, max_maps: Optional[int] = None,
+                 private: bool = False):
+        self.directory = directory
+        self.min_bytes = min_bytes
+        self.max_maps = max_maps
+        self.private = private
+        self._owner_pid = os.getpid()
+        self._maps: "OrderedDict[str, mmap.mmap]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, text: str) -> BlobRef:
+        data = text.encode("utf-8", "surrogatepass")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        try:
+            os.utime(path) # already stored; restarts its grace period (see sweep())
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return BlobRef(digest, 0, len(data))
+
+    def buffer(self, digest: str) -> mmap.mmap:
+        mapped = self._maps.get(digest)
+        if mapped is None:
+            with self._lock:
+                mapped = self._maps.get(digest)
+                if mapped is None:
+                    with open(self._path(digest), "rb") as f:
+                        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._maps[digest] = mapped
+                    if self.max_maps is not None:
+                        self._unmap(list(self._maps)[:-self.max_maps])
+        elif self.max_maps is not None:
+            self._maps.move_to_end(digest)
+        return mapped
+
+    def _unmap(self, digests: Iterable[str]) -> List[str]:
+        # Under _lock. A blob still viewed (a memoryview into it is alive) stays mapped.
+        unmapped = []
+        for digest in digests:
+            try:
+                self._maps[digest].close()
+            except BufferError:
+                continue
+            del self._maps[digest]
+            unmapped.append(digest)
+        return unmapped
+
+    def _stored_before(self, digest: str, cutoff: float) -> bool:
+        try:
+            return os.stat(self._path(digest)).st_mtime < cutoff
+        except FileNotFoundError:
+            return True
+
+    def sweep(self, live: Set[str], grace_seconds: float, delete: bool = True) -> int:
+        """Unmaps the blobs not in live that were last stored over grace_seconds ago and,
+        with delete, removes their files; returns the number of files removed.
+
+        The grace period covers blobs put by runs that are not saved yet.
+        """
+        cutoff = time.time() - grace_seconds
+        with self._lock:
+            self._unmap([digest for digest in self._maps
+                         if digest not in live and self._stored_before(digest, cutoff)])
+            in_use = set(self._maps) # still viewed, retried by the next sweep
+        if not delete:
+            return 0
+        deleted = 0
+        try:
+            folders = os.listdir(self.directory)
+        except FileNotFoundError:
+            folders = []
+        for folder in folders:
+            try:
+                names = os.listdir(os.path.join(self.directory, folder))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for name in names:
+                digest = name.split(".", 1)[0] # also matches temporary files left by crashed writers
+                if digest in live or digest in in_use:
+                    continue
+                path = os.path.join(self.directory, folder, name)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                        deleted += name == digest
+                except FileNotFoundError:
+                    continue
+        return deleted
+
+    def has(self, digest: str) -> bool:
+        return digest in self._maps or os.path.exists(self._path(digest))
+
+    def externalize(self, values: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """values with every string of at least min_bytes characters replaced by a handle."""
+        if not values or self.min_bytes <= 0:
+            return values
+        large = [key for key, value in values.items() if isinstance(value, str) and len(value) >= self.min_bytes]
+        if not large:
+            return values
+        return {**values, **{key: self.put(values[key]) for key in large}}
+
+    def mapped_bytes(self) -> int:
+        return sum(len(mapped) for mapped in list(self._maps.values()))
+
+    def close(self):
+        """Unmaps every blob; a private directory is removed with its blobs."""
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+        if self.private and os.getpid() == self._owner_pid:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _create_blob_store_from_env() -> BlobStore:
+    # Without WORKFLOW_BLOB_DIR, each process gets a directory of its own: another
+    # process can then never delete a blob this one still references.
+    directory = os.environ.get("WORKFLOW_BLOB_DIR")
+    private = not directory
+    if private:
+        directory = os.path.join(tempfile.gettempdir(), f"workflow-blobs-{os.getpid()}")
+    return BlobStore(directory, min_bytes=int(os.environ.get("WORKFLOW_BLOB_MIN_BYTES", 0)), private=private)
+
+
+_blob_store = _create_blob_store_from_env()
+
+
+def get_blob_store() -> BlobStore:
+    return _blob_store
+
+
+def configure_blob_store(store: BlobStore):
+    """Replaces the blob store; process pools started afterwards resolve handles from its directory."""
+    global _blob_store
+    _blob_store = store
+
+
+# Callables returning the digests of the blobs something still references (stored
+# runs, cache entries); see sweep_blobs().
+_blob_sources: List[Callable[[], Iterable[str]]] = []
+_sweep_config = {
+    "interval_seconds": float(os.environ.get("WORKFLOW_BLOB_SWEEP_SECONDS", 60)),
+    "grace_seconds": float(os.environ.get("WORKFLOW_BLOB_GRACE_SECONDS", 600)),
+}
+_last_sweep = time.monotonic()
+
+
+def register_blob_source(source: Callable[[], Iterable[str]]):
+    _blob_sources.append(source)
+
+
+def live_digests() -> Set[str]:
+    digests: Set[str] = set()
+    for source in _blob_sources:
+        digests.update(source())
+    return digests
+
+
+def sweep_blobs(force: bool = False, shared_references: bool = False) -> int:
+    """Unmaps and deletes the blobs no stored run or cache entry references; returns how many were deleted.
+
+    Called by the run stores as they evict runs. Blobs in a directory other processes
+    share (WORKFLOW_BLOB_DIR) are only deleted when the runs referencing them are
+    tracked by a store those processes share too (shared_references), and are only
+    unmapped otherwise. Does nothing if the last sweep is less than
+    WORKFLOW_BLOB_SWEEP_SECONDS ago (unless forced), or if this process neither stores
+    nor maps blobs.
+    """
+    global _last_sweep
+    now = time.monotonic()
+    if not force and (now - _last_sweep < _sweep_config["interval_seconds"]
+                      or (_blob_store.min_bytes <= 0 and not _blob_store._maps)):
+        return 0
+    _last_sweep = now
+    return _blob_store.sweep(live_digests(), _sweep_config["grace_seconds"],
+                             delete=_blob_store.private or shared_references)
+
+
+@atexit.register
+def _close_blob_store():
+    _blob_store.close()
+
+
+def _collect_metrics():
+    yield "workflow_blob_mapped_blobs", "gauge", "Blobs memory-mapped by this process.", {}, len(_blob_store._maps)
+    yield "workflow_blob_mapped_bytes", "gauge", "Bytes of blobs memory-mapped by this process.", {}, \
+        _blob_store.mapped_bytes()
+
+
+register_collector(_collect_metrics)
@@ -0,0 +1,364 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from app.blobs import BlobRef, get_blob_store, iter_refs, register_blob_source
+from app.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+def _hash_value(digest: "hashlib._Hash", value: Any):
+    if isinstance(value, str):
+        digest.update(b"s")
+        digest.update(value.encode("utf-8", "surrogatepass"))
+    elif isinstance(value, BlobRef):
+        # Same key as the text itself, so handles and strings share cache entries.
+        digest.update(b"s")
+        digest.update(value.data())
+    elif isinstance(value, bytes):
+        digest.update(b"b")
+        digest.update(value)
+    else:
+        digest.update(b"j")
+        digest.update(json.dumps(value, sort_keys=True, default=repr).encode("utf-8"))
+    digest.update(b"\0")
+
+
+def cache_key(tool_name: str, node_config: Dict[str, Any], values: Iterable[Tuple[str, Any]]) -> str:
+    """Content hash of a tool invocation: tool name, node config and the inputs it reads."""
+    digest = hashlib.sha256()
+    digest.update(tool_name.encode("utf-8"))
+    digest.update(b"\0")
+    _hash_value(digest, node_config)
+    for key, value in values:
+        digest.update(key.encode("utf-8"))
+        digest.update(b"=")
+        _hash_value(digest, value)
+    return digest.hexdigest()
+
+
+def estimate_size(value: Any) -> int:
+    """Cheap approximation of a value's memory footprint, used for byte-based eviction."""
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class DiskTier:
+    """Pickled cache entries in a SQLite (WAL) file, an LRU bounded by max_bytes.
+
+    Writes and recency updates are queued and applied by a background thread with its
+    own connection, one transaction per batch, so the event loop only does indexed reads.
+    Processes sharing the directory share the entries; each bounds the file by what it
+    sees at startup plus what it writes.
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        used_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS entries_used_at ON entries (used_at);
+    """
+    BATCH_DELAY = 0.05 # seconds the writer waits to gather more entries into one transaction
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.path = os.path.join(directory, "cache.db")
+        os.makedirs(directory, exist_ok=True)
+        self._conn = self._connect()
+        self._conn.executescript(self._SCHEMA)
+        self.size_bytes, self.entries = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM entries"
+        ).fetchone()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # Values not written yet (served from here meanwhile), and keys read since the last batch.
+        self._pending: Dict[str, Any] = {}
+        self._used: set = set()
+        self._outstanding = 0
+        threading.Thread(target=self._write_batches, name="workflow-cache-writer", daemon=True).start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """The stored values of those keys that have one, in one query per 500 keys."""
+        found: Dict[str, Any] = {}
+        with self._lock:
+            for key in keys:
+                value = self._pending.get(key, MISSING)
+                if value is not MISSING:
+                    found[key] = value
+        missing = [key for key in keys if key not in found]
+        rows = []
+        for start in range(0, len(missing), 500):
+            part = missing[start:start + 500]
+            rows += self._conn.execute(
+                f"SELECT key, value FROM entries WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+        if rows:
+            with self._lock:
+                self._used.update(key for key, _ in rows)
+        for key, data in rows:
+            try:
+                found[key] = pickle.loads(data)
+            except Exception as e:
+                logger.warning(f"Discarding unreadable cache entry {key}: {e}")
+        return found
+
+    def put_many(self, items: List[Tuple[str, Any]]):
+        with self._lock:
+            for key, value in items:
+                if key not in self._pending:
+                    self._pending[key] = value
+                    self._outstanding += 1
+            self._wakeup.notify()
+
+    def _write_batches(self):
+        conn = self._connect()
+        while True:
+            with self._lock:
+                while not self._pending and not self._used:
+                    self._wakeup.wait()
+            time.sleep(self.BATCH_DELAY)
+            with self._lock:
+                pending, used = dict(self._pending), self._used
+                self._used = set()
+            try:
+                self._write(conn, pending, used)
+            except Exception as e:
+                logger.warning(f"Could not write {len(pending)} cache entries: {e}")
+            with self._lock:
+                for key in pending:
+                    del self._pending[key]
+                self._outstanding -= len(pending)
+                self._wakeup.notify_all()
+
+    def _write(self, conn: sqlite3.Connection, pending: Dict[str, Any], used: set):
+        now = time.time()
+        size, count = self.size_bytes, self.entries
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, value in pending.items():
+                data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                # Keys are content hashes: an existing entry already holds this value.
+                if len(data) <= self.max_bytes and conn.execute(
+                    "INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?)", (key, data, len(data), now)
+                ).rowcount:
+                    size += len(data)
+                    count += 1
+            conn.executemany("UPDATE entries SET used_at = ? WHERE key = ?", [(now, key) for key in used])
+            if size > self.max_bytes:
+                # Least recently used first, until the rest fits.
+                evict = []
+                for key, entry_size in conn.execute("SELECT key, size FROM entries ORDER BY used_at"):
+                    if size <= self.max_bytes:
+                        break
+                    evict.append((key,))
+                    size -= entry_size
+                conn.executemany("DELETE FROM entries WHERE key = ?", evict)
+                count -= len(evict)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.size_bytes, self.entries = size, count
+
+    def flush(self):
+        """Waits until queued writes are done."""
+        with self._lock:
+            while self._outstanding:
+                self._wakeup.wait()
+
+
+class NodeCache:
+    """LRU cache of tool outputs bounded by total (estimated) bytes, with an optional disk tier.
+
+    The disk tier (see DiskTier) is bounded by disk_max_bytes and written off the event loop.
+    Values holding blob handles stay in memory: the blobs are swept once no run or memory
+    entry references them, which the disk tier would outlive.
+    Cached values are shared between runs and must be treated as immutable, like state values.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_dir: Optional[str] = None,
+                 disk_max_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk = DiskTier(disk_dir, disk_max_bytes) if disk_dir else None
+        # key -> (value, estimated size, digests of the blobs the value holds handles to)
+        self._entries: "OrderedDict[str, Tuple[Any, int, FrozenSet[str]]]" = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        return self.get_many([key])[0]
+
+    def get_many(self, keys: List[str]) -> List[Any]:
+        """Cached values for keys, MISSING where there is none; the disk tier is read in bulk."""
+        values = []
+        missing = []
+        for i, key in enumerate(keys):
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] and not all(map(get_blob_store().has, entry[2])):
+                # Deleted by the sweep of another process sharing the blob directory.
+                self._remove(key)
+                entry = None
+            if entry is None:
+                values.append(MISSING)
+                missing.append(i)
+            else:
+                self._entries.move_to_end(key)
+                values.append(entry[0])
+        if missing and self.disk is not None:
+            found = self.disk.get_many([keys[i] for i in missing])
+            for i in missing:
+                value = found.get(keys[i], MISSING)
+                if value is not MISSING:
+                    values[i] = value
+                    self._put_memory(keys[i], value)
+        misses = sum(value is MISSING for value in values)
+        self.hits += len(keys) - misses
+        self.misses += misses
+        return values
+
+    def put(self, key: str, value: Any):
+        self.put_many([(key, value)])
+
+    def put_many(self, items: List[Tuple[str, Any]]):
+        for key, value in items:
+            self._put_memory(key, value)
+        if self.disk is not None:
+            self.disk.put_many([(key, value) for key, value in items
+                                if next(iter_refs(value), None) is None])
+
+    def flush(self):
+        if self.disk is not None:
+            self.disk.flush()
+
+    def _put_memory(self, key: str, value: Any):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (value, size, frozenset(ref.digest for ref in iter_refs(value)))
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.size_bytes -= evicted_size
+
+    def _remove(self, key: str):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size_bytes -= old[1]
+
+    def blob_digests(self) -> Set[str]:
+        return {digest for _, _, digests in self._entries.values() for digest in digests}
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "size_bytes": self.size_bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "disk_dir": self.disk_dir,
+                "disk_entries": self.disk.entries if self.disk else 0,
+                "disk_bytes": self.disk.size_bytes if self.disk else 0}
+
+
+class ItemCache:
+    """Per-item view of NodeCache used by map nodes: one entry per (tool, config, item).
+
+    cache may be None for uncached tools that only reuse a previous run's results.
+    """
+
+    def __init__(self, cache: Optional[NodeCache], tool_name: str, node_config: Dict[str, Any]):
+        self.cache = cache
+        self.tool_name = tool_name
+        self.node_config = node_config
+        self.hits = 0
+        self.hit_indices: List[int] = []
+        self._previous: Dict[str, Any] = {}
+
+    def key(self, item: Any) -> str:
+        return cache_key(self.tool_name, self.node_config, (("item", item),))
+
+    def carry_over(self, items: Iterable[Any], results: Iterable[Any]):
+        """Answers lookups for items of a previous run of this node with that run's results."""
+        self._previous = {self.key(item): result for item, result in zip(items, results)}
+
+    def lookup_many(self, keys: List[str], indices: List[int]) -> List[Any]:
+        """Results for the items with these keys (MISSING if unknown); indices are the items' positions."""
+        values = [self._previous.get(key, MISSING) for key in keys]
+        missing = [i for i, value in enumerate(values) if value is MISSING]
+        if missing and self.cache is not None:
+            for i, value in zip(missing, self.cache.get_many([keys[i] for i in missing])):
+                values[i] = value
+        for index, value in zip(indices, values):
+            if value is not MISSING:
+                self.hits += 1
+                self.hit_indices.append(index)
+        return values
+
+    def store_many(self, items: List[Tuple[str, Any]]):
+        if self.cache is not None:
+            self.cache.put_many(items)
+
+
+_cache = NodeCache(
+    max_bytes=int(os.environ.get("WORKFLOW_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    disk_dir=os.environ.get("WORKFLOW_CACHE_DIR") or None,
+    disk_max_bytes=int(os.environ.get("WORKFLOW_CACHE_DISK_MAX_BYTES", 1024 * 1024 * 1024)),
+)
+
+
+def get_cache() -> NodeCache:
+    return _cache
+
+
+def configure_cache(cache: NodeCache):
+    global _cache
+    _cache = cache
+
+
+def _cache_blob_digests() -> Set[str]:
+    return _cache.blob_digests()
+
+
+register_blob_source(_cache_blob_digests)
+
+
+def _collect_metrics():
+    stats = _cache.stats()
+    yield "workflow_cache_entries", "gauge", "Entries in the in-memory node cache.", {}, stats["entries"]
+    yield "workflow_cache_bytes", "gauge", "Estimated bytes held by the in-memory node cache.", {}, stats["size_bytes"]
+    yield "workflow_cache_disk_bytes", "gauge", "Bytes of node cache files on disk.", {}, stats["disk_bytes"]
+    yield "workflow_cache_hits_total", "counter", "Node cache hits (memory or disk).", {}, stats["hits"]
+    yield "workflow_cache_misses_total", "counter", "Node cache misses.", {}, stats["misses"]
+
+
+register_collector(_collect_metrics)
@@ -0,0 +1,145 @@
+import codecs
+from bisect import bisect_left
+import re
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# A sentence ends at ., ! or ? (optionally followed by closing quotes/brackets)
+# and the whitespace after it. The whitespace stays with the preceding chunk.
+_SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s+")
+
+
+def _cut_point(text: str, start: int, max_chars: int) -> int:
+    """Index just after the last sentence boundary in text[start:start + max_chars]."""
+    end = start + max_chars
+    cut = 0
+    for match in _SENTENCE_END.finditer(text, start, end):
+        cut = match.end()
+    return cut or end
+
+
+class SentenceChunker:
+    """Incremental splitter: feed text pieces, get back chunks of whole sentences.
+
+    Chunks never exceed max_chars; a single sentence longer than that is hard-split.
+    Only the unfinished tail is buffered, so memory is bounded by max_chars plus
+    the size of one fed piece, regardless of the document size.
+    """
+
+    def __init__(self, max_chars: int = 1000):
+        if max_chars < 1:
+            raise ValueError("max_chars must be positive")
+        self.max_chars = max_chars
+        self._tail = ""
+
+    def feed(self, piece: str) -> Iterator[str]:
+        text = self._tail + piece if self._tail else piece
+        start = 0
+        # Keep the last max_chars: they could still be extended by the next piece.
+        while len(text) - start > self.max_chars:
+            cut = _cut_point(text, start, self.max_chars)
+            yield text[start:cut]
+            start = cut
+        self._tail = text[start:]
+
+    def flush(self) -> Iterator[str]:
+        text, self._tail = self._tail, ""
+        if text.strip():
+            yield text
+
+
+def iter_sentence_chunks(pieces: Iterable[str], max_chars: int = 1000) -> Iterator[str]:
+    """Splits a stream of text pieces into sentence-aligned chunks."""
+    chunker = SentenceChunker(max_chars)
+    for piece in pieces:
+        yield from chunker.feed(piece)
+    yield from chunker.flush()
+
+
+async def aiter_sentence_chunks(pieces: AsyncIterable[bytes], max_chars: int = 1000,
+                                encoding: str = "utf-8") -> AsyncIterator[str]:
+    """Async form of iter_sentence_chunks over a byte stream such as a request body."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    chunker = SentenceChunker(max_chars)
+    async for piece in pieces:
+        for chunk in chunker.feed(decoder.decode(piece)):
+            yield chunk
+    for chunk in chunker.feed(decoder.decode(b"", final=True)):
+        yield chunk
+    for chunk in chunker.flush():
+        yield chunk
+
+
+def _next_cut(text: str, start: int, max_chars: int, sentence_aware: bool) -> Optional[int]:
+    """End of the chunk starting at start, or None when the rest of text is the final chunk."""
+    if len(text) - start <= max_chars:
+        return None
+    return _cut_point(text, start, max_chars) if sentence_aware else start + max_chars
+
+
+def split_chunks(text: str, max_chars: int = 1000, sentence_aware: bool = True) -> List[str]:
+    """Splits a whole text: sentence-aligned chunks, or fixed max_chars slices."""
+    if sentence_aware:
+        return list(iter_sentence_chunks([text], max_chars))
+    return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+
+def resplit_chunks(previous_text: str, previous_chunks: List[str], text: str, max_chars: int = 1000,
+                   sentence_aware: bool = True) -> Tuple[List[str], int]:
+    """Splits text exactly as split_chunks would, given that previous_chunks is the split of previous_text.
+
+    A cut only depends on the next max_chars characters, so wherever those equal the ones
+    after a previous boundary, the previous chunk is reused after one comparison instead
+    of a boundary search. After an edit, chunks are cut afresh until one equals a previous
+    chunk, which realigns the walk. Returns the chunks and how many were cut afresh.
+    """
+    starts = [0]
+    for chunk in previous_chunks:
+        starts.append(starts[-1] + len(chunk))
+    leftover = previous_text[starts[-1]:] if starts[-1] <= len(previous_text) else None
+    if leftover is None or (leftover.strip() if sentence_aware else leftover):
+        # previous_chunks are not how previous_text splits (e.g. different settings): start over.
+        chunks = split_chunks(text, max_chars, sentence_aware)
+        return chunks, len(chunks)
+
+    by_content: Optional[Dict[str, List[int]]] = None
+    chunks: List[str] = []
+    cut_count = 0
+    start = 0
+    index: Optional[int] = 0 # previous chunk starting where text is aligned with previous_text
+    while start < len(text):
+        if index is not None:
+            aligned = starts[index]
+            if len(text) - start > max_chars and len(previous_text) - aligned > max_chars:
+                if text.startswith(previous_text[aligned:aligned + max_chars], start):
+                    chunks.append(previous_chunks[index])
+                    start += len(previous_chunks[index])
+                    index += 1
+                    continue
+            elif len(text) - start == len(previous_text) - aligned and text.endswith(previous_text[aligned:]):
+                chunks.extend(previous_chunks[index:])
+                return chunks, cut_count
+            hint, index = index, None
+        else:
+            hint = 0
+
+        cut = _next_cut(text, start, max_chars, sentence_aware)
+        if cut is None:
+            if not sentence_aware or text[start:].strip():
+                chunks.append(text[start:])
+                cut_count += 1
+            break
+        chunk = text[start:cut]
+        chunks.append(chunk)
+        cut_count += 1
+        start = cut
+
+        if by_content is None:
+            by_content = {}
+            for i, previous in enumerate(previous_chunks):
+                by_content.setdefault(previous, []).append(i)
+        candidates = by_content.get(chunk)
+        if candidates:
+            # Prefer the first match at or after where the walk lost alignment.
+            position = bisect_left(candidates, hint)
+            index = candidates[position if position < len(candidates) else 0] + 1
+    return chunks, cut_count
@@ -0,0 +1,247 @@
+import asyncio
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from app.models.api_models import GraphDefinition, NodeDefinition, EdgeDefinition
+from app.registry import ToolRegistry
+from app.executors import run_tool, run_map, run_batch_tool
+from app.cache import ItemCache, MISSING, cache_key, get_cache
+from app.state import MERGE_RULES
+
+# Node types
+TASK = "task"
+MAP = "map"
+JOIN = "join" # merges the branches that reach it, then runs its tool
+NODE_TYPES = (TASK, MAP, JOIN)
+
+
+class GraphCompilationError(ValueError):
+    """Raised when a graph definition references unknown nodes, tools or conditions."""
+
+
+class CompiledEdge:
+    __slots__ = ("target_id", "condition_name", "condition", "loop", "parallel")
+
+    def __init__(self, edge: EdgeDefinition, condition: Optional[Callable]):
+        self.target_id = edge.target_id
+        self.condition_name = edge.condition_name
+        self.condition = condition
+        self.loop = edge.loop
+        self.parallel = edge.parallel
+
+
+class CompiledNode:
+    __slots__ = ("id", "type", "action_name", "func", "batch_func", "incremental_func", "is_async", "policy", "reads", "cache",
+                 "config", "edges", "self_loop", "fan_out", "map_over", "output_key", "max_concurrency", "batch_size",
+                 "merge", "timeout")
+
+    def __init__(self, node: NodeDefinition, func: Callable, edges: Tuple[CompiledEdge, ...]):
+        options = ToolRegistry.get_tool_options(node.action_name)
+        self.id = node.id
+        self.type = node.type
+        self.action_name = node.action_name
+        self.func = func
+        self.batch_func = ToolRegistry.get_batch_tool(node.action_name)
+        self.incremental_func = ToolRegistry.get_incremental_tool(node.action_name)
+        self.is_async = asyncio.iscoroutinefunction(func)
+        self.policy = options["policy"]
+        self.reads = options["reads"]
+        self.cache = node.config.get("cache", options["cache"]) # node config opts in or out
+        self.config = node.config
+        self.edges = edges
+        # A loop=True edge back to this node lets the engine iterate it in a tight inner loop.
+        self.self_loop = any(edge.loop and edge.target_id == node.id for edge in edges)
+        self.fan_out = any(edge.parallel for edge in edges)
+        self.map_over = node.map_over
+        self.output_key = node.output_key
+        self.max_concurrency = node.max_concurrency
+        self.batch_size = node.batch_size
+        self.merge = node.merge
+        self.timeout: Optional[float] = node.config.get("timeout_s")
+
+    async def call(self, state: Dict[str, Any], items: Any = None, policy: Optional[str] = None,
+                   previous: Optional[Dict[str, Any]] = None) -> Tuple[Any, int]:
+        """Invokes the tool, dispatching sync tools through their execution policy.
+
+        For map nodes, items overrides state[map_over] (e.g. with a stream of chunks).
+        policy overrides the node's execution policy for this call (profiled runs use inline).
+        previous is the final state of an earlier run of this node: map nodes reuse its
+        per-item results, other tools switch to their incremental form if they have one.
+        Returns the tool's updates and how many results came from the node cache or previous.
+        """
+        policy = policy or self.policy
+        if self.type == MAP:
+            item_cache = None
+            if self.cache or previous is not None:
+                item_cache = ItemCache(get_cache() if self.cache else None, self.action_name, self.config)
+            if previous is not None:
+                previous_items, previous_results = previous.get(self.map_over), previous.get(self.output_key)
+                if isinstance(previous_items, list) and isinstance(previous_results, list) \
+                        and len(previous_items) == len(previous_results):
+                    item_cache.carry_over(previous_items, previous_results)
+            if items is None:
+                items = state.get(self.map_over) or []
+            results = await run_map(
+                self.func, policy, self.is_async, items,
+                self.config, self.max_concurrency, self.batch_size, item_cache
+            )
+            return {self.output_key: results}, item_cache.hits if item_cache else 0
+
+        if self.cache:
+            key = self._cache_key(state)
+            cached = get_cache().get(key)
+            if cached is not MISSING:
+                return cached, 1
+        if previous is not None and self.incremental_func is not None:
+            result = await run_tool(self.incremental_func, policy, {**state, "_previous": previous}, self.reads)
+        elif self.is_async:
+            result = await self.func(state)
+        else:
+            result = await run_tool(self.func, policy, state, self.reads)
+        if self.cache:
+            get_cache().put(key, result)
+        return result, 0
+
+    async def call_batch(self, states: List[Dict[str, Any]]) -> List[Tuple[Any, int]]:
+        """Like call, for several runs at this node at once; results are in input order."""
+        if len(states) == 1:
+            return [await self.call(states[0])]
+
+        if self.type == MAP:
+            # Pool every run's items into one map so small inputs still fill the pools.
+            item_lists = [list(state.get(self.map_over) or []) for state in states]
+            item_cache = ItemCache(get_cache(), self.action_name, self.config) if self.cache else None
+            results = await run_map(
+                self.func, self.policy, self.is_async, [item for items in item_lists for item in items],
+                self.config, self.max_concurrency, self.batch_size, item_cache
+            )
+            hit_indices = set(item_cache.hit_indices) if item_cache else set()
+            outputs = []
+            offset = 0
+            for items in item_lists:
+                end = offset + len(items)
+                hits = sum(1 for index in range(offset, end) if index in hit_indices)
+                outputs.append(({self.output_key: results[offset:end]}, hits))
+                offset = end
+            return outputs
+
+        if self.batch_func is None:
+            return list(await asyncio.gather(*(self.call(state) for state in states)))
+
+        outputs: List[Tuple[Any, int]] = [(MISSING, 0)] * len(states)
+        keys: List[Optional[str]] = [None] * len(states)
+        if self.cache:
+            for i, state in enumerate(states):
+                keys[i] = self._cache_key(state)
+                cached = get_cache().get(keys[i])
+                if cached is not MISSING:
+                    outputs[i] = (cached, 1)
+        todo = [i for i, (result, _) in enumerate(outputs) if result is MISSING]
+        if todo:
+            computed = await run_batch_tool(self.batch_func, self.policy, [states[i] for i in todo], self.reads)
+            for i, result in zip(todo, computed):
+                outputs[i] = (result, 0)
+                if self.cache:
+                    get_cache().put(keys[i], result)
+        return outputs
+
+    def _cache_key(self, state: Dict[str, Any]) -> str:
+        return cache_key(self.action_name, self.config, ((k, state.get(k)) for k in self.reads))
+
+    def next_node_id(self, state: Dict[str, Any]) -> Optional[str]:
+        """Returns the target of the first edge whose condition holds (edge order is priority)."""
+        for edge in self.edges:
+            if edge.condition is None or edge.condition(state):
+                return edge.target_id
+        return None
+
+    def next_node_ids(self, state: Dict[str, Any]) -> Tuple[str, ...]:
+        """Like next_node_id, but a fan-out node returns the targets of all matching edges."""
+        if not self.fan_out:
+            next_id = self.next_node_id(state)
+            return (next_id,) if next_id else ()
+        return tuple(edge.target_id for edge in self.edges if edge.condition is None or edge.condition(state))
+
+
+class CompiledGraph:
+    """Execution plan for a GraphDefinition with tools and conditions already resolved."""
+
+    def __init__(self, definition: GraphDefinition, nodes: Dict[str, CompiledNode]):
+        self.definition = definition
+        self.id = definition.id
+        self.version = definition.version
+        self.start_node_id = definition.start_node_id
+        self.nodes = nodes
+        self.has_branches = any(node.fan_out for node in nodes.values())
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        return (self.id, self.version)
+
+    def map_node_for(self, items_key: str) -> Optional[CompiledNode]:
+        """Returns the first map node that consumes state[items_key], if any."""
+        for node in self.nodes.values():
+            if node.type == MAP and node.map_over == items_key:
+                return node
+        return None
+
+
+def compile_graph(graph_def: GraphDefinition) -> CompiledGraph:
+    """Resolves every tool and condition once and indexes edges by source node."""
+    errors: List[str] = []
+    node_ids = set()
+    for node in graph_def.nodes:
+        if node.id in node_ids:
+            errors.append(f"Duplicate node id '{node.id}'")
+        node_ids.add(node.id)
+
+    if graph_def.start_node_id not in node_ids:
+        errors.append(f"Start node '{graph_def.start_node_id}' not found")
+
+    edges_by_source: Dict[str, List[CompiledEdge]] = {}
+    for edge in graph_def.edges:
+        if edge.source_id not in node_ids:
+            errors.append(f"Edge source '{edge.source_id}' not found")
+        if edge.target_id not in node_ids:
+            errors.append(f"Edge target '{edge.target_id}' not found")
+
+        condition = None
+        if edge.condition_name:
+            condition = ToolRegistry.get_condition(edge.condition_name)
+            if not condition:
+                errors.append(f"Condition '{edge.condition_name}' not found")
+        if edge.parallel and edge.loop:
+            errors.append(f"Edge {edge.source_id}->{edge.target_id} cannot be both parallel and a loop")
+        edges_by_source.setdefault(edge.source_id, []).append(CompiledEdge(edge, condition))
+
+    for source_id, edges in edges_by_source.items():
+        if len({edge.parallel for edge in edges}) > 1:
+            errors.append(f"Node '{source_id}' mixes parallel and sequential outgoing edges")
+
+    nodes: Dict[str, CompiledNode] = {}
+    for node in graph_def.nodes:
+        if node.type not in NODE_TYPES:
+            errors.append(f"Node '{node.id}' has unknown type '{node.type}'")
+        if node.type == MAP and not (node.map_over and node.output_key):
+            errors.append(f"Map node '{node.id}' requires map_over and output_key")
+        for key, rule in node.merge.items():
+            if rule not in MERGE_RULES:
+                errors.append(f"Node '{node.id}' has unknown merge rule '{rule}' for '{key}'")
+        timeout = node.config.get("timeout_s")
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0):
+            errors.append(f"Node '{node.id}' has invalid timeout_s {timeout!r}, expected a positive number")
+
+        func = ToolRegistry.get_tool(node.action_name)
+        if not func:
+            errors.append(f"Tool '{node.action_name}' not found for node '{node.id}'")
+            continue
+        cache = node.config.get("cache")
+        if cache is not None and not isinstance(cache, bool):
+            errors.append(f"Node '{node.id}' has invalid cache {cache!r}, expected true or false")
+        elif cache and ToolRegistry.get_tool_options(node.action_name)["reads"] is None:
+            errors.append(f"Node '{node.id}' enables cache, but tool '{node.action_name}' does not declare its reads")
+        nodes[node.id] = CompiledNode(node, func, tuple(edges_by_source.get(node.id, ())))
+
+    if errors:
+        raise GraphCompilationError(f"Invalid graph '{graph_def.id}': " + "; ".join(errors))
+
+    return CompiledGraph(graph_def, nodes)
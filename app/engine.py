@@ -1,135 +1,674 @@
 import asyncio
-import copy
+import contextlib
+import threading
+import time
 import uuid
 import logging
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import AsyncIterable, Awaitable, Callable, Dict, Any, List, Optional, Tuple, Union
 
-from app.models.api_models import GraphDefinition, ExecutionLogEntry
-from app.run_store import save_run, update_run, get_run
-from app.registry import ToolRegistry
+from app.models.api_models import GraphDefinition
+from app.compiler import JOIN, CompiledGraph, CompiledNode, compile_graph
+from app.run_store import save_run, update_run, append_log, get_run, get_plan, get_store, TERMINAL_STATUSES
+from app.state import RunState, merge_branches
+from app.scheduler import QueueFullError, get_scheduler
+from app.job_queue import RUN, RESUME, JobQueue
+from app.events import publish
+from app.blobs import get_blob_store
+from app.executors import INLINE, abort_event
+from app.profiling import RunProfiler
+from app.logs import log_sample_rate, run_logged, sampled
+from app.tracing import RunTrace, get_tracer, now_us
+from app.metrics import (
+    NODE_DURATION, RUN_DURATION, RUNS_TOTAL, RUNS_IN_FLIGHT, STATE_BYTES, STATE_APPLY_SECONDS
+)
 
-
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class RunTimeoutError(TimeoutError):
+    """A node exceeded its timeout_s, or the run its deadline_s; the run fails with this."""
+
+
+# Runs executing in this process, by run id (see cancel_run).
+_executions: Dict[str, "_RunContext"] = {}
+
 class WorkflowEngine:
-    def __init__(self, graph_def: GraphDefinition, run_id: str = None):
-        self.graph_def = graph_def
+    def __init__(self, graph: Union[CompiledGraph, GraphDefinition], run_id: str = None):
+        if isinstance(graph, CompiledGraph):
+            self.plan = graph
+        else:
+            # Reuse the plan compiled by save_graph when this exact definition is cached.
+            cached = get_plan(graph.id, graph.version)
+            self.plan = cached if cached is not None and cached.definition is graph else compile_graph(graph)
+        self.graph_def = self.plan.definition
         self.run_id = run_id or str(uuid.uuid4())
-        self.nodes_map = {n.id: n for n in self.graph_def.nodes}
-        self.edges_map = {} # source_id -> list of edges
-        for edge in self.graph_def.edges:
-            if edge.source_id not in self.edges_map:
-                self.edges_map[edge.source_id] = []
-            self.edges_map[edge.source_id].append(edge)
 
-    async def run_async(self, initial_state: Dict[str, Any], config: Dict[str, Any] = {}):
-        """Starts the workflow in the background."""
-        
+    def _create_run(self, initial_state: Dict[str, Any], status: str = "running",
+                    state: Optional[RunState] = None, config: Optional[Dict[str, Any]] = None,
+                    **extra: Any) -> RunState:
+        initial_state = get_blob_store().externalize(initial_state)
+        if state is None:
+            state = RunState(initial_state)
         save_run(self.run_id, {
             "run_id": self.run_id,
-            "status": "running",
-            "state": initial_state,
-            "execution_log": []
+            "graph_id": self.plan.id,
+            "graph_version": self.plan.version,
+            "status": status,
+            "initial_state": initial_state,
+            "state": state.data,
+            "config": config or {},
+            # Updated at every top-level node boundary; see resume().
+            "checkpoint": {"next": [self.plan.start_node_id]},
+            "execution_log": [],
+            **extra
         })
-        
-        
-        asyncio.create_task(self._execute(initial_state, config))
+        return state
+
+    async def run_async(self, initial_state: Dict[str, Any], config: Dict[str, Any] = {}):
+        """Queues the workflow to run in the background.
+
+        Raises QueueFullError (before any run record is created) when the scheduler is saturated.
+        """
+        initial_state = get_blob_store().externalize(initial_state)
+        state = RunState(initial_state)
+
+        async def job():
+            if self._cancelled_while_queued():
+                return
+            self._set_status("running")
+            await self._execute(state, config)
+
+        get_scheduler().submit(self.plan.id, job, priority=config.get("priority", 0))
+        self._create_run(initial_state, status="queued", state=state, config=config)
+        return self.run_id
+
+    def run_remote(self, queue: JobQueue, initial_state: Dict[str, Any], config: Dict[str, Any] = {}) -> str:
+        """Stores the run as queued in the shared run store and leaves it to a worker process.
+
+        Raises QueueFullError (before any run record is created) when too many jobs are waiting.
+        """
+        if not get_store().shared:
+            raise RuntimeError("Remote execution needs a run store shared with the workers (sqlite)")
+        scheduler = get_scheduler()
+        if queue.depth() >= scheduler.max_queue:
+            raise QueueFullError(scheduler.retry_after())
+        self._create_run(initial_state, status="queued", config=config)
+        get_store().release(self.run_id)
+        try:
+            queue.enqueue(self.run_id, RUN, priority=config.get("priority", 0))
+        except Exception as e:
+            self._fail(e)
+            raise
         return self.run_id
 
+    async def run_queued(self, run: Dict[str, Any]):
+        """Executes a run record queued by run_remote (called by python -m app.worker)."""
+        config = run.get("config", {})
+        state = self._create_run(run["initial_state"], config=config)
+        await self._execute(state, config)
+
     async def run_sync(self, initial_state: Dict[str, Any], config: Dict[str, Any] = {}):
         """Runs the workflow synchronously and returns the result."""
-        save_run(self.run_id, {
-            "run_id": self.run_id,
-            "status": "running",
-            "state": initial_state,
-            "execution_log": []
-        })
+        state = self._create_run(initial_state, config=config)
+        
+        await self._execute(state, config)
+        return get_run(self.run_id)
+
+    async def run_stream(self, items: AsyncIterable[Any], initial_state: Dict[str, Any],
+                         config: Dict[str, Any] = {}, items_key: str = "chunks"):
+        """Runs the workflow from the map node over items_key, feeding it items as they arrive.
+
+        Nodes before that map node (e.g. the splitter) are skipped: the caller already
+        produces the items, and they are never materialized into the state.
+        """
+        entry = self.plan.map_node_for(items_key)
+        if entry is None:
+            raise ValueError(f"Graph {self.plan.id} has no map node over '{items_key}'")
+        # The streamed items are gone after this run, so it can't be resumed at the map node.
+        state = self._create_run(initial_state, config=config, stream_node_id=entry.id)
         
-        await self._execute(initial_state, config)
+        await self._execute(state, config, start_node_id=entry.id, streams={items_key: items})
+        return get_run(self.run_id)
+
+    async def resume(self, run: Dict[str, Any], state_patch: Optional[Dict[str, Any]] = None,
+                     start_node_id: Optional[str] = None, config: Optional[Dict[str, Any]] = None,
+                     run_mode: str = "async", queue: Optional[JobQueue] = None):
+        """Continues an existing run from its checkpoint (or start_node_id) under the same run id.
+
+        The run's last checkpointed state is reused, with state_patch applied on top and
+        logged as a "_resume" entry. config is merged over the run's original config;
+        max_iterations counts from zero again. Returns the run id (async, after queueing;
+        with queue, a worker process picks it up) or the finished run record (sync).
+        """
+        start_ids = (start_node_id,) if start_node_id else tuple(run.get("checkpoint", {}).get("next", ()))
+        if not start_ids:
+            raise ValueError(f"Run {self.run_id} has no remaining nodes; pass start_node_id to re-run from a node")
+        unknown = [node_id for node_id in start_ids if node_id not in self.plan.nodes]
+        if unknown:
+            raise ValueError(f"Node(s) {unknown} not found in graph {self.plan.id}")
+        if not start_node_id and run.get("stream_node_id") in start_ids:
+            raise ValueError(f"Run {self.run_id} stopped at its streamed input; start a new streamed run")
+        config = {**run.get("config", {}), **(config or {})}
+
+        state = RunState(run.get("state"))
+        patch = self._apply(state, state_patch)
+        status = "queued" if run_mode == "async" else "running"
+        update_run(self.run_id, {"status": status, "error": None, "state": state.data, "config": config})
+        if patch:
+            now = datetime.utcnow()
+            append_log(self.run_id, {"node_id": "_resume", "start_ts": now, "end_ts": now, "delta": patch})
+
+        if run_mode == "async" and queue is not None:
+            get_store().release(self.run_id)
+            queue.enqueue(self.run_id, RESUME, {"start_node_id": start_node_id}, config.get("priority", 0))
+            return self.run_id
+
+        if run_mode == "async":
+            async def job():
+                if self._cancelled_while_queued():
+                    return
+                self._set_status("running")
+                await self._execute(state, config, start_node_ids=start_ids)
+
+            try:
+                get_scheduler().submit(self.plan.id, job, priority=config.get("priority", 0))
+            except Exception:
+                update_run(self.run_id, {"status": run["status"], "error": run.get("error")})
+                raise
+            return self.run_id
+
+        await self._execute(state, config, start_node_ids=start_ids)
         return get_run(self.run_id)
 
-    async def _execute(self, state: Dict[str, Any], config: Dict[str, Any]):
-        current_node_id = self.graph_def.start_node_id
-        max_iterations = config.get("max_iterations", 100)
-        steps = 0
+    def _cancelled_while_queued(self) -> bool:
+        run = get_run(self.run_id)
+        return run is not None and run["status"] == "cancelled"
+
+    def _set_status(self, status: str, **extra: Any):
+        update_run(self.run_id, {"status": status, **extra})
+        publish(self.run_id, "status", {"status": status, **extra})
+        if status in TERMINAL_STATUSES:
+            RUNS_TOTAL.inc((self.plan.id, status))
+
+    def _apply(self, state: RunState, updates: Any) -> Dict[str, Any]:
+        if not updates or not isinstance(updates, dict):
+            return {}
+        started = time.perf_counter()
+        # Large values a tool produced go to the blob store too; the state keeps handles.
+        delta = state.apply(get_blob_store().externalize(updates))
+        STATE_APPLY_SECONDS.inc((self.plan.id,), time.perf_counter() - started)
+        return delta
+
+    def _start_step(self, node: CompiledNode, state: RunState) -> Dict[str, Any]:
+        logger.info(f"Executing {node.id}...")
+        publish(self.run_id, "node_start", {"node_id": node.id})
+        return self._apply(state, {"_node_config": node.config})
+
+    def _finish_step(self, node: CompiledNode, state: RunState, delta: Dict[str, Any], result_updates: Any,
+                     start_ts: datetime, cache_hits: int = 0, iterations: int = 1,
+                     branch: Optional[str] = None) -> Tuple[str, ...]:
+        """Applies a node's updates, appends its log entry and returns the next node ids."""
+        delta.update(self._apply(state, result_updates))
+        
+        end_ts = datetime.utcnow()
+        labels = (self.plan.id, node.id)
+        NODE_DURATION.observe(labels, (end_ts - start_ts).total_seconds())
+        STATE_BYTES.set(labels, state.size_bytes)
+        
+        # Only changed keys are logged; full snapshots are rebuilt on read.
+        log_entry = {
+            "node_id": node.id,
+            "start_ts": start_ts,
+            "end_ts": end_ts,
+            "delta": delta
+        }
+        if cache_hits:
+            log_entry["cache_hits"] = cache_hits
+        if iterations > 1:
+            log_entry["iterations"] = iterations
+        if branch is not None:
+            log_entry["branch"] = branch
+        append_log(self.run_id, log_entry)
+        publish(self.run_id, "node_end", log_entry)
+        
+        return node.next_node_ids(state.view())
+
+    def _fail(self, error: Exception):
+        logger.error(f"Workflow failed: {error}")
+        self._set_status("failed", error=str(error))
+
+    async def _execute(self, state: RunState, config: Dict[str, Any],
+                       start_node_id: Optional[str] = None, streams: Optional[Dict[str, Any]] = None,
+                       start_node_ids: Tuple[str, ...] = ()):
+        """Runs the graph from start_node_id (default: the graph's start node).
+
+        start_node_ids resumes at a checkpoint; several ids re-run a fan-out's branches.
+        The nodes run in a task of their own, so cancel_run() can stop them and still
+        leave this coroutine to record the "cancelled" status.
+        """
+        graph_labels = (self.plan.id,)
+        started = time.perf_counter()
+        RUNS_IN_FLIGHT.inc(graph_labels)
+        ctx = None
+        status = "failed"
         
         try:
-            while current_node_id and steps < max_iterations:
-                node_def = self.nodes_map.get(current_node_id)
-                if not node_def:
-                    raise ValueError(f"Node {current_node_id} not found")
-
-                start_ts = datetime.utcnow()
-                
-                action_func = ToolRegistry.get_tool(node_def.action_name)
-                if not action_func:
-                    raise ValueError(f"Tool {node_def.action_name} not found")
-
-                
-                state["_node_config"] = node_def.config
-                
-                logger.info(f"Executing {current_node_id}...")
-                
-                if asyncio.iscoroutinefunction(action_func):
-                    result_updates = await action_func(copy.deepcopy(state))
-                else:
-                    result_updates = action_func(copy.deepcopy(state))
-                
-                if result_updates and isinstance(result_updates, dict):
-                    state.update(result_updates)
-                
-                end_ts = datetime.utcnow()
-                
-               
-                log_entry = ExecutionLogEntry(
-                    node_id=current_node_id,
-                    start_ts=start_ts,
-                    end_ts=end_ts,
-                    state_snapshot=copy.deepcopy(state)
-                )
-                
-               
-                current_run_data = get_run(self.run_id)
-                current_log = current_run_data.get("execution_log", [])
-                current_log.append(log_entry.dict())
-                
-                update_run(self.run_id, {
-                    "state": state,
-                    "execution_log": current_log
-                })
-                
-                steps += 1
-
-                
-                edges = self.edges_map.get(current_node_id, [])
-                next_node_id = None
-                
-                for edge in edges:
-                    
-                    condition_met = True
-                    if edge.condition_name:
-                        cond_func = ToolRegistry.get_condition(edge.condition_name)
-                        if cond_func:
-                            
-                            condition_met = cond_func(state)
-                        else:
-                            logger.warning(f"Condition {edge.condition_name} not found, assuming False")
-                            condition_met = False
-                    
-                    if condition_met:
-                        next_node_id = edge.target_id
-                       
-                        break
-                
-                current_node_id = next_node_id
-
-            update_run(self.run_id, {"status": "completed"})
+            ctx = _RunContext(config, streams, RunProfiler.from_config(config))
+            tracer = get_tracer()
+            ctx.trace = tracer.start_run(self.run_id, self.plan.id, config) if tracer else None
+            if config.get("previous_run_id"):
+                ctx.carry_over(load_previous_run(self.plan, config["previous_run_id"]))
+            if ctx.profiler:
+                await ctx.profiler.start()
+                ctx.policy = INLINE if ctx.profiler.inline else None
 
+            start_ids = start_node_ids or (start_node_id or self.plan.start_node_id,)
+            # The run's tasks (and tool threads) inherit these.
+            token = abort_event.set(ctx.abort)
+            logged_token = run_logged.set(sampled(self.run_id, log_sample_rate()))
+            ctx.task = asyncio.ensure_future(self._run_nodes(state, start_ids, ctx))
+            run_logged.reset(logged_token)
+            abort_event.reset(token)
+            _executions[self.run_id] = ctx
+            try:
+                await ctx.task
+            finally:
+                _executions.pop(self.run_id, None)
+                ctx.abort.set() # tools of this run still running in threads can stop early
+                if ctx.profiler:
+                    update_run(self.run_id, {"profile": ctx.profiler.finish()})
+
+            status = "completed"
+            self._set_status(status)
+
+        except asyncio.CancelledError:
+            if ctx is None or not ctx.cancelled:
+                status = "interrupted"
+                raise # e.g. shutdown: the run is marked interrupted on restart and can be resumed
+            status = "cancelled"
+            self._set_status(status)
         except Exception as e:
-            logger.error(f"Workflow failed: {e}")
-            update_run(self.run_id, {
-                "status": "failed",
-                "error": str(e)
-            })
+            self._fail(e)
+        finally:
+            if ctx is not None:
+                if ctx.trace:
+                    ctx.trace.finish(status)
+                ctx.done.set()
+            RUNS_IN_FLIGHT.dec(graph_labels)
+            RUN_DURATION.observe(graph_labels, time.perf_counter() - started)
+
+    async def _run_nodes(self, state: RunState, start_ids: Tuple[str, ...], ctx: "_RunContext"):
+        if len(start_ids) > 1:
+            join_id, merged = await self._fan_out(state, start_ids, ctx, None)
+            if join_id is None:
+                self._apply(state, merged)
+            else:
+                await self._run_path(state, join_id, ctx, merged=merged)
+        else:
+            await self._run_path(state, start_ids[0], ctx)
+
+    async def _run_path(self, state: RunState, node_id: Optional[str], ctx: "_RunContext",
+                        branch: Optional[str] = None, merged: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Runs nodes from node_id until the path ends; returns the join node a branch stopped at.
+
+        merged holds branch results to apply when node_id is the join they reached.
+        """
+        nodes = self.plan.nodes
+        while node_id and ctx.steps < ctx.max_iterations:
+            node = nodes.get(node_id)
+            if not node:
+                raise ValueError(f"Node {node_id} not found")
+            if node.type == JOIN and branch is not None and merged is None:
+                # The forking path merges this branch and runs the join itself.
+                return node_id
+
+            next_ids = await self._step(node, state, ctx, branch, merged)
+            merged = None
+            if branch is None:
+                # Checkpoint: the root state now holds everything up to this node.
+                update_run(self.run_id, {"checkpoint": {"next": list(next_ids), "after": node.id}})
+            if len(next_ids) > 1:
+                node_id, merged = await self._fan_out(state, next_ids, ctx, branch)
+                if node_id is None:
+                    # No branch reached a join: keep their changes and end this path.
+                    self._apply(state, merged)
+            else:
+                node_id = next_ids[0] if next_ids else None
+        return None
+
+    async def _step(self, node: CompiledNode, state: RunState, ctx: "_RunContext", branch: Optional[str],
+                    merged: Optional[Dict[str, Any]] = None) -> Tuple[str, ...]:
+        """Executes one node (all iterations of a fused self-loop) and returns the next node ids.
+
+        merged holds branch results for a join node; they are applied first and logged with it.
+        """
+        view = state.view()
+        profiler = ctx.profiler
+        if profiler:
+            profiler.start_node(node.id)
+        trace_start = now_us() if ctx.trace else 0.0
+        start_ts = datetime.utcnow()
+        delta = self._apply(state, merged)
+        delta.update(self._start_step(node, state))
+        
+        streams = ctx.streams
+        items = streams.pop(node.map_over, None) if streams and node.map_over else None
+        result_updates, cache_hits = await ctx.call(
+            node, branch, lambda: node.call(view, items, ctx.policy, ctx.previous_for(node))
+        )
+        iterations = 1
+        
+        if node.self_loop and ctx.fuse_loops:
+            # Iterate the self-loop here: one log entry, event and store write in total.
+            while ctx.steps + iterations < ctx.max_iterations:
+                delta.update(self._apply(state, result_updates))
+                if node.next_node_id(view) != node.id:
+                    break
+                result_updates, hits = await ctx.call(node, branch, lambda: node.call(view, policy=ctx.policy))
+                cache_hits += hits
+                iterations += 1
+        
+        next_ids = self._finish_step(node, state, delta, result_updates, start_ts, cache_hits, iterations, branch)
+        if profiler:
+            profiler.stop_node()
+        if ctx.trace:
+            ctx.trace.span(node.id, "node", trace_start, branch, action=node.action_name, iterations=iterations,
+                           cache_hits=cache_hits)
+        ctx.steps += iterations
+        return next_ids
+
+    async def _fan_out(self, state: RunState, targets: Tuple[str, ...], ctx: "_RunContext",
+                       branch: Optional[str]) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Runs one branch per target on a fork of the state, concurrently.
+
+        Returns the join node all branches reached (None if they just ended) and the
+        branches' changes merged by that join's rules.
+        """
+        forks = [state.fork() for _ in targets]
+        paths = [
+            self._run_path(fork, target, ctx, f"{branch}.{i}" if branch else str(i))
+            for i, (fork, target) in enumerate(zip(forks, targets))
+        ]
+        if ctx.profiler:
+            # Per-node profiles need one node at a time.
+            joins = [await path for path in paths]
+        else:
+            tasks = [asyncio.ensure_future(path) for path in paths]
+            try:
+                joins = await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+
+        join_ids = {join_id for join_id in joins if join_id}
+        if len(join_ids) > 1:
+            raise ValueError(f"Parallel branches {list(targets)} reach different join nodes {sorted(join_ids)}")
+        join_id = join_ids.pop() if join_ids else None
+        rules = self.plan.nodes[join_id].merge if join_id else {}
+        return join_id, merge_branches(rules, (fork.changes for fork in forks))
+
+
+class _RunContext:
+    """Per-run settings and counters shared by every branch of one _execute."""
+
+    __slots__ = ("max_iterations", "fuse_loops", "streams", "profiler", "policy", "steps", "previous",
+                 "previous_nodes", "deadline_s", "deadline", "task", "cancelled", "abort", "done", "trace")
+
+    def __init__(self, config: Dict[str, Any], streams: Optional[Dict[str, Any]], profiler: Optional[RunProfiler]):
+        self.max_iterations = config.get("max_iterations", 100)
+        self.fuse_loops = config.get("fuse_loops", True)
+        self.streams = streams
+        self.profiler = profiler
+        self.policy: Optional[str] = None
+        self.steps = 0
+        self.previous: Optional[Dict[str, Any]] = None
+        self.previous_nodes: Dict[str, CompiledNode] = {}
+        self.deadline_s: Optional[float] = config.get("deadline_s")
+        self.deadline = time.monotonic() + self.deadline_s if self.deadline_s else None
+        self.task: Optional[asyncio.Task] = None
+        self.cancelled = False
+        self.abort = threading.Event()
+        self.done = asyncio.Event()
+        self.trace: Optional[RunTrace] = None
+
+    def time_limit(self, node: CompiledNode) -> Optional[float]:
+        """Seconds the node's next call may take: its timeout_s, capped by what is left of the deadline."""
+        return _time_limit(node, self.deadline, self.deadline_s)
+
+    async def call(self, node: CompiledNode, branch: Optional[str],
+                   call: Callable[[], Awaitable[Tuple[Any, int]]]) -> Tuple[Any, int]:
+        """Runs one tool call of node within its time limit, traced as a "tool" span."""
+        if self.trace is None:
+            return await _timed(node, self.time_limit(node), call)
+        started = now_us()
+        hits = None
+        try:
+            updates, hits = await _timed(node, self.time_limit(node), call)
+            return updates, hits
+        finally:
+            # cache_hits is None when the call failed.
+            self.trace.span(node.action_name, "tool", started, branch, node_id=node.id,
+                            policy=self.policy or node.policy, cache_hits=hits, map_over=node.map_over)
+
+    def carry_over(self, run: Dict[str, Any]):
+        self.previous = run.get("state") or {}
+        plan = get_plan(run["graph_id"], run.get("graph_version"))
+        self.previous_nodes = plan.nodes if plan is not None else {}
+
+    def previous_for(self, node: CompiledNode) -> Optional[Dict[str, Any]]:
+        """The previous run's state, if that run executed this node with the same tool and config."""
+        before = self.previous_nodes.get(node.id)
+        if before is None or before.action_name != node.action_name or before.config != node.config:
+            return None
+        return self.previous
+
+
+def _time_limit(node: CompiledNode, deadline: Optional[float], deadline_s: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return node.timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise RunTimeoutError(f"Run exceeded its deadline of {deadline_s}s before node {node.id}")
+    return remaining if node.timeout is None else min(node.timeout, remaining)
+
+
+async def _timed(node: CompiledNode, limit: Optional[float], call: Callable[[], Awaitable[Any]]) -> Any:
+    """Awaits call() within limit seconds; on expiry the call is cancelled (pending pool work with it)."""
+    if limit is None:
+        return await call()
+    started = time.monotonic()
+    try:
+        return await asyncio.wait_for(call(), limit)
+    except asyncio.TimeoutError:
+        if time.monotonic() - started < limit:
+            raise # raised by the tool itself
+        if node.timeout is not None and limit >= node.timeout:
+            raise RunTimeoutError(f"Node {node.id} timed out after {node.timeout}s") from None
+        raise RunTimeoutError(f"Run exceeded its deadline at node {node.id}") from None
+
+
+def is_executing(run_id: str) -> bool:
+    """Whether run_id is executing in this process (and so publishes its events here)."""
+    return run_id in _executions
+
+
+async def cancel_execution(run_id: str, wait: float = 5.0) -> bool:
+    """Stops run_id if it executes in this process; False if it does not.
+
+    Waits up to `wait` seconds for the run record to say "cancelled".
+    """
+    ctx = _executions.get(run_id)
+    if ctx is None:
+        return False
+    ctx.cancelled = True
+    ctx.abort.set()
+    if ctx.task is not None:
+        ctx.task.cancel() # batch runs have no task of their own; run_batch drops them between rounds
+    try:
+        await asyncio.wait_for(ctx.done.wait(), wait)
+    except asyncio.TimeoutError:
+        pass
+    return True
+
+
+async def cancel_run(run: Dict[str, Any], queue: Optional[JobQueue] = None, wait: float = 5.0) -> str:
+    """Cancels a queued or running run and returns its status afterwards.
+
+    A run executing in this process is stopped (see cancel_execution). One running in a
+    worker process is flagged in the job queue and stopped by that worker; its current
+    status is returned. A run that has not started yet is marked "cancelled" at once.
+    """
+    run_id = run["run_id"]
+    if await cancel_execution(run_id, wait):
+        return get_run(run_id)["status"]
+    if queue is not None and queue.cancel(run_id):
+        return run["status"]
+    update_run(run_id, {"status": "cancelled"})
+    publish(run_id, "status", {"status": "cancelled"})
+    RUNS_TOTAL.inc((run["graph_id"], "cancelled"))
+    if queue is not None:
+        get_store().release(run_id)
+    return "cancelled"
+
+
+def load_previous_run(plan: CompiledGraph, run_id: str) -> Dict[str, Any]:
+    """The record of a completed run of plan's graph, for config previous_run_id.
+
+    Raises ValueError if there is no such run.
+    """
+    run = get_run(run_id)
+    if run is None:
+        raise ValueError(f"Previous run {run_id} not found")
+    if run["graph_id"] != plan.id:
+        raise ValueError(f"Previous run {run_id} is a run of graph {run['graph_id']}, not {plan.id}")
+    if run["status"] != "completed":
+        raise ValueError(f"Previous run {run_id} is {run['status']}, not completed")
+    return run
+
+
+@contextlib.contextmanager
+def _logged_as(logged: bool):
+    """Runs a block with run_logged set, e.g. for one run of a batch (see app.logs)."""
+    token = run_logged.set(logged)
+    try:
+        yield
+    finally:
+        run_logged.reset(token)
+
+
+async def run_batch(plan: CompiledGraph, initial_states: List[Dict[str, Any]],
+                    config: Dict[str, Any] = {}) -> List[Dict[str, Any]]:
+    """Runs many inputs through one compiled graph in lock-step and returns their run records.
+
+    At every round, runs waiting on the same node are executed together: map nodes
+    pool the items of all runs into one bounded-parallel map, and tools with a
+    batch form (ToolRegistry.register_batch_tool) are called once for all runs.
+    Other tools run per input, concurrently. A failure only fails the runs in
+    the group that raised. Graphs with parallel branches are not supported here.
+    A cancelled run leaves the batch when its current group call returns.
+    """
+    if plan.has_branches:
+        raise ValueError(f"Graph {plan.id} has parallel branches; batch runs need a sequential graph")
+    if config.get("previous_run_id"):
+        raise ValueError("previous_run_id is not supported for batch runs")
+    max_iterations = config.get("max_iterations", 100)
+    deadline_s = config.get("deadline_s")
+    deadline = time.monotonic() + deadline_s if deadline_s else None
+    graph_labels = (plan.id,)
+    started = time.perf_counter()
+    engines = [WorkflowEngine(plan) for _ in initial_states]
+    states = [
+        engine._create_run(initial_state, config=config) for engine, initial_state in zip(engines, initial_states)
+    ]
+    cursors: Dict[int, str] = {i: plan.start_node_id for i in range(len(engines))}
+    steps = [0] * len(engines)
+    contexts = [_RunContext(config, None, None) for _ in engines]
+    # Each run is sampled for logs and traces as it would be on its own.
+    logged = [sampled(engine.run_id, log_sample_rate()) for engine in engines]
+    statuses = ["interrupted"] * len(engines) # until a run ends otherwise
+    tracer = get_tracer()
+    for engine, ctx in zip(engines, contexts):
+        _executions[engine.run_id] = ctx
+        ctx.trace = tracer.start_run(engine.run_id, plan.id, config) if tracer else None
+
+    def end(i: int, status: str, error: Optional[Exception] = None):
+        cursors.pop(i, None)
+        statuses[i] = status
+        with _logged_as(logged[i]):
+            if error is not None:
+                engines[i]._fail(error)
+            else:
+                engines[i]._set_status(status)
+
+    def drop_cancelled():
+        for i in [i for i in cursors if contexts[i].cancelled]:
+            end(i, "cancelled")
+            contexts[i].done.set()
+
+    async def run_group(node: CompiledNode, indices: List[int]):
+        start_ts = datetime.utcnow()
+        trace_start = now_us()
+        deltas = []
+        for i in indices:
+            with _logged_as(logged[i]):
+                deltas.append(engines[i]._start_step(node, states[i]))
+        views = [states[i].view() for i in indices]
+        results = None
+        try:
+            # One call serves every run of the group: its logs are kept if any of them is sampled.
+            with _logged_as(any(logged[i] for i in indices)):
+                results = await _timed(node, _time_limit(node, deadline, deadline_s), lambda: node.call_batch(views))
+        except Exception as e:
+            for i in indices:
+                if not contexts[i].cancelled:
+                    end(i, "failed", e)
+            return
+        finally:
+            for j, i in enumerate(indices):
+                if contexts[i].trace:
+                    contexts[i].trace.span(node.action_name, "tool", trace_start, node_id=node.id, policy=node.policy,
+                                           cache_hits=results[j][1] if results else None, map_over=node.map_over,
+                                           batch=len(indices))
+        for i, delta, (result_updates, cache_hits) in zip(indices, deltas, results):
+            if contexts[i].cancelled:
+                continue # dropped by drop_cancelled()
+            try:
+                with _logged_as(logged[i]):
+                    next_ids = engines[i]._finish_step(node, states[i], delta, result_updates, start_ts, cache_hits)
+            except Exception as e:
+                end(i, "failed", e)
+                continue
+            if contexts[i].trace:
+                contexts[i].trace.span(node.id, "node", trace_start, action=node.action_name, iterations=1,
+                                       cache_hits=cache_hits)
+            steps[i] += 1
+            update_run(engines[i].run_id, {"checkpoint": {"next": list(next_ids), "after": node.id}})
+            if next_ids and steps[i] < max_iterations:
+                cursors[i] = next_ids[0]
+            else:
+                end(i, "completed")
+
+    RUNS_IN_FLIGHT.inc(graph_labels, len(engines))
+    try:
+        while True:
+            drop_cancelled()
+            if not cursors:
+                break
+            groups: Dict[str, List[int]] = {}
+            for i, node_id in cursors.items():
+                groups.setdefault(node_id, []).append(i)
+            await asyncio.gather(*(run_group(plan.nodes[node_id], indices) for node_id, indices in groups.items()))
+    finally:
+        for engine, ctx, status in zip(engines, contexts, statuses):
+            _executions.pop(engine.run_id, None)
+            ctx.done.set()
+            if ctx.trace:
+                ctx.trace.finish(status)
+        RUNS_IN_FLIGHT.dec(graph_labels, len(engines))
+        elapsed = time.perf_counter() - started
+        for _ in engines:
+            RUN_DURATION.observe(graph_labels, elapsed)
+
+    return [get_run(engine.run_id) for engine in engines]
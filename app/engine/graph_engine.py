@@ -5,7 +5,6 @@ from enum import Enum
 import logging
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class Node:
@@ -0,0 +1,56 @@
+import asyncio
+import json
+from datetime import date, datetime
+from typing import Any, Dict, List
+
+from app.blobs import BlobRef
+
+# Per-run subscribers for push-based progress. Publishing is a single dict lookup
+# when nobody is listening, so the engine can emit on every step.
+_subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+MAX_PENDING_EVENTS = 1000
+
+
+def subscribe(run_id: str) -> asyncio.Queue:
+    queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_PENDING_EVENTS)
+    _subscribers.setdefault(run_id, []).append(queue)
+    return queue
+
+
+def unsubscribe(run_id: str, queue: asyncio.Queue):
+    queues = _subscribers.get(run_id)
+    if not queues:
+        return
+    if queue in queues:
+        queues.remove(queue)
+    if not queues:
+        del _subscribers[run_id]
+
+
+def publish(run_id: str, event: str, data: Dict[str, Any]):
+    queues = _subscribers.get(run_id)
+    if not queues:
+        return
+    message = {"event": event, "run_id": run_id, **data}
+    for queue in queues:
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow consumer: drop what it has not read and tell it to resync from /graph/state.
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"event": "lagged", "run_id": run_id})
+            queue.put_nowait(message)
+
+
+def _json_default(value: Any) -> Any:
+    # Large values travel as blob handles; clients fetch the text from /graph/state if needed.
+    if isinstance(value, BlobRef):
+        return value.to_json()
+    # ISO 8601, as the JSON API (app.responses) renders timestamps.
+    return value.isoformat() if isinstance(value, (datetime, date)) else str(value)
+
+
+def format_sse(message: Dict[str, Any]) -> str:
+    return f"event: {message['event']}\ndata: {json.dumps(message, default=_json_default)}\n\n"
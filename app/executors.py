@@ -0,0 +1,232 @@
+import asyncio
+import atexit
+import contextvars
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, Any, Iterable, List, Optional, Tuple, Union
+
+from app.blobs import BlobStore, configure_blob_store, get_blob_store
+from app.cache import ItemCache, MISSING
+
+# Execution policies a tool can be registered with.
+INLINE = "inline"    # called directly on the event loop (cheap tools)
+THREAD = "thread"    # blocking / I/O-bound tools, run in a shared thread pool
+PROCESS = "process"  # CPU-bound tools, run in a process pool across cores
+POLICIES = (INLINE, THREAD, PROCESS)
+PROCESS_MAX_MAPS = 16 # blobs each pool process keeps memory-mapped
+
+_pool_config: Dict[str, Any] = {
+    "thread_workers": int(os.environ.get("WORKFLOW_THREAD_POOL_SIZE", 0)) or None,
+    "process_workers": int(os.environ.get("WORKFLOW_PROCESS_POOL_SIZE", 0)) or None,
+    "process_start_method": os.environ.get("WORKFLOW_PROCESS_START_METHOD", "spawn"),
+}
+# Set by the engine for the tools of one run; see abort_requested().
+abort_event: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar(
+    "workflow_abort_event", default=None
+)
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def configure_pools(thread_workers: Optional[int] = None, process_workers: Optional[int] = None,
+                    process_start_method: Optional[str] = None):
+    """Sets pool sizes; running pools are shut down and recreated lazily with the new sizes."""
+    if thread_workers is not None:
+        _pool_config["thread_workers"] = thread_workers
+    if process_workers is not None:
+        _pool_config["process_workers"] = process_workers
+    if process_start_method is not None:
+        _pool_config["process_start_method"] = process_start_method
+    shutdown_pools(wait=False)
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=_pool_config["thread_workers"], thread_name_prefix="workflow-tool"
+        )
+    return _thread_pool
+
+
+def _init_process(blob_dir: str):
+    # Tools in pool processes resolve blob handles from the parent's blob directory. Only
+    # the parent sweeps blobs, so these keep a few mapped rather than every blob ever read.
+    configure_blob_store(BlobStore(blob_dir, max_maps=PROCESS_MAX_MAPS))
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=_pool_config["process_workers"],
+            mp_context=multiprocessing.get_context(_pool_config["process_start_method"]),
+            initializer=_init_process,
+            initargs=(get_blob_store().directory,),
+        )
+    return _process_pool
+
+
+def get_pool(policy: str) -> Optional[Executor]:
+    if policy == THREAD:
+        return get_thread_pool()
+    if policy == PROCESS:
+        return get_process_pool()
+    return None
+
+
+def shutdown_pools(wait: bool = True):
+    global _thread_pool, _process_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=wait, cancel_futures=True)
+        _thread_pool = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=wait, cancel_futures=True)
+        _process_pool = None
+
+
+atexit.register(shutdown_pools)
+
+
+def abort_requested() -> bool:
+    """True once the run calling this tool was cancelled, timed out or failed.
+
+    Long inline or thread-pool tools can poll it and return early: their result is
+    discarded anyway. Process-pool calls cannot see it; queued ones are cancelled and
+    running ones finish in the background.
+    """
+    event = abort_event.get()
+    return event is not None and event.is_set()
+
+
+def _in_thread(func: Callable, *args: Any) -> Tuple[Callable, ...]:
+    # Thread-pool calls keep the caller's context, so tools there see abort_requested().
+    return (contextvars.copy_context().run, func, *args)
+
+
+def process_payload(state: Dict[str, Any], reads: Optional[Tuple[str, ...]]) -> Dict[str, Any]:
+    """Builds the dict pickled to a worker process: only the keys the tool reads, when declared."""
+    if reads is None:
+        return dict(state)
+    payload = {key: state[key] for key in reads if key in state}
+    for key in ("_node_config", "_previous"):
+        if key in state:
+            payload[key] = state[key]
+    return payload
+
+
+async def run_tool(func: Callable, policy: str, state: Dict[str, Any],
+                   reads: Optional[Tuple[str, ...]] = None) -> Any:
+    """Calls a synchronous tool according to its execution policy."""
+    if policy == INLINE:
+        return func(state)
+    loop = asyncio.get_running_loop()
+    if policy == THREAD:
+        return await loop.run_in_executor(get_thread_pool(), *_in_thread(func, state))
+    if policy == PROCESS:
+        return await loop.run_in_executor(get_process_pool(), func, process_payload(state, reads))
+    raise ValueError(f"Unknown execution policy '{policy}'")
+
+
+async def run_batch_tool(func: Callable, policy: str, states: List[Dict[str, Any]],
+                         reads: Optional[Tuple[str, ...]] = None) -> List[Any]:
+    """Calls a tool's batch form (list of states -> list of updates) in one dispatch."""
+    if policy == INLINE:
+        return func(states)
+    loop = asyncio.get_running_loop()
+    if policy == THREAD:
+        return await loop.run_in_executor(get_thread_pool(), *_in_thread(func, list(states)))
+    if policy == PROCESS:
+        payloads = [process_payload(state, reads) for state in states]
+        return await loop.run_in_executor(get_process_pool(), func, payloads)
+    raise ValueError(f"Unknown execution policy '{policy}'")
+
+
+def call_batch(func: Callable, payloads: List[Dict[str, Any]]) -> List[Any]:
+    """Runs a tool over several payloads in one dispatch (module-level so it pickles)."""
+    results = []
+    for payload in payloads:
+        if abort_requested():
+            raise RuntimeError("Run aborted")
+        results.append(func(payload))
+    return results
+
+
+async def _iter_batches(items: Union[Iterable[Any], AsyncIterable[Any]], batch_size: int,
+                        node_config: Dict[str, Any]) -> AsyncIterator[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    index = 0
+
+    def payload(item: Any) -> Dict[str, Any]:
+        return {"item": item, "index": index, "_node_config": node_config}
+
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            batch.append(payload(item))
+            index += 1
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    else:
+        for item in items:
+            batch.append(payload(item))
+            index += 1
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+async def run_map(func: Callable, policy: str, is_async: bool,
+                  items: Union[Iterable[Any], AsyncIterable[Any]], node_config: Dict[str, Any],
+                  max_concurrency: int = 8, batch_size: int = 1, item_cache: Optional[ItemCache] = None) -> List[Any]:
+    """Applies a per-item tool to every item with bounded parallelism, preserving order.
+
+    The tool receives {"item", "index", "_node_config"} and returns the item's result.
+    items may be an async iterable (e.g. a streamed upload): the next batch is only
+    pulled once a slot frees up, so at most max_concurrency batches are held at once.
+    With item_cache, items seen before are answered from the cache and not dispatched.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    loop = asyncio.get_running_loop()
+    tasks: List[asyncio.Future] = []
+
+    async def dispatch(batch: List[Dict[str, Any]]) -> List[Any]:
+        if is_async:
+            return [await func(payload) for payload in batch]
+        pool = get_pool(policy)
+        if pool is None:
+            return call_batch(func, batch)
+        if policy == THREAD:
+            return await loop.run_in_executor(pool, *_in_thread(call_batch, func, batch))
+        return await loop.run_in_executor(pool, call_batch, func, batch)
+
+    async def run_batch(batch: List[Dict[str, Any]]) -> List[Any]:
+        try:
+            if item_cache is None:
+                return await dispatch(batch)
+            keys = [item_cache.key(payload["item"]) for payload in batch]
+            results = item_cache.lookup_many(keys, [payload["index"] for payload in batch])
+            todo = [i for i, result in enumerate(results) if result is MISSING]
+            if todo:
+                computed = await dispatch([batch[i] for i in todo])
+                for i, value in zip(todo, computed):
+                    results[i] = value
+                item_cache.store_many([(keys[i], results[i]) for i in todo])
+            return results
+        finally:
+            semaphore.release()
+
+    try:
+        async for batch in _iter_batches(items, max(1, batch_size), node_config):
+            await semaphore.acquire()
+            tasks.append(asyncio.ensure_future(run_batch(batch)))
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return [result for batch_results in results for result in batch_results]
@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from app.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+# Job kinds
+RUN = "run" # execute a queued run record from its start node
+RESUME = "resume" # continue a run from its checkpoint (payload: state_patch, start_node_id, config)
+
+
+class JobQueue(ABC):
+    """Queue of run jobs shared between the API tier and worker processes (python -m app.worker)."""
+
+    @abstractmethod
+    def enqueue(self, run_id: str, kind: str = RUN, payload: Optional[Dict[str, Any]] = None,
+                priority: int = 0) -> str:
+        ...
+
+    @abstractmethod
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically takes the next job (highest priority, then oldest), or returns None."""
+
+    @abstractmethod
+    def heartbeat(self, job_ids: List[str]) -> List[str]:
+        """Marks claimed jobs as alive; returns those among them whose run was cancelled."""
+
+    @abstractmethod
+    def cancel(self, run_id: str) -> bool:
+        """Drops queued jobs of a run and flags claimed ones; True if a worker is running it."""
+
+    @abstractmethod
+    def complete(self, job_id: str):
+        ...
+
+    @abstractmethod
+    def requeue_stale(self, stale_after: float) -> int:
+        """Puts back jobs whose worker stopped heartbeating; returns how many."""
+
+    @abstractmethod
+    def depth(self) -> int:
+        ...
+
+    def close(self):
+        pass
+
+
+class SqliteJobQueue(JobQueue):
+    """Job queue in a SQLite (WAL) table; any number of processes on one host can share the file.
+
+    It may live in the same database file as SqliteRunStore.
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id TEXT NOT NULL UNIQUE,
+        run_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        priority INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        worker_id TEXT,
+        enqueued_at REAL NOT NULL,
+        heartbeat_at REAL,
+        cancel_requested INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS jobs_next ON jobs (status, priority DESC, seq);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self._SCHEMA)
+        try:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass # created with the column, or already migrated
+
+    def enqueue(self, run_id: str, kind: str = RUN, payload: Optional[Dict[str, Any]] = None,
+                priority: int = 0) -> str:
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, run_id, kind, payload, priority, status, enqueued_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                (job_id, run_id, kind, json.dumps(payload or {}, default=str), priority, time.time())
+            )
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two workers can't claim the same row.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT job_id, run_id, kind, payload, priority, cancel_requested FROM jobs WHERE status = 'queued' "
+                    "ORDER BY priority DESC, seq LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'claimed', worker_id = ?, heartbeat_at = ? WHERE job_id = ?",
+                        (worker_id, time.time(), row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job_id, run_id, kind, payload, priority, cancelled = row
+        # cancelled: requeued from a dead worker after its run was cancelled
+        return {"job_id": job_id, "run_id": run_id, "kind": kind, "payload": json.loads(payload),
+                "priority": priority, "cancelled": bool(cancelled)}
+
+    def heartbeat(self, job_ids: List[str]) -> List[str]:
+        if not job_ids:
+            return []
+        now = time.time()
+        placeholders = ",".join("?" * len(job_ids))
+        with self._lock:
+            self._conn.executemany("UPDATE jobs SET heartbeat_at = ? WHERE job_id = ?",
+                                   [(now, job_id) for job_id in job_ids])
+            rows = self._conn.execute(
+                f"SELECT job_id FROM jobs WHERE cancel_requested = 1 AND job_id IN ({placeholders})", job_ids
+            ).fetchall()
+        return [job_id for (job_id,) in rows]
+
+    def cancel(self, run_id: str) -> bool:
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE run_id = ? AND status = 'queued'", (run_id,))
+            cursor = self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE run_id = ? AND status = 'claimed'", (run_id,)
+            )
+        return cursor.rowcount > 0
+
+    def complete(self, job_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def requeue_stale(self, stale_after: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL WHERE status = 'claimed' AND heartbeat_at < ?",
+                (time.time() - stale_after,)
+            )
+        if cursor.rowcount:
+            logger.warning(f"Requeued {cursor.rowcount} job(s) from unresponsive workers")
+        return cursor.rowcount
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_job_queue_from_env() -> Optional[JobQueue]:
+    """WORKFLOW_JOB_QUEUE="sqlite:///path/to/jobs.db" sends async runs to worker processes.
+
+    Unset (the default): async runs execute in the API process.
+    """
+    url = os.environ.get("WORKFLOW_JOB_QUEUE")
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SqliteJobQueue(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported WORKFLOW_JOB_QUEUE '{url}'")
+
+
+_job_queue: Optional[JobQueue] = create_job_queue_from_env()
+
+
+def get_job_queue() -> Optional[JobQueue]:
+    return _job_queue
+
+
+def configure_job_queue(queue: Optional[JobQueue]):
+    global _job_queue
+    _job_queue = queue
+
+
+def _collect_metrics():
+    if _job_queue is not None:
+        yield "workflow_job_queue_depth", "gauge", "Jobs waiting for a worker process.", {}, _job_queue.depth()
+
+
+register_collector(_collect_metrics)
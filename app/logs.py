@@ -0,0 +1,61 @@
+import atexit
+import contextvars
+import logging
+import os
+import queue
+import zlib
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# Records are handed to a background thread through a queue, so a log call on the
+# event loop never waits for a stream or file. Runs are sampled (WORKFLOW_LOG_SAMPLE,
+# a fraction of runs, default all): INFO and DEBUG records of unsampled runs are
+# dropped before they are queued. Warnings and errors are always kept.
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# False while an unsampled run executes; set by the engine for the tasks of one run.
+run_logged: contextvars.ContextVar[bool] = contextvars.ContextVar("workflow_run_logged", default=True)
+
+_listener: Optional[QueueListener] = None
+
+
+def sampled(run_id: str, rate: float) -> bool:
+    """Whether run_id falls in the sampled fraction `rate`; the same in every process."""
+    if rate >= 1.0:
+        return True
+    if rate <= 0.0:
+        return False
+    return zlib.crc32(run_id.encode()) / 0xFFFFFFFF < rate
+
+
+def log_sample_rate() -> float:
+    return float(os.environ.get("WORKFLOW_LOG_SAMPLE", 1.0))
+
+
+class RunSampleFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or run_logged.get()
+
+
+def configure_logging(level: int = logging.INFO, handler: Optional[logging.Handler] = None) -> Optional[QueueListener]:
+    """Routes the root logger through a queue to `handler` (default: stderr) on a listener thread.
+
+    Like logging.basicConfig, does nothing if the root logger already has handlers.
+    """
+    global _listener
+    root = logging.getLogger()
+    if root.handlers:
+        return _listener
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = QueueHandler(records)
+    queue_handler.addFilter(RunSampleFilter())
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    _listener = QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop) # drains what is still queued
+    return _listener
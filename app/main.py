@@ -1,12 +1,53 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from typing import Dict, Any, Optional
+from contextlib import asynccontextmanager
+import json
+import asyncio
+import time
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from typing import Dict, Any, List, Optional
 
-from app.models.api_models import GraphDefinition, WorkflowRunRequest, WorkflowRunResponse
-from app.engine import WorkflowEngine
-from app.run_store import save_graph, get_graph, get_run
-from app.workflows.summarization_workflow import create_summarization_workflow
+from app.models.api_models import (
+    GraphDefinition, WorkflowRunRequest, WorkflowRunResponse, WorkflowBatchRunRequest, WorkflowBatchRunResponse,
+    WorkflowResumeRequest, RunProfileResponse
+)
+from app.engine import WorkflowEngine, cancel_run, is_executing, load_previous_run, run_batch
+from app.compiler import CompiledGraph, GraphCompilationError
+from app.run_store import (
+    save_graph, get_graph, get_plan, get_run, get_log_since, get_store, mark_interrupted_runs, TERMINAL_STATUSES,
+    ACTIVE_STATUSES
+)
+from app.events import subscribe, unsubscribe, format_sse
+from app.metrics import SNAPSHOT_SECONDS, render_metrics
+from app.responses import RUN_FIELDS, FastJSONResponse, run_content
+from app.blobs import resolve_refs
+from app.cache import get_cache
+from app.executors import shutdown_pools
+from app.profiling import parse_profile_option
+from app.chunking import aiter_sentence_chunks
+from app.scheduler import QueueFullError, get_scheduler, retry_after_header
+from app.job_queue import get_job_queue
+from app.logs import configure_logging
+from app.workflows.summarization_workflow import (
+    create_summarization_workflow, create_extractive_summarization_workflow, create_keyword_summarization_workflow
+)
 
-app = FastAPI(title="Workflow Engine V2", description="Async/Sync Graph Engine")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if get_job_queue() is None:
+        mark_interrupted_runs()
+    elif not get_store().shared:
+        raise RuntimeError("WORKFLOW_JOB_QUEUE needs a run store shared with the workers (sqlite:///...)")
+    # With worker processes, stale runs are requeued by the workers' heartbeat checks instead.
+    yield
+    await get_scheduler().stop()
+    get_cache().flush()
+    shutdown_pools()
+    get_store().close()
+
+configure_logging() # INFO logs through a background thread; see app.logs
+
+app = FastAPI(title="Workflow Engine V2", description="Async/Sync Graph Engine", lifespan=lifespan)
 
 @app.get("/")
 async def root():
@@ -18,51 +59,316 @@ async def root():
 # Pre-load example workflow
 sum_workflow = create_summarization_workflow()
 save_graph(sum_workflow)
+save_graph(create_extractive_summarization_workflow())
+save_graph(create_keyword_summarization_workflow())
+
+def _run_response(run_id: str, run_data: Dict[str, Any], **projection) -> FastJSONResponse:
+    # The store keeps per-node deltas; snapshots are rebuilt only for the entries returned.
+    # Everything here was produced by the engine, so it is encoded without model validation.
+    started = time.perf_counter()
+    content = run_content(run_id, run_data, **projection)
+    SNAPSHOT_SECONDS.inc((), time.perf_counter() - started)
+    return FastJSONResponse(content)
+
+def _check_config(plan: CompiledGraph, config: Dict[str, Any]):
+    """Rejects run config options with 400 up front, before a run record is touched."""
+    try:
+        parse_profile_option(config.get("profile"))
+        if config.get("previous_run_id"):
+            load_previous_run(plan, config["previous_run_id"])
+        deadline_s = config.get("deadline_s")
+        if deadline_s is not None and (isinstance(deadline_s, bool) or not isinstance(deadline_s, (int, float))
+                                       or deadline_s <= 0):
+            raise ValueError(f"Invalid deadline_s {deadline_s!r}, expected a positive number")
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _split(value: Optional[str]) -> Optional[List[str]]:
+    return None if value is None else [part.strip() for part in value.split(",") if part.strip()]
 
 @app.post("/graph/create", response_model=Dict[str, str])
 async def create_graph(definition: GraphDefinition):
-    if get_graph(definition.id):
-        raise HTTPException(status_code=400, detail=f"Graph {definition.id} already exists.")
-    save_graph(definition)
-    return {"graph_id": definition.id}
+    if get_graph(definition.id, definition.version):
+        raise HTTPException(status_code=400, detail=f"Graph {definition.id} v{definition.version} already exists.")
+    try:
+        save_graph(definition)
+    except GraphCompilationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"graph_id": definition.id, "version": str(definition.version)}
 
 @app.post("/graph/run", response_model=WorkflowRunResponse)
 async def run_graph(request: WorkflowRunRequest):
-    graph_def = get_graph(request.graph_id)
-    if not graph_def:
+    plan = get_plan(request.graph_id, request.graph_version)
+    if not plan:
         raise HTTPException(status_code=404, detail=f"Graph {request.graph_id} not found.")
+    _check_config(plan, request.config)
 
-    engine = WorkflowEngine(graph_def)
+    engine = WorkflowEngine(plan)
     
     if request.run_mode == "async":
-        run_id = await engine.run_async(request.initial_state, request.config)
-        return WorkflowRunResponse(run_id=run_id, status="running")
+        queue = get_job_queue()
+        try:
+            if queue is not None:
+                run_id = engine.run_remote(queue, request.initial_state, request.config)
+            else:
+                run_id = await engine.run_async(request.initial_state, request.config)
+        except QueueFullError as e:
+            raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+        return WorkflowRunResponse(run_id=run_id, status="queued")
     elif request.run_mode == "sync":
         run_data = await engine.run_sync(request.initial_state, request.config)
-        return WorkflowRunResponse(
-            run_id=run_data["run_id"],
-            status=run_data["status"],
-            state=run_data.get("state"),
-            execution_log=run_data.get("execution_log"),
-            error=run_data.get("error")
-        )
+        return _run_response(run_data["run_id"], run_data)
     else:
         raise HTTPException(status_code=400, detail="Invalid run_mode. Use 'async' or 'sync'.")
 
+@app.post("/graph/resume/{run_id}", response_model=WorkflowRunResponse)
+async def resume_run(run_id: str, request: WorkflowResumeRequest):
+    """Continues a failed or interrupted run from its last checkpoint, keeping its run id.
+
+    state_patch is applied to the checkpointed state first; start_node_id overrides
+    where execution continues (it also allows re-running part of a completed run).
+    """
+    run_data = get_run(run_id)
+    if not run_data:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found.")
+    if run_data["status"] in ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Run {run_id} is still {run_data['status']}.")
+    if request.run_mode not in ("async", "sync"):
+        raise HTTPException(status_code=400, detail="Invalid run_mode. Use 'async' or 'sync'.")
+    plan = get_plan(run_data["graph_id"], run_data.get("graph_version"))
+    if not plan:
+        raise HTTPException(status_code=409, detail=f"Graph {run_data['graph_id']} of run {run_id} is not loaded.")
+    _check_config(plan, {**run_data.get("config", {}), **request.config})
+
+    engine = WorkflowEngine(plan, run_id=run_id)
+    try:
+        result = await engine.resume(
+            run_data, request.state_patch, request.start_node_id, request.config, request.run_mode, get_job_queue()
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+    if request.run_mode == "async":
+        return WorkflowRunResponse(run_id=run_id, status="queued")
+    return _run_response(run_id, result)
+
+@app.delete("/graph/run/{run_id}", response_model=WorkflowRunResponse)
+async def cancel_workflow_run(run_id: str, response: Response):
+    """Cancels a queued or running run.
+
+    Returns 200 once the run is "cancelled". A run executing in a worker process is
+    stopped by that worker shortly after; until then 202 and its current status are returned.
+    """
+    run_data = get_run(run_id)
+    if not run_data:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found.")
+    if run_data["status"] not in ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Run {run_id} is already {run_data['status']}.")
+    status = await cancel_run(run_data, get_job_queue())
+    if status != "cancelled":
+        response.status_code = 202
+    return WorkflowRunResponse(run_id=run_id, status=status)
+
+@app.post("/graph/run/batch", response_model=WorkflowBatchRunResponse)
+async def run_graph_batch(request: WorkflowBatchRunRequest):
+    """Runs every initial_state through one compiled graph, sharing setup and batching tool calls."""
+    plan = get_plan(request.graph_id, request.graph_version)
+    if not plan:
+        raise HTTPException(status_code=404, detail=f"Graph {request.graph_id} not found.")
+    _check_config(plan, request.config)
+
+    # Admitted like /graph/run/async, as one job weighing as many runs as it has inputs.
+    result = asyncio.get_running_loop().create_future()
+
+    async def execute():
+        try:
+            result.set_result(await run_batch(plan, request.initial_states, request.config))
+        except Exception as e:
+            result.set_exception(e)
+        finally:
+            if not result.done():
+                result.cancel() # the scheduler is stopping
+
+    try:
+        get_scheduler().submit(plan.id, execute, weight=len(request.initial_states))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+    try:
+        runs = await result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return WorkflowBatchRunResponse(
+        graph_id=plan.id,
+        runs=[
+            WorkflowRunResponse(
+                run_id=run["run_id"],
+                status=run["status"],
+                state=resolve_refs(run.get("state")) if request.include_state else None,
+                error=run.get("error")
+            )
+            for run in runs
+        ]
+    )
+
+@app.post("/graph/run/stream", response_model=WorkflowRunResponse)
+async def run_graph_stream(
+    request: Request,
+    graph_id: str,
+    graph_version: Optional[int] = None,
+    items_key: str = "chunks",
+    max_chunk_chars: int = 1000,
+    initial_state: Optional[str] = None,
+    max_iterations: int = 100
+):
+    """Runs a graph over a document streamed as the raw (optionally chunked) request body.
+
+    The body is split on sentence boundaries as it arrives and fed straight into the
+    graph's map node over items_key, so the full text is never held in memory.
+    initial_state is an optional JSON object merged into the run's state.
+    """
+    plan = get_plan(graph_id, graph_version)
+    if not plan:
+        raise HTTPException(status_code=404, detail=f"Graph {graph_id} not found.")
+    if not plan.map_node_for(items_key):
+        raise HTTPException(status_code=400, detail=f"Graph {graph_id} has no map node over '{items_key}'.")
+    if max_chunk_chars < 1:
+        raise HTTPException(status_code=400, detail="max_chunk_chars must be positive.")
+    try:
+        state = json.loads(initial_state) if initial_state else {}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="initial_state must be a JSON object.")
+    if not isinstance(state, dict):
+        raise HTTPException(status_code=400, detail="initial_state must be a JSON object.")
+
+    engine = WorkflowEngine(plan)
+    chunks = aiter_sentence_chunks(request.stream(), max_chunk_chars)
+    run_data = await engine.run_stream(chunks, state, {"max_iterations": max_iterations}, items_key)
+    return _run_response(run_data["run_id"], run_data)
+
 @app.get("/graph/state/{run_id}", response_model=WorkflowRunResponse)
-async def get_run_state(run_id: str):
+async def get_run_state(
+    run_id: str,
+    fields: Optional[str] = Query(None, description="Comma-separated subset of status,state,execution_log,error"),
+    state_keys: Optional[str] = Query(None, description="Comma-separated state keys to return (state and snapshots)"),
+    snapshots: bool = Query(True, description="Include a state_snapshot in each log entry"),
+    log_offset: int = Query(0, ge=0),
+    log_limit: Optional[int] = Query(None, ge=0)
+):
+    """A run's status, state and execution log, optionally projected.
+
+    Polling clients can ask for fields=status only; large runs can page through the
+    log (log_total gives its length) and skip snapshot reconstruction entirely.
+    """
     run_data = get_run(run_id)
     if not run_data:
         raise HTTPException(status_code=404, detail=f"Run {run_id} not found.")
-    
-    return WorkflowRunResponse(
-        run_id=run_id,
-        status=run_data["status"],
-        state=run_data.get("state"),
-        execution_log=run_data.get("execution_log"),
-        error=run_data.get("error")
+    selected = _split(fields) or list(RUN_FIELDS)
+    unknown = set(selected) - set(RUN_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}.")
+
+    return _run_response(
+        run_id, run_data, fields=selected, state_keys=_split(state_keys), snapshots=snapshots,
+        log_offset=log_offset, log_limit=log_limit
     )
 
+@app.get("/graph/profile/{run_id}", response_model=RunProfileResponse)
+async def get_run_profile(run_id: str):
+    """Per-node cProfile stats and allocation sites of a run started with config.profile."""
+    run_data = get_run(run_id)
+    if not run_data:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found.")
+    profile = run_data.get("profile")
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No profile for run {run_id}: not profiled or not finished.")
+    return RunProfileResponse(run_id=run_id, status=run_data["status"], **profile)
+
+def _snapshot_event(run_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "event": "snapshot",
+        "run_id": run_data["run_id"],
+        "status": run_data["status"],
+        "state": run_data.get("state"),
+        "steps": len(run_data.get("execution_log", [])),
+        "error": run_data.get("error")
+    }
+
+MIN_POLL_SECONDS = 0.05 # floor for /graph/stream's poll_seconds, so polling never spins the event loop
+
+async def _poll_run_events(run_data: Dict[str, Any], keepalive_seconds: float, poll_seconds: float):
+    run_id = run_data["run_id"]
+    yield format_sse(_snapshot_event(run_data))
+    seen, status = len(run_data.get("execution_log", [])), run_data["status"]
+    quiet_since = time.monotonic()
+    while status not in TERMINAL_STATUSES:
+        await asyncio.sleep(poll_seconds)
+        # Only the status and the new log rows, read off the event loop.
+        progress = await run_in_threadpool(get_log_since, run_id, seen)
+        if progress is None:
+            return # evicted
+        for entry in progress["log"]:
+            yield format_sse({"event": "node_end", "run_id": run_id, **entry})
+        if progress["status"] != status:
+            message = {"event": "status", "run_id": run_id, "status": progress["status"]}
+            if progress["error"]:
+                message["error"] = progress["error"]
+            yield format_sse(message)
+        if progress["log"] or progress["status"] != status:
+            quiet_since = time.monotonic()
+        elif time.monotonic() - quiet_since >= keepalive_seconds:
+            yield ": keepalive\n\n"
+            quiet_since = time.monotonic()
+        seen, status = seen + len(progress["log"]), progress["status"]
+
+@app.get("/graph/stream/{run_id}")
+async def stream_run_events(run_id: str, keepalive_seconds: float = Query(15.0, gt=0),
+                            poll_seconds: float = Query(0.5, gt=MIN_POLL_SECONDS)):
+    """Server-sent events for a run: a snapshot, then node_start/node_end (with state deltas)
+    and status events as the run progresses, ending after a terminal status.
+
+    Runs executing in a worker process publish nothing here; their node_end and status
+    events are read from the shared run store every poll_seconds instead.
+    """
+    run_data = get_run(run_id)
+    if not run_data:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found.")
+    if get_job_queue() is not None and not is_executing(run_id):
+        return StreamingResponse(_poll_run_events(run_data, keepalive_seconds, poll_seconds),
+                                 media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+    # Subscribe before taking the snapshot so no event falls between the two.
+    queue = subscribe(run_id)
+    snapshot = _snapshot_event(run_data)
+
+    async def events():
+        try:
+            yield format_sse(snapshot)
+            if snapshot["status"] in TERMINAL_STATUSES:
+                return
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(message)
+                if message["event"] == "status" and message["status"] in TERMINAL_STATUSES:
+                    return
+        finally:
+            unsubscribe(run_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of engine, queue, cache and store metrics."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/graph/queue")
+async def get_queue_stats():
+    """Queue depth, wait times and worker utilisation of the background run scheduler."""
+    return get_scheduler().stats()
+
 @app.get("/graph/{graph_id}", response_model=GraphDefinition)
 async def get_graph_def(graph_id: str):
     graph = get_graph(graph_id)
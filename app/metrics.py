@@ -0,0 +1,158 @@
+import bisect
+import math
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Minimal Prometheus-style metrics. Updates are plain dict/list operations done
+# from the event loop: no locks on the hot path. Scrape-time values (queue depth,
+# cache size, ...) come from collector callbacks instead of being pushed.
+
+LabelValues = Tuple[str, ...]
+
+_registry: List["_Metric"] = []
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric(ABC):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        ...
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, labels: LabelValues = (), amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def get(self, labels: LabelValues = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in list(self._values.items())]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, labels: LabelValues, value: float):
+        self._values[labels] = value
+
+    def dec(self, labels: LabelValues = (), amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) - amount
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, labels: LabelValues, value: float):
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, labels: LabelValues = ()) -> int:
+        series = self._values.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for labels, series in list(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), series[:-1]):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]):
+    """Adds a scrape-time callback yielding (name, type, help, labels, value) samples."""
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    described = set()
+    for collector in _collectors:
+        for name, type_name, documentation, labels, value in collector():
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {type_name}")
+            lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(float(value))}")
+    return "\n".join(lines) + "\n"
+
+
+NODE_DURATION = Histogram(
+    "workflow_node_duration_seconds", "Wall-clock time of one node step (all fused iterations).",
+    ("graph", "node")
+)
+RUN_DURATION = Histogram("workflow_run_duration_seconds", "Wall-clock time of a run's execution.", ("graph",))
+RUNS_TOTAL = Counter("workflow_runs_total", "Runs that reached a terminal status.", ("graph", "status"))
+RUNS_IN_FLIGHT = Gauge("workflow_runs_in_flight", "Runs currently executing.", ("graph",))
+STATE_BYTES = Gauge(
+    "workflow_state_bytes", "Estimated size of the run state after the node's last execution.",
+    ("graph", "node")
+)
+STATE_APPLY_SECONDS = Counter(
+    "workflow_state_apply_seconds_total", "Time spent applying node updates to the copy-on-write state.",
+    ("graph",)
+)
+SNAPSHOT_SECONDS = Counter(
+    "workflow_snapshot_rebuild_seconds_total", "Time spent rebuilding state snapshots for responses."
+)
+STORE_SECONDS = Counter("workflow_store_seconds_total", "Time spent in run store calls.", ("operation",))
+STORE_CALLS = Counter("workflow_store_calls_total", "Run store calls.", ("operation",))
@@ -5,35 +5,83 @@ from datetime import datetime
 class NodeDefinition(BaseModel):
     id: str
     action_name: str
-    config: Dict[str, Any] = {}
+    type: str = "task" # "task", "map" or "join"
+    config: Dict[str, Any] = {} # passed to the tool; "timeout_s" limits each call of it
+    # Map nodes apply action_name to every element of state[map_over]
+    # and store the results, in order, under state[output_key].
+    map_over: Optional[str] = None
+    output_key: Optional[str] = None
+    max_concurrency: int = 8
+    batch_size: int = 1 # items sent to the tool's pool per dispatch
+    # Join nodes: how branch changes to a state key are combined ("last", "first",
+    # "list", "extend", "update" or "error"); "*" sets the default (otherwise "last").
+    merge: Dict[str, str] = {}
 
 class EdgeDefinition(BaseModel):
     source_id: str
     target_id: str
     condition_name: Optional[str] = None
     loop: bool = False
+    # Every matching parallel edge of a node starts a concurrent branch; branches
+    # stop at the next join node, which merges their state changes.
+    parallel: bool = False
 
 class GraphDefinition(BaseModel):
     id: str
+    version: int = 1
     start_node_id: str
     nodes: List[NodeDefinition]
     edges: List[EdgeDefinition]
 
 class WorkflowRunRequest(BaseModel):
     graph_id: str
+    graph_version: Optional[int] = None # latest version if omitted
     initial_state: Dict[str, Any] = {}
     run_mode: str = "async" # "async" or "sync"
+    config: Dict[str, Any] = {} # e.g. max_iterations, priority, deadline_s, profile ("cpu", "memory" or both), previous_run_id
+
+class WorkflowResumeRequest(BaseModel):
+    state_patch: Dict[str, Any] = {} # merged into the checkpointed state before resuming
+    start_node_id: Optional[str] = None # default: the node(s) after the last checkpoint
+    run_mode: str = "async"
+    config: Dict[str, Any] = {} # merged over the run's original config
+
+MAX_BATCH_SIZE = 100 # inputs per /graph/run/batch request; each counts as a run in the run queue
+
+class WorkflowBatchRunRequest(BaseModel):
+    graph_id: str
+    graph_version: Optional[int] = None
+    initial_states: List[Dict[str, Any]] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
     config: Dict[str, Any] = {}
+    include_state: bool = True
 
 class ExecutionLogEntry(BaseModel):
     node_id: str
     start_ts: datetime
     end_ts: datetime
-    state_snapshot: Dict[str, Any]
+    delta: Dict[str, Any] = {} # keys changed by this node
+    cache_hits: int = 0 # results served from the node cache or previous_run_id (items, for map nodes)
+    iterations: int = 1 # >1 when a self-loop was run as one fused step
+    branch: Optional[str] = None # e.g. "1" or "0.2" for nodes run inside parallel branches
+    state_snapshot: Optional[Dict[str, Any]] = None
 
 class WorkflowRunResponse(BaseModel):
     run_id: str
-    status: str # 'running', 'completed', 'failed'
+    status: str # 'queued', 'running', 'completed', 'failed', 'cancelled', 'interrupted'
     state: Optional[Dict[str, Any]] = None
     execution_log: Optional[List[ExecutionLogEntry]] = None
+    log_total: Optional[int] = None # entries in the full log when execution_log is a page of it
     error: Optional[str] = None
+
+class WorkflowBatchRunResponse(BaseModel):
+    graph_id: str
+    runs: List[WorkflowRunResponse] # same order as initial_states
+
+class RunProfileResponse(BaseModel):
+    run_id: str
+    status: str
+    modes: List[str]
+    nodes: List[Dict[str, Any]] # per node: visits, wall_s, cpu (top functions), peak_bytes, allocations
+    allocations: Optional[List[Dict[str, Any]]] = None # top allocation sites over the whole run
+    peak_bytes: Optional[int] = None
+    notes: List[str] = []
@@ -0,0 +1,177 @@
+import asyncio
+import cProfile
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+# Opt-in, per-run profiling (config["profile"]). Runs that don't ask for it never
+# construct a profiler, so the engine's only cost is an `if profiler` per step.
+
+CPU = "cpu"
+MEMORY = "memory"
+PROFILE_MODES = (CPU, MEMORY)
+
+DEFAULT_TOP = 20
+
+_TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+# cProfile and tracemalloc are process-wide, so profiled runs take turns: a run
+# waits in start() until the one holding the slot has finished.
+_slot = threading.Lock() # runs may come from several event loops (API, workers)
+_SLOT_POLL_SECONDS = 0.05
+_owns_tracing = False
+_PROCESS_NOTE = ("profiles cover the whole process while a node runs: "
+                 "unprofiled runs in flight at the same time are included")
+
+
+def parse_profile_option(value: Any) -> Tuple[str, ...]:
+    """Normalizes config["profile"]: true, "cpu", "memory" or a list of those."""
+    if not value:
+        return ()
+    if value is True:
+        return PROFILE_MODES
+    modes = (value,) if isinstance(value, str) else tuple(value)
+    unknown = [mode for mode in modes if mode not in PROFILE_MODES]
+    if unknown:
+        raise ValueError(f"Unknown profile mode(s) {unknown}; use {list(PROFILE_MODES)}")
+    return tuple(dict.fromkeys(modes))
+
+
+def _function_label(func: Tuple[str, int, str]) -> str:
+    filename, line, name = func
+    return f"{filename}:{line}({name})" if line else name
+
+
+class RunProfiler:
+    """Collects per-node cProfile stats and tracemalloc allocation sites for one run.
+
+    With cpu profiling, the run's tools execute inline on the event loop thread
+    (whatever their policy) so their frames show up in the profile.
+    """
+
+    def __init__(self, modes: Tuple[str, ...], top: int = DEFAULT_TOP):
+        self.modes = modes
+        self.top = top
+        self.cpu = CPU in modes
+        self.memory = MEMORY in modes
+        self.notes: List[str] = []
+        self._nodes: Dict[str, Dict[str, Any]] = {}
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._current: Optional[str] = None
+        self._node_started = 0.0
+        self._node_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._run_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._holds_slot = False
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["RunProfiler"]:
+        modes = parse_profile_option(config.get("profile"))
+        if not modes:
+            return None
+        return cls(modes, top=int(config.get("profile_top", DEFAULT_TOP)))
+
+    @property
+    def inline(self) -> bool:
+        return self.cpu
+
+    async def start(self):
+        """Waits for any other profiled run to finish, then starts collecting."""
+        global _owns_tracing
+        started = time.perf_counter()
+        while not _slot.acquire(blocking=False):
+            await asyncio.sleep(_SLOT_POLL_SECONDS)
+        self._holds_slot = True
+        waited = time.perf_counter() - started
+        if waited >= _SLOT_POLL_SECONDS:
+            self.notes.append(f"waited {waited:.2f}s for another profiled run to finish")
+        self.notes.append(_PROCESS_NOTE)
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _owns_tracing = True
+            self._run_snapshot = self._snapshot()
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+
+    def start_node(self, node_id: str):
+        self._current = node_id
+        stats = self._nodes.setdefault(node_id, {"node_id": node_id, "visits": 0, "wall_s": 0.0})
+        stats["visits"] += 1
+        if self.memory:
+            self._node_snapshot = self._snapshot()
+            tracemalloc.reset_peak()
+            stats["_memory_before"] = tracemalloc.get_traced_memory()[0]
+        if self.cpu:
+            self._profiles.setdefault(node_id, cProfile.Profile()).enable()
+        self._node_started = time.perf_counter()
+
+    def stop_node(self):
+        node_id = self._current
+        if node_id is None:
+            return
+        elapsed = time.perf_counter() - self._node_started
+        if self.cpu:
+            self._profiles[node_id].disable()
+        stats = self._nodes[node_id]
+        stats["wall_s"] += elapsed
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            stats["peak_bytes"] = max(stats.get("peak_bytes", 0), peak)
+            stats["net_bytes"] = stats.get("net_bytes", 0) + current - stats["_memory_before"]
+            sites = stats.setdefault("_sites", {})
+            for diff in self._snapshot().compare_to(self._node_snapshot, "lineno"):
+                if diff.size_diff:
+                    site = str(diff.traceback[0])
+                    size, count = sites.get(site, (0, 0))
+                    sites[site] = (size + diff.size_diff, count + diff.count_diff)
+            self._node_snapshot = None
+        self._current = None
+
+    def _cpu_stats(self, profile: cProfile.Profile) -> Dict[str, Any]:
+        stats = pstats.Stats(profile)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        return {
+            "total_calls": stats.total_calls,
+            "functions": [
+                {"function": _function_label(func), "calls": nc, "total_s": tt, "cumulative_s": ct}
+                for func, (cc, nc, tt, ct, callers) in rows[:self.top]
+            ],
+        }
+
+    def finish(self) -> Dict[str, Any]:
+        """Stops collection and returns the profile stored on the run record."""
+        global _owns_tracing
+        self.stop_node()
+        result: Dict[str, Any] = {"modes": list(self.modes), "nodes": [], "notes": self.notes}
+        for node_id, stats in self._nodes.items():
+            node = {k: v for k, v in stats.items() if not k.startswith("_")}
+            if self.cpu and node_id in self._profiles:
+                node["cpu"] = self._cpu_stats(self._profiles[node_id])
+            if "_sites" in stats:
+                sites = sorted(stats["_sites"].items(), key=lambda item: abs(item[1][0]), reverse=True)
+                node["allocations"] = [
+                    {"site": site, "size_diff": size, "count_diff": count} for site, (size, count) in sites[:self.top]
+                ]
+            result["nodes"].append(node)
+        if self.memory and self._run_snapshot is not None:
+            diffs = self._snapshot().compare_to(self._run_snapshot, "lineno")
+            result["allocations"] = [
+                {"site": str(diff.traceback[0]), "size_diff": diff.size_diff, "count_diff": diff.count_diff}
+                for diff in diffs[:self.top] if diff.size_diff
+            ]
+            result["peak_bytes"] = max((node.get("peak_bytes", 0) for node in result["nodes"]), default=0)
+            self._run_snapshot = None
+            if _owns_tracing:
+                tracemalloc.stop()
+                _owns_tracing = False
+        if self._holds_slot:
+            self._holds_slot = False
+            _slot.release()
+        return result
@@ -1,14 +1,71 @@
-from typing import Callable, Dict, Any, List
+import asyncio
+import re
+from collections import Counter
+from typing import Callable, Dict, Any, List, Optional, Sequence
+
+from app.executors import INLINE, THREAD, PROCESS, POLICIES
+from app.blobs import BlobRef, resolve
+from app.chunking import resplit_chunks, split_chunks
+from app.tfidf import score_sentences, select_sentences
 
 class ToolRegistry:
     _tools: Dict[str, Callable] = {}
+    _tool_options: Dict[str, Dict[str, Any]] = {}
+    _batch_tools: Dict[str, Callable] = {}
+    _incremental_tools: Dict[str, Callable] = {}
     _conditions: Dict[str, Callable] = {}
 
     @classmethod
-    def register_tool(cls, name: str = None):
+    def register_tool(cls, name: str = None, policy: str = INLINE, reads: Optional[Sequence[str]] = None,
+                      cache: bool = False):
+        """Registers a tool.
+
+        policy selects where a synchronous tool runs (inline, thread or process pool);
+        reads optionally lists the state keys the tool uses, so only those are shipped
+        to a process pool. cache=True memoizes the tool's output keyed by its node config
+        and the values of its reads keys (per item in map nodes); it requires reads and
+        a deterministic tool. Node config "cache" (true/false) overrides it per node.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown execution policy '{policy}', expected one of {POLICIES}")
+        if cache and reads is None:
+            raise ValueError("Cached tools must declare the state keys they read")
+
         def decorator(func: Callable):
             tool_name = name or func.__name__
+            if policy != INLINE and asyncio.iscoroutinefunction(func):
+                raise ValueError(f"Async tool '{tool_name}' must use the '{INLINE}' policy")
             cls._tools[tool_name] = func
+            cls._tool_options[tool_name] = {
+                "policy": policy,
+                "reads": tuple(reads) if reads is not None else None,
+                "cache": cache,
+            }
+            return func
+        return decorator
+
+    @classmethod
+    def register_batch_tool(cls, name: str):
+        """Registers the batch form of tool `name`: a list of states in, a list of updates out.
+
+        It runs under the tool's own execution policy and is used when many runs reach
+        the same node together (see engine.run_batch).
+        """
+        def decorator(func: Callable):
+            cls._batch_tools[name] = func
+            return func
+        return decorator
+
+    @classmethod
+    def register_incremental_tool(cls, name: str):
+        """Registers the incremental form of tool `name`, used by runs with config previous_run_id.
+
+        It receives the usual state plus "_previous", the previous run's final state, and
+        must return what the tool itself would, reusing earlier work where it can. It is
+        synchronous and runs under the tool's own execution policy.
+        """
+        def decorator(func: Callable):
+            cls._incremental_tools[name] = func
             return func
         return decorator
 
@@ -24,21 +81,58 @@ class ToolRegistry:
     def get_tool(cls, name: str) -> Callable:
         return cls._tools.get(name)
 
+    @classmethod
+    def get_tool_options(cls, name: str) -> Dict[str, Any]:
+        return cls._tool_options.get(name, {"policy": INLINE, "reads": None, "cache": False})
+
+    @classmethod
+    def get_batch_tool(cls, name: str) -> Optional[Callable]:
+        return cls._batch_tools.get(name)
+
+    @classmethod
+    def get_incremental_tool(cls, name: str) -> Optional[Callable]:
+        return cls._incremental_tools.get(name)
+
     @classmethod
     def get_condition(cls, name: str) -> Callable:
         return cls._conditions.get(name)
 
 
 
-@ToolRegistry.register_tool()
+# Chunks shorter than this are cheaper to hold as strings than as views of a blob.
+_MIN_VIEW_CHARS = 256
+
+def _chunk_values(text: Any, chunks: List[str], max_chars: int) -> List[Any]:
+    return text.views(chunks) if isinstance(text, BlobRef) and max_chars >= _MIN_VIEW_CHARS else chunks
+
+@ToolRegistry.register_tool(policy=THREAD, reads=["text"])
 def split_text_to_chunks(state: Dict[str, Any]) -> Dict[str, Any]:
     text = state.get("text", "")
-    max_chars = state.get("_node_config", {}).get("max_chunk_chars", 1000)
-    
-    chunks = [text[i:i+max_chars] for i in range(0, len(text), max_chars)]
-    return {"chunks": chunks}
+    node_config = state.get("_node_config", {})
+    max_chars = node_config.get("max_chunk_chars", 1000)
+    # sentence_aware cuts on sentence boundaries so per-chunk heuristics see whole sentences
+    chunks = split_chunks(resolve(text), max_chars, bool(node_config.get("sentence_aware")))
+    # A text in the blob store is split into views of its blob rather than copies of it.
+    return {"chunks": _chunk_values(text, chunks, max_chars)}
 
-@ToolRegistry.register_tool()
+@ToolRegistry.register_incremental_tool("split_text_to_chunks")
+def resplit_text_to_chunks(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Re-splits only the edited or appended parts of text, keeping the previous run's chunks elsewhere."""
+    previous = state["_previous"]
+    previous_text, previous_chunks = resolve(previous.get("text")), previous.get("chunks")
+    if not isinstance(previous_text, str) or not isinstance(previous_chunks, list):
+        return split_text_to_chunks(state) # e.g. a streamed run, which never stored its chunks
+    text = state.get("text", "")
+    node_config = state.get("_node_config", {})
+    max_chars = node_config.get("max_chunk_chars", 1000)
+    chunks, _ = resplit_chunks(
+        previous_text, [resolve(chunk) for chunk in previous_chunks], resolve(text),
+        max_chars, bool(node_config.get("sentence_aware"))
+    )
+    return {"chunks": _chunk_values(text, chunks, max_chars)}
+
+# Inline: a pool round trip costs more than the work (see summarize_text_rule_based).
+@ToolRegistry.register_tool(reads=["chunks"])
 def summarize_chunk_rule_based(state: Dict[str, Any]) -> Dict[str, Any]:
 
     
@@ -46,26 +140,106 @@ def summarize_chunk_rule_based(state: Dict[str, Any]) -> Dict[str, Any]:
     summaries = []
     for chunk in chunks:
         # Simple heuristic: First sentence
-        summary = chunk.split('.')[0] + "."
+        summary = resolve(chunk).split('.')[0] + "."
         summaries.append(summary)
     
     return {"summaries": summaries}
 
-@ToolRegistry.register_tool()
+# Inline: taking a sentence costs far less than pickling the chunk to a pool process.
+@ToolRegistry.register_tool(reads=["item"])
+def summarize_text_rule_based(state: Dict[str, Any]) -> str:
+    """Per-item form of summarize_chunk_rule_based, for use in map nodes."""
+    # Simple heuristic: First sentence
+    return resolve(state["item"]).split('.')[0] + "."
+
+@ToolRegistry.register_tool(policy=PROCESS, reads=["chunks", "max_length"])
+def summarize_chunks_tfidf(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Extractive summary of all chunks at once: the top TF-IDF sentences within a character budget.
+
+    The budget is node config "max_chars" (default: state max_length), so the merged
+    summary already fits and refine_summary has nothing left to trim. Requires numpy.
+    """
+    node_config = state.get("_node_config", {})
+    max_chars = node_config.get("max_chars", state.get("max_length", 100))
+    sentences, scores = score_sentences("".join(resolve(chunk) for chunk in state.get("chunks", [])))
+    return {"summaries": select_sentences(sentences, scores, max_chars)}
+
+@ToolRegistry.register_tool(reads=["summaries"])
 def merge_summaries(state: Dict[str, Any]) -> Dict[str, Any]:
     summaries = state.get("summaries", [])
     merged = " ".join(summaries)
     return {"merged_summary": merged}
 
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+@ToolRegistry.register_tool(policy=THREAD, reads=["text"])
+def extract_keywords(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Most frequent non-stopword words of the text (node config top_k, default 10)."""
+    top_k = state.get("_node_config", {}).get("top_k", 10)
+    counts = Counter(
+        word for word in re.findall(r"[a-z][a-z'-]+", resolve(state.get("text", "")).lower()) if word not in _STOPWORDS
+    )
+    return {"keywords": [word for word, _ in counts.most_common(top_k)]}
+
+@ToolRegistry.register_tool()
+def passthrough(state: Dict[str, Any]) -> Dict[str, Any]:
+    """No-op, e.g. for join nodes that only merge their branches."""
+    return {}
+
+def _refine_single_pass(text: str, max_length: int) -> str:
+    """Same result as the iterative refine loop, without splitting or joining the whole text.
+
+    That loop yields ".".join(real[:-1]) + "." cut to max_length, where real are the
+    non-blank '.'-separated sentences (or text[:max_length] if there are fewer than two).
+    The last real sentence is located from the end, then sentences are emitted from the
+    start only until the running length (a prefix sum) reaches max_length.
+    """
+    end = len(text)
+    while True:
+        dot = text.rfind('.', 0, end)
+        if dot == -1 or text[dot + 1:end].strip():
+            break
+        end = dot
+    if dot == -1:
+        # At most one real sentence
+        return text[:max_length]
+
+    pieces: List[str] = []
+    length = 0
+    start = 0
+    while True:
+        next_dot = text.find('.', start, dot)
+        segment = text[start:dot if next_dot == -1 else next_dot]
+        if segment.strip():
+            if pieces:
+                pieces.append(".")
+                length += 1
+            pieces.append(segment)
+            length += len(segment)
+            if length >= max_length:
+                break
+        if next_dot == -1:
+            break
+        start = next_dot + 1
+
+    if not pieces:
+        return text[:max_length]
+    return ("".join(pieces) + ".")[:max_length]
+
 @ToolRegistry.register_tool()
 def refine_summary(state: Dict[str, Any]) -> Dict[str, Any]:
    
-    current_summary = state.get("final_summary") or state.get("merged_summary", "")
+    current_summary = resolve(state.get("final_summary") or state.get("merged_summary", ""))
     max_length = state.get("max_length", 100) # Global config or state param
     
     if len(current_summary) <= max_length:
         return {"final_summary": current_summary}
     
+    if state.get("_node_config", {}).get("mode") == "single_pass" and max_length >= 0:
+        return {"final_summary": _refine_single_pass(current_summary, max_length)}
+    
     sentences = current_summary.split('.')
     if len(sentences) > 1:
       
@@ -88,7 +262,7 @@ def refine_summary(state: Dict[str, Any]) -> Dict[str, Any]:
 
 @ToolRegistry.register_condition()
 def summary_length_below_limit(state: Dict[str, Any]) -> bool:
-    summary = state.get("final_summary", "")
+    summary = resolve(state.get("final_summary", ""))
     max_length = state.get("max_length", 100)
     return len(summary) <= max_length
 
@@ -0,0 +1,96 @@
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi.responses import Response
+
+from app.blobs import BlobRef
+from app.state import iter_snapshots
+
+try:
+    import orjson
+except ImportError: # optional: faster encoding of large states
+    orjson = None
+
+# Fields of a run response and the defaults pydantic would fill in for log entries.
+RUN_FIELDS = ("status", "state", "execution_log", "error")
+_LOG_DEFAULTS = (("delta", {}), ("cache_hits", 0), ("iterations", 1), ("branch", None))
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BlobRef):
+        return value.text() # responses carry the text; the run itself only holds the handle
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """JSON response for data the engine produced itself: encoded directly, no model validation."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _project(state: Optional[Dict[str, Any]], keys: Optional[Iterable[str]]) -> Optional[Dict[str, Any]]:
+    if state is None or keys is None:
+        return state
+    return {key: state[key] for key in keys if key in state}
+
+
+def project_log(initial_state: Dict[str, Any], log: List[Dict[str, Any]], offset: int = 0,
+                limit: Optional[int] = None, snapshots: bool = True,
+                state_keys: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Log entries [offset:offset + limit], with state snapshots rebuilt only when asked for.
+
+    With state_keys, deltas and snapshots are cut to those keys before any replay.
+    """
+    end = len(log) if limit is None else min(len(log), offset + limit)
+    entries = []
+    if snapshots:
+        # Snapshots of a page still need every delta before it; replay only the keys requested.
+        replay = log[:end] if state_keys is None else [
+            {"delta": _project(entry.get("delta") or {}, state_keys)} for entry in log[:end]
+        ]
+        snapshot_iter = iter_snapshots(_project(initial_state, state_keys), replay)
+    for index, entry in enumerate(log[:end]):
+        snapshot = next(snapshot_iter) if snapshots else None
+        if index < offset:
+            continue
+        projected = {"node_id": entry["node_id"], "start_ts": entry["start_ts"], "end_ts": entry["end_ts"]}
+        for field, default in _LOG_DEFAULTS:
+            projected[field] = entry.get(field, default)
+        if state_keys is not None:
+            projected["delta"] = _project(projected["delta"], state_keys)
+        projected["state_snapshot"] = snapshot
+        entries.append(projected)
+    return entries
+
+
+def run_content(run_id: str, run: Dict[str, Any], fields: Iterable[str] = RUN_FIELDS,
+                state_keys: Optional[List[str]] = None, snapshots: bool = True,
+                log_offset: int = 0, log_limit: Optional[int] = None) -> Dict[str, Any]:
+    """The WorkflowRunResponse shape, limited to the requested fields."""
+    content: Dict[str, Any] = {"run_id": run_id}
+    fields = set(fields)
+    if "status" in fields:
+        content["status"] = run["status"]
+    if "state" in fields:
+        content["state"] = _project(run.get("state"), state_keys)
+    if "execution_log" in fields:
+        log = run.get("execution_log", [])
+        content["execution_log"] = project_log(
+            run.get("initial_state", {}), log, log_offset, log_limit, snapshots, state_keys
+        )
+        content["log_total"] = len(log)
+    if "error" in fields:
+        content["error"] = run.get("error")
+    return content
@@ -1,22 +1,567 @@
-from typing import Dict, Any, Optional
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional, Set, Tuple
 from app.models.api_models import GraphDefinition
+from app.blobs import BlobRef, decode_ref, get_blob_store, iter_refs, register_blob_source, sweep_blobs
+from app.compiler import CompiledGraph, GraphCompilationError, compile_graph
+from app.metrics import STORE_SECONDS, STORE_CALLS, register_collector
 
-# In-memory storage
+logger = logging.getLogger(__name__)
+
+# A run in one of these states will not be written to again by the engine
+# (unless it is resumed). "interrupted" runs were in flight when the process stopped.
+TERMINAL_STATUSES = frozenset({"completed", "failed", "cancelled", "interrupted"})
+ACTIVE_STATUSES = frozenset({"queued", "running"})
+
+
+class RunStore(ABC):
+    """Persistence backend for runs and graph definitions."""
+
+    # True when other processes (API workers, python -m app.worker) can see the same runs.
+    shared = False
+
+    @abstractmethod
+    def save_graph(self, graph: GraphDefinition):
+        ...
+
+    @abstractmethod
+    def list_graphs(self) -> List[GraphDefinition]:
+        ...
+
+    @abstractmethod
+    def save_run(self, run_id: str, data: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def update_run(self, run_id: str, updates: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def append_log(self, run_id: str, entry: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def get_log_since(self, run_id: str, seq: int) -> Optional[Dict[str, Any]]:
+        """A run's status, error and the log entries from position seq on, without the rest of the record."""
+
+    def evict(self) -> int:
+        """Drops finished runs past their TTL or beyond the size limit; returns how many."""
+        return 0
+
+    def mark_interrupted(self) -> List[str]:
+        """Marks runs left queued/running by a previous process as "interrupted"; returns their ids."""
+        return []
+
+    def resident_runs(self) -> int:
+        """Run records currently held in process memory."""
+        return 0
+
+    def blob_digests(self) -> Set[str]:
+        """Digests of the blobs the stored runs reference; the others may be swept."""
+        return set()
+
+    def flush(self):
+        pass
+
+    def release(self, run_id: str):
+        """Persists a run and stops caching it, so another process can take it over."""
+
+    def close(self):
+        self.flush()
+
+
+class InMemoryRunStore(RunStore):
+    """Process-local dict store. Finished runs are evicted by age and count."""
+
+    def __init__(self, ttl_seconds: Optional[float] = None, max_runs: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_runs = max_runs
+        self._graphs: Dict[Tuple[str, int], GraphDefinition] = {}
+        self._runs: Dict[str, Dict[str, Any]] = {}
+        self._finished: "OrderedDict[str, float]" = OrderedDict() # run_id -> finished_at
+
+    def save_graph(self, graph: GraphDefinition):
+        self._graphs[(graph.id, graph.version)] = graph
+
+    def list_graphs(self) -> List[GraphDefinition]:
+        return list(self._graphs.values())
+
+    def save_run(self, run_id: str, data: Dict[str, Any]):
+        self._runs[run_id] = data
+        self._finished.pop(run_id, None)
+        self.evict()
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        return self._runs.get(run_id)
+
+    def resident_runs(self) -> int:
+        return len(self._runs)
+
+    def blob_digests(self) -> Set[str]:
+        return {ref.digest for ref in iter_refs(list(self._runs.values()))}
+
+    def update_run(self, run_id: str, updates: Dict[str, Any]):
+        if run_id in self._runs:
+            self._runs[run_id].update(updates)
+            if updates.get("status") in TERMINAL_STATUSES:
+                self._finished[run_id] = time.time()
+                self._finished.move_to_end(run_id)
+                self.evict()
+            elif updates.get("status") in ACTIVE_STATUSES:
+                self._finished.pop(run_id, None) # resumed
+
+    def append_log(self, run_id: str, entry: Dict[str, Any]):
+        if run_id in self._runs:
+            self._runs[run_id]["execution_log"].append(entry)
+
+    def get_log_since(self, run_id: str, seq: int) -> Optional[Dict[str, Any]]:
+        record = self._runs.get(run_id)
+        if record is None:
+            return None
+        return {"status": record["status"], "error": record.get("error"), "log": record["execution_log"][seq:]}
+
+    def evict(self) -> int:
+        evicted = 0
+        if self.ttl_seconds is not None:
+            cutoff = time.time() - self.ttl_seconds
+            # _finished is ordered by finish time, oldest first
+            while self._finished and next(iter(self._finished.values())) < cutoff:
+                run_id, _ = self._finished.popitem(last=False)
+                self._runs.pop(run_id, None)
+                evicted += 1
+        if self.max_runs is not None:
+            while self._finished and len(self._runs) > self.max_runs:
+                run_id, _ = self._finished.popitem(last=False)
+                self._runs.pop(run_id, None)
+                evicted += 1
+        if evicted:
+            sweep_blobs(shared_references=self.shared)
+        return evicted
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, BlobRef):
+        return value.to_json() # the handle, not the text: blobs are stored once, in the blob store
+    # ISO 8601, as the API renders timestamps, so stored runs can be returned without re-parsing.
+    return value.isoformat() if isinstance(value, (datetime, date)) else str(value)
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, default=_json_default, separators=(",", ":"))
+
+
+def _holds_refs(value: Any) -> bool:
+    # Only a process moving values to the blob store (min_bytes) creates handles.
+    return get_blob_store().min_bytes > 0 and next(iter_refs(value), None) is not None
+
+
+# Blob handles as _dumps writes them.
+_BLOB_DIGEST = re.compile(r'"\$blob":"([0-9a-f]{64})"')
+
+
+class SqliteRunStore(RunStore):
+    """SQLite (WAL) store.
+
+    Active runs are kept in memory and written behind in batches: one transaction
+    per batch_size writes or flush_interval seconds, and always when a run finishes.
+    Log entries (with their state deltas) are appended as rows, never rewritten. The
+    state itself is stored apart from the rest of the record and only written when a
+    run is saved, reaches a checkpoint or finishes, or its state is replaced. Finished runs live only in
+    the database and are evicted by TTL and count. Several processes may share the
+    file; each sees the others' active runs as of their last flush.
+    """
+
+    shared = True
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS graphs (
+        id TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        definition TEXT NOT NULL,
+        PRIMARY KEY (id, version)
+    );
+    CREATE TABLE IF NOT EXISTS runs (
+        run_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        record TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        finished_at REAL,
+        state TEXT
+    );
+    CREATE INDEX IF NOT EXISTS runs_finished_at ON runs (finished_at);
+    CREATE TABLE IF NOT EXISTS run_log (
+        run_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        entry TEXT NOT NULL,
+        PRIMARY KEY (run_id, seq)
+    );
+    """
+
+    def __init__(self, path: str, ttl_seconds: Optional[float] = None, max_runs: Optional[int] = None,
+                 batch_size: int = 64, flush_interval: float = 0.5):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_runs = max_runs
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self._SCHEMA)
+        if "state" not in {row[1] for row in self._conn.execute("PRAGMA table_info(runs)")}:
+            self._conn.execute("ALTER TABLE runs ADD COLUMN state TEXT") # files from before the column
+        self._active: Dict[str, Dict[str, Any]] = {}
+        self._dirty: set = set()
+        self._state_dirty: set = set() # runs whose state is written at the next flush
+        self._pending_log: List[Tuple[str, int, Dict[str, Any]]] = []
+        self._log_seq: Dict[str, int] = {}
+        self._pending_writes = 0
+        self._last_flush = time.monotonic()
+
+    def save_graph(self, graph: GraphDefinition):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO graphs (id, version, definition) VALUES (?, ?, ?)",
+                (graph.id, graph.version, graph.model_dump_json())
+            )
+
+    def list_graphs(self) -> List[GraphDefinition]:
+        with self._lock:
+            rows = self._conn.execute("SELECT definition FROM graphs ORDER BY id, version").fetchall()
+        return [GraphDefinition.model_validate_json(row[0]) for row in rows]
+
+    def save_run(self, run_id: str, data: Dict[str, Any]):
+        with self._lock:
+            self._active[run_id] = data
+            self._log_seq[run_id] = len(data.get("execution_log", []))
+            self._pending_log.extend(
+                (run_id, seq, entry) for seq, entry in enumerate(data.get("execution_log", []))
+            )
+            self._state_dirty.add(run_id)
+            # Written at once when holding blobs: other processes' sweeps only see saved runs.
+            self._mark_dirty(run_id, force=data.get("status") in TERMINAL_STATUSES or _holds_refs(data))
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._active.get(run_id)
+            if record is not None:
+                return record
+            row = self._conn.execute("SELECT record, state FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if row is None:
+                return None
+            record = json.loads(row[0], object_hook=decode_ref)
+            if row[1] is not None:
+                record["state"] = json.loads(row[1], object_hook=decode_ref)
+            record["execution_log"] = [
+                json.loads(entry, object_hook=decode_ref) for (entry,) in self._conn.execute(
+                    "SELECT entry FROM run_log WHERE run_id = ? ORDER BY seq", (run_id,)
+                )
+            ]
+            return record
+
+    def get_log_since(self, run_id: str, seq: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._active.get(run_id)
+            if record is not None:
+                return {"status": record["status"], "error": record.get("error"),
+                        "log": record["execution_log"][seq:]}
+            row = self._conn.execute(
+                "SELECT status, json_extract(record, '$.error') FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            log = [json.loads(entry, object_hook=decode_ref) for (entry,) in self._conn.execute(
+                "SELECT entry FROM run_log WHERE run_id = ? AND seq >= ? ORDER BY seq", (run_id, seq)
+            )]
+            return {"status": row[0], "error": row[1], "log": log}
+
+    def resident_runs(self) -> int:
+        return len(self._active)
+
+    def update_run(self, run_id: str, updates: Dict[str, Any]):
+        with self._lock:
+            record = self._active.get(run_id)
+            if record is None:
+                # Updating a finished run (e.g. an external status change): load, patch, write back.
+                record = self.get_run(run_id)
+                if record is None:
+                    return
+                self._active[run_id] = record
+                self._log_seq[run_id] = len(record.get("execution_log", []))
+            record.update(updates)
+            done = updates.get("status") in TERMINAL_STATUSES
+            if done or "state" in updates or "checkpoint" in updates:
+                self._state_dirty.add(run_id)
+            self._mark_dirty(run_id, force=done)
+
+    def append_log(self, run_id: str, entry: Dict[str, Any]):
+        with self._lock:
+            record = self._active.get(run_id)
+            if record is None:
+                return
+            record["execution_log"].append(entry)
+            seq = self._log_seq.get(run_id, 0)
+            self._log_seq[run_id] = seq + 1
+            self._pending_log.append((run_id, seq, entry))
+            # Only the log row is written; the record and state wait for a checkpoint.
+            self._count_write(force=_holds_refs(entry.get("delta")))
+
+    def _mark_dirty(self, run_id: str, force: bool = False):
+        self._dirty.add(run_id)
+        self._count_write(force)
+
+    def _count_write(self, force: bool = False):
+        self._pending_writes += 1
+        if (force or self._pending_writes >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty and not self._pending_log:
+                return
+            now = time.time()
+            finished = []
+            rows = []
+            for run_id in self._dirty:
+                record = self._active.get(run_id)
+                if record is None:
+                    continue
+                status = record.get("status", "running")
+                done = status in TERMINAL_STATUSES
+                if done:
+                    finished.append(run_id)
+                meta = {k: v for k, v in record.items() if k not in ("execution_log", "state")}
+                state = _dumps(record.get("state")) if run_id in self._state_dirty else None
+                rows.append((run_id, status, _dumps(meta), now, now if done else None, state))
+            log_rows = [(run_id, seq, _dumps(entry)) for run_id, seq, entry in self._pending_log]
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO runs (run_id, status, record, updated_at, finished_at, state) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (run_id) DO UPDATE SET status = excluded.status, "
+                    "record = excluded.record, updated_at = excluded.updated_at, "
+                    "finished_at = excluded.finished_at, state = COALESCE(excluded.state, runs.state)", rows
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO run_log (run_id, seq, entry) VALUES (?, ?, ?)", log_rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            self._dirty.clear()
+            self._state_dirty.clear()
+            self._pending_log.clear()
+            self._pending_writes = 0
+            self._last_flush = time.monotonic()
+            # Finished runs are served from the database from now on.
+            for run_id in finished:
+                self._active.pop(run_id, None)
+                self._log_seq.pop(run_id, None)
+            if finished:
+                self.evict()
+
+    def evict(self) -> int:
+        with self._lock:
+            evicted = 0
+            if self.ttl_seconds is not None:
+                cutoff = time.time() - self.ttl_seconds
+                evicted += self._delete_runs(
+                    "SELECT run_id FROM runs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)
+                )
+            if self.max_runs is not None:
+                evicted += self._delete_runs(
+                    "SELECT run_id FROM runs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC "
+                    "LIMIT -1 OFFSET ?", (self.max_runs,)
+                )
+            if evicted:
+                sweep_blobs(shared_references=self.shared)
+            return evicted
+
+    def blob_digests(self) -> Set[str]:
+        with self._lock:
+            self.flush()
+            digests = set()
+            for sql in ("SELECT record FROM runs WHERE instr(record, '\"$blob\"')",
+                        "SELECT state FROM runs WHERE instr(state, '\"$blob\"')",
+                        "SELECT entry FROM run_log WHERE instr(entry, '\"$blob\"')"):
+                for (text,) in self._conn.execute(sql):
+                    digests.update(_BLOB_DIGEST.findall(text))
+            return digests
+
+    def release(self, run_id: str):
+        with self._lock:
+            self.flush()
+            self._active.pop(run_id, None)
+            self._log_seq.pop(run_id, None)
+
+    def mark_interrupted(self) -> List[str]:
+        with self._lock:
+            self.flush()
+            run_ids = [row[0] for row in self._conn.execute(
+                "SELECT run_id FROM runs WHERE status IN ({})".format(",".join("?" * len(ACTIVE_STATUSES))),
+                tuple(ACTIVE_STATUSES)
+            ).fetchall() if row[0] not in self._active]
+            for run_id in run_ids:
+                self.update_run(run_id, {"status": "interrupted"})
+            self.flush()
+            return run_ids
+
+    def _delete_runs(self, select_sql: str, params: Tuple) -> int:
+        run_ids = [(row[0],) for row in self._conn.execute(select_sql, params).fetchall()]
+        if not run_ids:
+            return 0
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.executemany("DELETE FROM run_log WHERE run_id = ?", run_ids)
+        self._conn.executemany("DELETE FROM runs WHERE run_id = ?", run_ids)
+        self._conn.execute("COMMIT")
+        return len(run_ids)
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+def create_store_from_env() -> RunStore:
+    """WORKFLOW_RUN_STORE is "memory" (default) or "sqlite:///path/to/runs.db"."""
+    url = os.environ.get("WORKFLOW_RUN_STORE", "memory")
+    ttl_seconds = _env_float("WORKFLOW_RUN_TTL_SECONDS")
+    max_runs = _env_float("WORKFLOW_MAX_RUNS")
+    max_runs = int(max_runs) if max_runs is not None else None
+    if url == "memory":
+        return InMemoryRunStore(ttl_seconds=ttl_seconds, max_runs=max_runs)
+    if url.startswith("sqlite:///"):
+        return SqliteRunStore(url[len("sqlite:///"):], ttl_seconds=ttl_seconds, max_runs=max_runs)
+    raise ValueError(f"Unsupported WORKFLOW_RUN_STORE '{url}'")
+
+
+# Compiled graphs are always cached in-process; definitions and runs go to the store.
 _graphs: Dict[str, GraphDefinition] = {}
-_runs: Dict[str, Dict[str, Any]] = {}
+_plans: Dict[Tuple[str, int], CompiledGraph] = {}
+_store: RunStore = InMemoryRunStore()
+
+def _cache_plan(graph: GraphDefinition) -> CompiledGraph:
+    plan = compile_graph(graph)
+    _plans[plan.key] = plan
+    latest = _graphs.get(graph.id)
+    if latest is None or graph.version >= latest.version:
+        _graphs[graph.id] = graph
+    return plan
+
+def load_stored_graphs() -> int:
+    """Compiles stored graphs not cached yet (e.g. created by another process); returns how many."""
+    loaded = 0
+    for graph in _store.list_graphs():
+        if (graph.id, graph.version) in _plans:
+            continue
+        try:
+            _cache_plan(graph)
+            loaded += 1
+        except GraphCompilationError as e:
+            logger.warning(f"Skipping stored graph: {e}")
+    return loaded
+
+def configure_store(store: RunStore):
+    """Switches the active backend and compiles the graphs it already holds."""
+    global _store
+    _store = store
+    load_stored_graphs()
+
+def get_store() -> RunStore:
+    return _store
+
+def _store_blob_digests() -> Set[str]:
+    return _store.blob_digests()
+
+register_blob_source(_store_blob_digests)
 
-def save_graph(graph: GraphDefinition):
-    _graphs[graph.id] = graph
+def save_graph(graph: GraphDefinition) -> CompiledGraph:
+    # Compile first so an invalid graph is never stored.
+    plan = _cache_plan(graph)
+    _store.save_graph(graph)
+    return plan
 
-def get_graph(graph_id: str) -> Optional[GraphDefinition]:
-    return _graphs.get(graph_id)
+def get_graph(graph_id: str, version: Optional[int] = None) -> Optional[GraphDefinition]:
+    if version is None:
+        return _graphs.get(graph_id)
+    plan = _plans.get((graph_id, version))
+    return plan.definition if plan else None
+
+def get_plan(graph_id: str, version: Optional[int] = None) -> Optional[CompiledGraph]:
+    if version is None:
+        latest = _graphs.get(graph_id)
+        if latest is None:
+            return None
+        version = latest.version
+    return _plans.get((graph_id, version))
+
+def mark_interrupted_runs() -> List[str]:
+    """Called at startup: runs a previous process left in flight become resumable "interrupted" runs."""
+    run_ids = _store.mark_interrupted()
+    if run_ids:
+        logger.warning(f"Marked {len(run_ids)} in-flight run(s) from a previous process as interrupted")
+    return run_ids
+
+def _timed(operation: str, started: float):
+    labels = (operation,)
+    STORE_SECONDS.inc(labels, time.perf_counter() - started)
+    STORE_CALLS.inc(labels)
 
 def save_run(run_id: str, data: Dict[str, Any]):
-    _runs[run_id] = data
+    started = time.perf_counter()
+    _store.save_run(run_id, data)
+    _timed("save_run", started)
 
 def get_run(run_id: str) -> Optional[Dict[str, Any]]:
-    return _runs.get(run_id)
+    started = time.perf_counter()
+    run = _store.get_run(run_id)
+    _timed("get_run", started)
+    return run
+
+def get_log_since(run_id: str, seq: int) -> Optional[Dict[str, Any]]:
+    started = time.perf_counter()
+    progress = _store.get_log_since(run_id, seq)
+    _timed("get_log_since", started)
+    return progress
 
 def update_run(run_id: str, updates: Dict[str, Any]):
-    if run_id in _runs:
-        _runs[run_id].update(updates)
+    started = time.perf_counter()
+    _store.update_run(run_id, updates)
+    _timed("update_run", started)
+
+def append_log(run_id: str, entry: Dict[str, Any]):
+    started = time.perf_counter()
+    _store.append_log(run_id, entry)
+    _timed("append_log", started)
+
+
+def _collect_metrics():
+    yield ("workflow_store_resident_runs", "gauge", "Run records held in process memory by the run store.", {},
+           _store.resident_runs())
+
+
+register_collector(_collect_metrics)
+
+configure_store(create_store_from_env())
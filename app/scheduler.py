@@ -0,0 +1,196 @@
+import asyncio
+import itertools
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from app.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the run queue is saturated; retry_after is a hint in seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Run queue is full, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class _Job:
+    __slots__ = ("graph_id", "factory", "priority", "seq", "weight", "enqueued_at")
+
+    def __init__(self, graph_id: str, factory: Callable[[], Awaitable[Any]], priority: int, seq: int,
+                 weight: int = 1):
+        self.graph_id = graph_id
+        self.factory = factory
+        self.priority = priority
+        self.seq = seq
+        self.weight = weight
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: "_Job") -> bool:
+        # Higher priority first, FIFO within a priority
+        return (-self.priority, self.seq) < (-other.priority, other.seq)
+
+
+class RunScheduler:
+    """Bounded queue of background runs drained by a fixed pool of worker coroutines.
+
+    Admission fails with QueueFullError once max_queue runs are waiting. A graph with
+    per_graph_limit runs already executing has its further runs parked until one of
+    them finishes, so one busy graph cannot occupy every worker. A job standing for
+    several runs (a batch) is admitted with their count as its weight: it takes that
+    many places in the queue and counts as that many running runs of its graph.
+    """
+
+    def __init__(self, workers: int = 8, max_queue: int = 1000, per_graph_limit: Optional[int] = None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.per_graph_limit = per_graph_limit
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._parked: Dict[str, Deque[_Job]] = {}
+        self._running: Dict[str, int] = {}
+        self._waiting = 0 # weight of the queued and parked jobs
+        self._seq = itertools.count()
+        self.submitted = 0
+        self.rejected = 0
+        self.finished = 0
+        self._avg_wait = 0.0
+        self._max_wait = 0.0
+        self._avg_run = 0.0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        # First use, or the previous loop is gone (e.g. a test client per request).
+        self._loop = loop
+        self._queue = asyncio.PriorityQueue()
+        self._parked.clear()
+        self._running.clear()
+        self._waiting = 0
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    @property
+    def depth(self) -> int:
+        return self._waiting
+
+    def retry_after(self) -> float:
+        """Rough time for the backlog to drain through the workers, at least one second."""
+        return max(1.0, self.depth * (self._avg_run or 1.0) / max(1, self.workers))
+
+    def submit(self, graph_id: str, factory: Callable[[], Awaitable[Any]], priority: int = 0, weight: int = 1):
+        """Enqueues factory() to run on a worker; raises QueueFullError when saturated.
+
+        weight is the number of runs factory() executes (see the class docstring).
+        """
+        self._ensure_started()
+        if self.depth + weight > self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after())
+        self.submitted += 1
+        self._waiting += weight
+        self._queue.put_nowait(_Job(graph_id, factory, priority, next(self._seq), weight))
+
+    async def _worker(self):
+        queue = self._queue
+        while True:
+            job = await queue.get()
+            try:
+                if self.per_graph_limit and self._running.get(job.graph_id, 0) >= self.per_graph_limit:
+                    self._parked.setdefault(job.graph_id, deque()).append(job)
+                    continue
+                await self._run(job)
+            finally:
+                queue.task_done()
+
+    async def _run(self, job: _Job):
+        started = time.monotonic()
+        wait = started - job.enqueued_at
+        self._avg_wait = 0.9 * self._avg_wait + 0.1 * wait if self.finished else wait
+        self._max_wait = max(self._max_wait, wait)
+        self._waiting -= job.weight
+        self._running[job.graph_id] = self._running.get(job.graph_id, 0) + job.weight
+        try:
+            await job.factory()
+        except Exception as e:
+            logger.error(f"Queued run for graph {job.graph_id} failed: {e}")
+        finally:
+            self._running[job.graph_id] -= job.weight
+            duration = time.monotonic() - started
+            self._avg_run = 0.9 * self._avg_run + 0.1 * duration if self.finished else duration
+            self.finished += 1
+            parked = self._parked.get(job.graph_id)
+            if parked:
+                self._queue.put_nowait(parked.popleft())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "per_graph_limit": self.per_graph_limit,
+            "queue_depth": self.depth,
+            "running": sum(self._running.values()),
+            "running_by_graph": {g: n for g, n in self._running.items() if n},
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "finished": self.finished,
+            "avg_wait_seconds": round(self._avg_wait, 6),
+            "max_wait_seconds": round(self._max_wait, 6),
+            "avg_run_seconds": round(self._avg_run, 6),
+        }
+
+    async def stop(self):
+        if self._loop is not asyncio.get_running_loop():
+            self._tasks = []
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+_scheduler = RunScheduler(
+    workers=_env_int("WORKFLOW_RUN_WORKERS", 8),
+    max_queue=_env_int("WORKFLOW_MAX_QUEUE", 1000),
+    per_graph_limit=_env_int("WORKFLOW_PER_GRAPH_CONCURRENCY", None),
+)
+
+
+def get_scheduler() -> RunScheduler:
+    return _scheduler
+
+
+def configure_scheduler(scheduler: RunScheduler):
+    global _scheduler
+    _scheduler = scheduler
+
+
+def _collect_metrics():
+    stats = _scheduler.stats()
+    yield "workflow_queue_depth", "gauge", "Background runs waiting for a worker.", {}, stats["queue_depth"]
+    yield "workflow_queue_running", "gauge", "Background runs executing on a worker.", {}, stats["running"]
+    yield ("workflow_queue_rejected_total", "counter", "Runs rejected because the queue was full.", {},
+           stats["rejected"])
+    yield ("workflow_queue_wait_seconds_avg", "gauge", "Moving average of queue wait before a run starts.", {},
+           stats["avg_wait_seconds"])
+    yield ("workflow_queue_wait_seconds_max", "gauge", "Longest queue wait observed.", {},
+           stats["max_wait_seconds"])
+
+
+register_collector(_collect_metrics)
+
+
+def retry_after_header(error: QueueFullError) -> Dict[str, str]:
+    return {"Retry-After": str(math.ceil(error.retry_after))}
@@ -0,0 +1,121 @@
+from types import MappingProxyType
+from typing import Dict, Any, Iterable, List, Mapping, Optional
+
+from app.cache import estimate_size
+
+# Tools receive a read-only view of the live state instead of a deep copy.
+# They must treat the values they read as immutable and return their changes
+# as a dict of updates; the engine applies those updates copy-on-write.
+StateView = Mapping[str, Any]
+
+_MISSING = object()
+
+
+class RunState:
+    """Live state of one run: a flat dict updated key-by-key, never deep-copied."""
+
+    __slots__ = ("_data", "_view", "_sizes", "size_bytes", "changes")
+
+    def __init__(self, initial_state: Optional[Dict[str, Any]] = None):
+        self._data: Dict[str, Any] = dict(initial_state or {})
+        self._view = MappingProxyType(self._data)
+        # Estimated bytes per key, maintained from deltas so the total stays cheap to report.
+        self._sizes: Dict[str, int] = {key: estimate_size(value) for key, value in self._data.items()}
+        self.size_bytes = sum(self._sizes.values())
+        # Set on forked branch states: every key the branch changed, with its latest value.
+        self.changes: Optional[Dict[str, Any]] = None
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        return self._data
+
+    def view(self) -> StateView:
+        return self._view
+
+    def fork(self) -> "RunState":
+        """Shallow copy for a parallel branch; values are shared, so this is O(keys)."""
+        child = RunState.__new__(RunState)
+        child._data = dict(self._data)
+        child._view = MappingProxyType(child._data)
+        child._sizes = dict(self._sizes)
+        child.size_bytes = self.size_bytes
+        child.changes = {}
+        return child
+
+    def set(self, key: str, value: Any):
+        self.apply({key: value})
+
+    def apply(self, updates: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Applies tool updates and returns only the keys whose values actually changed."""
+        delta: Dict[str, Any] = {}
+        if not updates:
+            return delta
+        data = self._data
+        for key, value in updates.items():
+            old = data.get(key, _MISSING)
+            if old is value:
+                continue
+            if old is not _MISSING and type(old) is type(value) and old == value:
+                continue
+            data[key] = value
+            delta[key] = value
+            size = estimate_size(value)
+            self.size_bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+        if self.changes is not None:
+            self.changes.update(delta)
+        return delta
+
+
+MERGE_RULES = ("last", "first", "list", "extend", "update", "error")
+DEFAULT_MERGE_RULE = "last"
+
+
+def merge_branches(rules: Mapping[str, str], branch_changes: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combines the changes of parallel branches (in branch order) into one set of updates.
+
+    rules maps a state key to one of MERGE_RULES, with "*" as the default. Internal
+    keys (leading underscore, e.g. _node_config) always use "last".
+    """
+    collected: Dict[str, List[Any]] = {}
+    for changes in branch_changes:
+        for key, value in changes.items():
+            collected.setdefault(key, []).append(value)
+
+    default = rules.get("*", DEFAULT_MERGE_RULE)
+    merged: Dict[str, Any] = {}
+    for key, values in collected.items():
+        rule = DEFAULT_MERGE_RULE if key.startswith("_") else rules.get(key, default)
+        if rule == "last":
+            merged[key] = values[-1]
+        elif rule == "first":
+            merged[key] = values[0]
+        elif rule == "list":
+            merged[key] = values
+        elif rule == "extend":
+            merged[key] = [item for value in values for item in value]
+        elif rule == "update":
+            merged[key] = {k: v for value in values for k, v in value.items()}
+        elif rule == "error":
+            if any(value != values[0] for value in values[1:]):
+                raise ValueError(f"Parallel branches set conflicting values for '{key}'")
+            merged[key] = values[0]
+        else:
+            raise ValueError(f"Unknown merge rule '{rule}' for '{key}'")
+    return merged
+
+
+def iter_snapshots(initial_state: Dict[str, Any], log: List[Dict[str, Any]]):
+    """Yields the full state after each log entry by replaying deltas on a shallow copy."""
+    current = dict(initial_state or {})
+    for entry in log:
+        current.update(entry.get("delta") or {})
+        yield dict(current)
+
+
+def materialize_log(initial_state: Dict[str, Any], log: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Returns log entries with state_snapshot reconstructed on demand."""
+    return [
+        {**entry, "state_snapshot": snapshot}
+        for entry, snapshot in zip(log, iter_snapshots(initial_state, log))
+    ]
@@ -0,0 +1,80 @@
+import re
+import string
+from typing import List, Sequence
+
+try:
+    import numpy as np
+except ImportError: # optional: only the TF-IDF summarizer needs it
+    np = None
+
+# A sentence starts at a non-space, non-terminator character and runs through its terminators.
+_SENTENCE = re.compile(r"[^.!?\s][^.!?]*[.!?]*")
+# Sentences are tokenized together, joined by this marker: every token after the
+# n-th marker belongs to sentence n, so no per-sentence Python loop is needed.
+_BOUNDARY = "\x00"
+_PUNCTUATION = str.maketrans({c: " " for c in string.punctuation + "\u2018\u2019\u201c\u201d\u2013\u2014\u2026"})
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("The TF-IDF summarizer requires numpy (pip install numpy)")
+
+
+def score_sentences(text: str):
+    """Splits text into sentences and scores each by TF-IDF cosine similarity to the whole text.
+
+    Returns (sentences, scores). All sentences are scored in one vectorized pass over
+    a sparse (sentence, term) count matrix.
+    """
+    require_numpy()
+    sentences = _SENTENCE.findall(text.replace(_BOUNDARY, " "))
+    if not sentences:
+        return [], np.zeros(0)
+
+    # str.translate/split run in C; a token regex is several times slower on large inputs.
+    tokens = f" {_BOUNDARY} ".join(sentences).lower().translate(_PUNCTUATION).split()
+    vocab = {token: i for i, token in enumerate(dict.fromkeys(tokens))}
+    ids = np.fromiter(map(vocab.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+    is_boundary = ids == vocab.get(_BOUNDARY, -1)
+    sentence_of = np.cumsum(is_boundary)
+    words = ~is_boundary
+
+    n_sentences = len(sentences)
+    n_terms = len(vocab)
+    keys, counts = np.unique(sentence_of[words] * n_terms + ids[words], return_counts=True)
+    rows, terms = np.divmod(keys, n_terms)
+
+    df = np.bincount(terms, minlength=n_terms)
+    idf = np.log((1 + n_sentences) / (1 + df)) + 1.0
+    weights = (1.0 + np.log(counts)) * idf[terms]
+    centroid = np.bincount(terms, weights=weights, minlength=n_terms)
+
+    dots = np.bincount(rows, weights=weights * centroid[terms], minlength=n_sentences)
+    norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=n_sentences))
+    denominator = norms * np.sqrt(centroid @ centroid)
+    scores = np.divide(dots, denominator, out=np.zeros(n_sentences), where=denominator > 0)
+    return sentences, scores
+
+
+def select_sentences(sentences: Sequence[str], scores, max_chars: int) -> List[str]:
+    """Best-scoring sentences whose " "-joined length fits max_chars, in document order."""
+    if not len(sentences):
+        return []
+    lengths = np.fromiter(map(len, sentences), dtype=np.int64, count=len(sentences))
+    order = np.argsort(-scores, kind="stable")
+    # Sentences with no words scored zero; sentences longer than the budget can never fit.
+    order = order[(scores[order] > 0) & (lengths[order] <= max_chars)]
+    shortest = int(lengths[order].min()) if len(order) else 0
+    chosen = []
+    used = 0
+    for index in order.tolist():
+        needed = lengths[index] + (1 if chosen else 0)
+        if used + needed <= max_chars:
+            chosen.append(index)
+            used += needed
+            if max_chars - used <= shortest:
+                break
+    if not chosen:
+        # Nothing fits whole: keep the start of the best sentence.
+        return [sentences[int(np.argmax(scores))].strip()[:max_chars]]
+    return [sentences[index].strip() for index in sorted(chosen)]
@@ -0,0 +1,130 @@
+import atexit
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.logs import sampled
+
+# Run tracing (WORKFLOW_TRACE_FILE): spans for each run, node and tool call are
+# written in the Chrome trace event format, viewable in chrome://tracing or
+# https://ui.perfetto.dev. WORKFLOW_TRACE_SAMPLE sets the fraction of runs traced
+# (default all); config["trace"] = true traces a run regardless. Spans are queued
+# as tuples and encoded and written by a background thread, off the event loop.
+#
+# The file is a JSON array left open at the end, which the trace viewers accept, so
+# events can be appended as they come. Give each process its own file: "{pid}" in
+# the path is replaced by the process id.
+
+
+def now_us() -> float:
+    return time.time() * 1e6
+
+
+class Tracer:
+    def __init__(self, path: str, sample_rate: float = 1.0):
+        self.path = path.replace("{pid}", str(os.getpid()))
+        self.sample_rate = sample_rate
+        self.pid = os.getpid()
+        self._tids = itertools.count(1)
+        self._events: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_events, name="workflow-tracer", daemon=True)
+        self._writer.start()
+
+    def start_run(self, run_id: str, graph_id: str, config: Dict[str, Any]) -> Optional["RunTrace"]:
+        """A trace for one run, or None if the run is not sampled."""
+        if not config.get("trace") and not sampled(run_id, self.sample_rate):
+            return None
+        return RunTrace(self, run_id, graph_id)
+
+    def emit(self, event: tuple):
+        self._events.put(event)
+
+    def _write_events(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            if f.tell() == 0:
+                f.write("[\n")
+            while True:
+                event = self._events.get()
+                while event is not None:
+                    f.write(json.dumps(self._encode(event), default=str))
+                    f.write(",\n")
+                    try:
+                        event = self._events.get_nowait()
+                    except queue.Empty:
+                        break
+                else:
+                    f.flush()
+                    return
+                f.flush()
+
+    def _encode(self, event: tuple) -> Dict[str, Any]:
+        kind, tid, name, category, start, end, args = event
+        if kind == "M":
+            return {"ph": "M", "pid": self.pid, "tid": tid, "name": "thread_name", "args": {"name": name}}
+        return {"ph": "X", "pid": self.pid, "tid": tid, "name": name, "cat": category,
+                "ts": start, "dur": end - start, "args": args}
+
+    def close(self):
+        self._events.put(None)
+        self._writer.join(timeout=5)
+
+
+class RunTrace:
+    """Spans of one run. Each branch of a fan-out gets its own track, so spans on a track nest."""
+
+    __slots__ = ("tracer", "run_id", "graph_id", "started", "_tracks")
+
+    def __init__(self, tracer: Tracer, run_id: str, graph_id: str):
+        self.tracer = tracer
+        self.run_id = run_id
+        self.graph_id = graph_id
+        self.started = now_us()
+        self._tracks: Dict[Optional[str], int] = {}
+
+    def _track(self, branch: Optional[str]) -> int:
+        tid = self._tracks.get(branch)
+        if tid is None:
+            tid = self._tracks[branch] = next(self.tracer._tids)
+            name = f"{self.graph_id} {self.run_id}" + (f" [{branch}]" if branch else "")
+            self.tracer.emit(("M", tid, name, None, None, None, None))
+        return tid
+
+    def span(self, name: str, category: str, start: float, branch: Optional[str] = None, **args: Any):
+        """Records a span from start (now_us()) until now."""
+        self.tracer.emit(("X", self._track(branch), name, category, start, now_us(), args))
+
+    def finish(self, status: str):
+        self.span(self.graph_id, "run", self.started, run_id=self.run_id, status=status)
+
+
+def _create_tracer_from_env() -> Optional[Tracer]:
+    path = os.environ.get("WORKFLOW_TRACE_FILE")
+    if not path:
+        return None
+    return Tracer(path, float(os.environ.get("WORKFLOW_TRACE_SAMPLE", 1.0)))
+
+
+_tracer: Optional[Tracer] = _create_tracer_from_env()
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def configure_tracer(tracer: Optional[Tracer]):
+    """Replaces the tracer (None: tracing off); the previous one is flushed and closed."""
+    global _tracer
+    previous, _tracer = _tracer, tracer
+    if previous is not None:
+        previous.close()
+
+
+@atexit.register
+def _close_tracer():
+    if _tracer is not None:
+        _tracer.close()
@@ -0,0 +1,165 @@
+"""Worker process: executes runs queued by the API tier (WORKFLOW_JOB_QUEUE).
+
+    WORKFLOW_RUN_STORE=sqlite:///runs.db WORKFLOW_JOB_QUEUE=sqlite:///runs.db \\
+        python -m app.worker --concurrency 8 --import myproject.tools
+
+Start any number of these next to any number of API processes that share the same
+database files. Tools must be registered in the worker too: app.registry is always
+loaded, other tool modules are imported with --import.
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from app.engine import WorkflowEngine, cancel_execution, cancel_run
+from app.executors import shutdown_pools
+from app.job_queue import RESUME, JobQueue, get_job_queue
+from app.logs import configure_logging
+from app.run_store import TERMINAL_STATUSES, get_plan, get_run, get_store, load_stored_graphs, update_run
+
+logger = logging.getLogger(__name__)
+
+
+async def execute_job(job: Dict[str, Any]):
+    """Runs one claimed job to a terminal status in the shared run store."""
+    run_id = job["run_id"]
+    run = get_run(run_id)
+    if run is None:
+        logger.warning(f"Skipping job {job['job_id']}: run {run_id} not found")
+        return
+    if run["status"] in TERMINAL_STATUSES and job["kind"] != RESUME:
+        return # finished before its worker died; nothing to redo
+    if job.get("cancelled"):
+        await cancel_run(run)
+        return
+
+    plan = get_plan(run["graph_id"], run.get("graph_version"))
+    if plan is None and load_stored_graphs():
+        plan = get_plan(run["graph_id"], run.get("graph_version"))
+    if plan is None:
+        update_run(run_id, {"status": "failed", "error": f"Graph {run['graph_id']} not found in worker"})
+        return
+
+    engine = WorkflowEngine(plan, run_id=run_id)
+    try:
+        if job["kind"] == RESUME or run["status"] == "running":
+            # An explicit resume, or a run whose previous worker stopped heartbeating.
+            await engine.resume(run, start_node_id=job["payload"].get("start_node_id"), run_mode="sync")
+        else:
+            await engine.run_queued(run)
+    except ValueError as e:
+        update_run(run_id, {"status": "failed", "error": str(e)})
+
+
+class Worker:
+    """Claims up to `concurrency` jobs at a time and heartbeats them while they run.
+
+    Heartbeats also pick up cancellations (DELETE /graph/run/{run_id}), at most
+    cancel_interval seconds after they were requested.
+    """
+
+    def __init__(self, queue: JobQueue, concurrency: int = 8, poll_interval: float = 0.2,
+                 stale_after: float = 60.0, worker_id: Optional[str] = None, cancel_interval: float = 1.0):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.cancel_interval = cancel_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._running: Dict[str, asyncio.Task] = {}
+        self._run_ids: Dict[str, str] = {}
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def _run_job(self, job: Dict[str, Any]):
+        try:
+            await execute_job(job)
+        except Exception as e:
+            logger.error(f"Job {job['job_id']} for run {job['run_id']} crashed: {e}")
+        finally:
+            self.queue.complete(job["job_id"])
+            get_store().release(job["run_id"])
+            self._running.pop(job["job_id"], None)
+            self._run_ids.pop(job["job_id"], None)
+
+    async def _heartbeat(self):
+        interval = min(self.cancel_interval, self.stale_after / 3)
+        last_requeue = 0.0
+        while not self._stopping.is_set():
+            for job_id in self.queue.heartbeat(list(self._running)):
+                # Not executing yet: the flag is still set at the next heartbeat.
+                await cancel_execution(self._run_ids.get(job_id, ""), wait=0)
+            if time.monotonic() - last_requeue >= self.stale_after / 3:
+                self.queue.requeue_stale(self.stale_after)
+                last_requeue = time.monotonic()
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        logger.info(f"Worker {self.worker_id} started (concurrency {self.concurrency})")
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while not self._stopping.is_set():
+                job = self.queue.claim(self.worker_id) if len(self._running) < self.concurrency else None
+                if job is None:
+                    try:
+                        await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                self._run_ids[job["job_id"]] = job["run_id"]
+                self._running[job["job_id"]] = asyncio.create_task(self._run_job(job))
+            # Finish what was claimed; unclaimed jobs stay queued for other workers.
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+        logger.info(f"Worker {self.worker_id} stopped")
+
+
+async def _main(args: argparse.Namespace):
+    queue = get_job_queue()
+    if queue is None or not get_store().shared:
+        raise SystemExit("Set WORKFLOW_JOB_QUEUE and a shared WORKFLOW_RUN_STORE (sqlite:///...) for workers")
+    worker = Worker(queue, args.concurrency, args.poll_interval, args.stale_after)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        shutdown_pools()
+        get_store().close()
+        queue.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Execute queued workflow runs.")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("WORKFLOW_WORKER_CONCURRENCY", 8)))
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="seconds between polls when idle")
+    parser.add_argument("--stale-after", type=float, default=60.0,
+                        help="requeue jobs whose worker has not heartbeated for this many seconds")
+    parser.add_argument("--import", dest="imports", action="append", default=[],
+                        help="module registering extra tools/conditions (repeatable)")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    for module in args.imports:
+        importlib.import_module(module)
+    load_stored_graphs()
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
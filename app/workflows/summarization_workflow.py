@@ -3,15 +3,23 @@ from app.models.api_models import GraphDefinition, NodeDefinition, EdgeDefinitio
 def create_summarization_workflow() -> GraphDefinition:
     nodes = [
         NodeDefinition(id="split_text", action_name="split_text_to_chunks", config={"max_chunk_chars": 50}),
-        NodeDefinition(id="summarize_chunks", action_name="summarize_chunk_rule_based"),
+        # Map: summarize every chunk (inline: the per-chunk work is cheaper than a pool round trip)
+        NodeDefinition(
+            id="summarize_chunks",
+            action_name="summarize_text_rule_based",
+            type="map",
+            map_over="chunks",
+            output_key="summaries",
+            batch_size=16
+        ),
         NodeDefinition(id="merge_summaries", action_name="merge_summaries"),
-        NodeDefinition(id="refine_final_summary", action_name="refine_summary")
+        NodeDefinition(id="refine_final_summary", action_name="refine_summary", config={"mode": "single_pass"})
     ]
 
     edges = [
         # split -> summarize
         EdgeDefinition(source_id="split_text", target_id="summarize_chunks"),
-        # summarize -> merge
+        # summarize -> merge (reduce)
         EdgeDefinition(source_id="summarize_chunks", target_id="merge_summaries"),
         # merge -> refine
         EdgeDefinition(source_id="merge_summaries", target_id="refine_final_summary"),
@@ -32,3 +40,67 @@ def create_summarization_workflow() -> GraphDefinition:
         nodes=nodes,
         edges=edges
     )
+
+
+def create_extractive_summarization_workflow() -> GraphDefinition:
+    """split -> TF-IDF sentence selection over all chunks -> merge -> refine (rarely needed)."""
+    return GraphDefinition(
+        id="extractive_summarization_workflow",
+        start_node_id="split_text",
+        nodes=[
+            NodeDefinition(id="split_text", action_name="split_text_to_chunks", config={"max_chunk_chars": 1000, "sentence_aware": True}),
+            # Budget defaults to the run's max_length; set config max_chars to override.
+            NodeDefinition(id="select_sentences", action_name="summarize_chunks_tfidf"),
+            NodeDefinition(id="merge_summaries", action_name="merge_summaries"),
+            NodeDefinition(id="refine_final_summary", action_name="refine_summary", config={"mode": "single_pass"})
+        ],
+        edges=[
+            EdgeDefinition(source_id="split_text", target_id="select_sentences"),
+            EdgeDefinition(source_id="select_sentences", target_id="merge_summaries"),
+            EdgeDefinition(source_id="merge_summaries", target_id="refine_final_summary"),
+            EdgeDefinition(
+                source_id="refine_final_summary",
+                target_id="refine_final_summary",
+                condition_name="summary_length_above_limit",
+                loop=True
+            )
+        ]
+    )
+
+
+def create_keyword_summarization_workflow() -> GraphDefinition:
+    """Summary and keywords of the same text, computed on parallel branches and joined."""
+    return GraphDefinition(
+        id="keyword_summarization_workflow",
+        start_node_id="split_text",
+        nodes=[
+            NodeDefinition(id="split_text", action_name="split_text_to_chunks", config={"max_chunk_chars": 1000, "sentence_aware": True}),
+            NodeDefinition(id="extract_keywords", action_name="extract_keywords"),
+            NodeDefinition(
+                id="summarize_chunks",
+                action_name="summarize_text_rule_based",
+                type="map",
+                map_over="chunks",
+                output_key="summaries",
+                batch_size=16
+            ),
+            NodeDefinition(id="merge_summaries", action_name="merge_summaries"),
+            NodeDefinition(id="refine_final_summary", action_name="refine_summary", config={"mode": "single_pass"}),
+            NodeDefinition(id="combine", action_name="passthrough", type="join")
+        ],
+        edges=[
+            # Fan out: keywords and the summary chain run concurrently.
+            EdgeDefinition(source_id="split_text", target_id="extract_keywords", parallel=True),
+            EdgeDefinition(source_id="split_text", target_id="summarize_chunks", parallel=True),
+            EdgeDefinition(source_id="extract_keywords", target_id="combine"),
+            EdgeDefinition(source_id="summarize_chunks", target_id="merge_summaries"),
+            EdgeDefinition(source_id="merge_summaries", target_id="refine_final_summary"),
+            EdgeDefinition(
+                source_id="refine_final_summary",
+                target_id="refine_final_summary",
+                condition_name="summary_length_above_limit",
+                loop=True
+            ),
+            EdgeDefinition(source_id="refine_final_summary", target_id="combine")
+        ]
+    )
@@ -0,0 +1,301 @@
+"""Micro-benchmarks for the workflow engine and the summarization tools.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_engine                         # default sizes
+    python -m benchmarks.bench_engine --sizes 1KB,1MB,100MB   # pick text sizes
+    python -m benchmarks.bench_engine --save benchmarks/baseline.json
+    python -m benchmarks.bench_engine --baseline benchmarks/baseline.json --fail-on-regression
+
+Each case is timed over --repeat runs (best time is reported) and then run once
+more under tracemalloc for peak memory. With --baseline, cases slower than the
+baseline by more than --tolerance are flagged as regressions.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from app.compiler import compile_graph
+from app.engine import WorkflowEngine
+from app.executors import run_map, shutdown_pools
+from app.models.api_models import GraphDefinition, NodeDefinition, EdgeDefinition
+from app.registry import (
+    ToolRegistry, split_text_to_chunks, summarize_chunk_rule_based, summarize_text_rule_based,
+    merge_summaries, refine_summary, summarize_chunks_tfidf
+)
+from app.run_store import get_plan
+from app.tfidf import np
+from app.workflows.summarization_workflow import create_summarization_workflow
+
+SIZE_UNITS = {"KB": 1024, "MB": 1024 * 1024}
+DEFAULT_SIZES = "1KB,100KB,1MB,10MB"
+
+
+@ToolRegistry.register_tool()
+def bench_increment(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {"counter": state.get("counter", 0) + 1}
+
+
+@ToolRegistry.register_condition()
+def bench_below_target(state: Dict[str, Any]) -> bool:
+    return state.get("counter", 0) < state.get("target", 0)
+
+
+@ToolRegistry.register_condition()
+def bench_never(state: Dict[str, Any]) -> bool:
+    return False
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper()
+    for unit, factor in SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def make_text(size: int) -> str:
+    sentences = [
+        "The quick brown fox jumps over the lazy dog. ",
+        "Workflow engines move state between small tools. ",
+        "Summaries should keep the first idea of every chunk! ",
+        "Is this sentence long enough to matter? ",
+    ]
+    block = "".join(sentences)
+    return (block * (size // len(block) + 1))[:size]
+
+
+# Synthetic graphs
+
+def chain_graph(length: int) -> GraphDefinition:
+    nodes = [NodeDefinition(id=f"n{i}", action_name="bench_increment") for i in range(length)]
+    edges = [EdgeDefinition(source_id=f"n{i}", target_id=f"n{i + 1}") for i in range(length - 1)]
+    return GraphDefinition(id=f"bench_chain_{length}", start_node_id="n0", nodes=nodes, edges=edges)
+
+
+def branching_graph(width: int) -> GraphDefinition:
+    # Every step evaluates `width` failing conditions before the fallback edge.
+    nodes = [NodeDefinition(id="hub", action_name="bench_increment")]
+    nodes += [NodeDefinition(id=f"b{i}", action_name="bench_increment") for i in range(width)]
+    edges = [EdgeDefinition(source_id="hub", target_id=f"b{i}", condition_name="bench_never") for i in range(width)]
+    edges.append(EdgeDefinition(source_id="hub", target_id="hub", condition_name="bench_below_target"))
+    return GraphDefinition(id=f"bench_branching_{width}", start_node_id="hub", nodes=nodes, edges=edges)
+
+
+def self_loop_graph() -> GraphDefinition:
+    return GraphDefinition(
+        id="bench_self_loop",
+        start_node_id="loop",
+        nodes=[NodeDefinition(id="loop", action_name="bench_increment")],
+        edges=[EdgeDefinition(source_id="loop", target_id="loop", condition_name="bench_below_target", loop=True)]
+    )
+
+
+# Cases
+
+class Case:
+    def __init__(self, name: str, func: Callable[[], Any], units: float = 1.0, unit_name: str = "ops",
+                 node_latency: bool = False):
+        self.name = name
+        self.func = func
+        self.units = units
+        self.unit_name = unit_name
+        self.node_latency = node_latency
+
+
+def engine_case(name: str, graph: GraphDefinition, initial_state: Dict[str, Any], config: Dict[str, Any],
+                units: float = 1.0, unit_name: str = "runs") -> Case:
+    plan = get_plan(graph.id, graph.version) or compile_graph(graph)
+
+    def run():
+        return asyncio.run(WorkflowEngine(plan).run_sync(initial_state, config))
+
+    return Case(name, run, units, unit_name, node_latency=True)
+
+
+def tool_cases(size: int, label: str) -> List[Case]:
+    text = make_text(size)
+    sentence_config = {"max_chunk_chars": 1000, "sentence_aware": True}
+    chunks = split_text_to_chunks({"text": text, "_node_config": sentence_config})["chunks"]
+    summaries = summarize_chunk_rule_based({"chunks": chunks})["summaries"]
+    merged = merge_summaries({"summaries": summaries})["merged_summary"]
+    mb = size / SIZE_UNITS["MB"]
+
+    def map_summaries(policy: str):
+        return lambda: asyncio.run(run_map(summarize_text_rule_based, policy, False, chunks, {}, 8, 64))
+
+    cases = [
+        Case(f"tool.split_fixed[{label}]", lambda: split_text_to_chunks(
+            {"text": text, "_node_config": {"max_chunk_chars": 1000}}), mb, "MB"),
+        Case(f"tool.split_sentence[{label}]", lambda: split_text_to_chunks(
+            {"text": text, "_node_config": sentence_config}), mb, "MB"),
+        Case(f"tool.summarize_chunks[{label}]", lambda: summarize_chunk_rule_based({"chunks": chunks}), mb, "MB"),
+        Case(f"tool.summarize_map_inline[{label}]", map_summaries("inline"), mb, "MB"),
+        Case(f"tool.summarize_map_process[{label}]", map_summaries("process"), mb, "MB"),
+        Case(f"tool.merge_summaries[{label}]", lambda: merge_summaries({"summaries": summaries}), mb, "MB"),
+        Case(f"tool.refine_iterative[{label}]", lambda: refine_summary(
+            {"merged_summary": merged, "max_length": 200, "_node_config": {}}), mb, "MB"),
+        Case(f"tool.refine_single_pass[{label}]", lambda: refine_summary(
+            {"merged_summary": merged, "max_length": 200, "_node_config": {"mode": "single_pass"}}), mb, "MB"),
+    ]
+    if np is not None:
+        cases.append(Case(f"tool.summarize_tfidf[{label}]", lambda: summarize_chunks_tfidf(
+            {"chunks": chunks, "_node_config": {"max_chars": 200}}), mb, "MB"))
+    return cases
+
+
+def workflow_case(size: int, label: str) -> Case:
+    text = make_text(size)
+    graph = create_summarization_workflow()
+    # Keep chunk counts sane for large inputs; the cache would turn repeats into hits.
+    graph.nodes[0].config = {"max_chunk_chars": max(50, size // 2000), "sentence_aware": True}
+    graph.id = "bench_summarization"
+    for node in graph.nodes:
+        if node.id == "summarize_chunks":
+            node.batch_size = 64
+    plan = compile_graph(graph)
+    for node in plan.nodes.values():
+        node.cache = False
+
+    def run():
+        return asyncio.run(WorkflowEngine(plan).run_sync({"text": text, "max_length": 200}, {}))
+
+    return Case(f"workflow.summarization[{label}]", run, size / SIZE_UNITS["MB"], "MB", node_latency=True)
+
+
+def engine_cases() -> List[Case]:
+    loop_state = {"counter": 0, "target": 5000}
+    return [
+        engine_case("engine.chain[100]", chain_graph(100), {}, {"max_iterations": 1000}, 100, "nodes"),
+        engine_case("engine.chain[1000]", chain_graph(1000), {}, {"max_iterations": 10000}, 1000, "nodes"),
+        engine_case("engine.branching[64]", branching_graph(64), {"counter": 0, "target": 200},
+                    {"max_iterations": 1000}, 200, "nodes"),
+        engine_case("engine.self_loop_fused[5000]", self_loop_graph(), loop_state,
+                    {"max_iterations": 10000}, 5000, "iterations"),
+        engine_case("engine.self_loop_stepped[5000]", self_loop_graph(), loop_state,
+                    {"max_iterations": 10000, "fuse_loops": False}, 5000, "iterations"),
+    ]
+
+
+# Measurement
+
+def node_latencies(run: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    """Mean seconds per node id, from the run's execution log."""
+    per_node: Dict[str, List[float]] = {}
+    for entry in (run or {}).get("execution_log", []):
+        duration = (entry["end_ts"] - entry["start_ts"]).total_seconds() / entry.get("iterations", 1)
+        per_node.setdefault(entry["node_id"], []).append(duration)
+    return {node_id: statistics.mean(values) for node_id, values in per_node.items()}
+
+
+def measure(case: Case, repeat: int) -> Dict[str, Any]:
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = case.func()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    case.func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings)
+    measurement = {
+        "seconds": best,
+        "median_seconds": statistics.median(timings),
+        "throughput": case.units / best if best > 0 else None,
+        "unit": f"{case.unit_name}/s",
+        "peak_bytes": peak,
+    }
+    if case.node_latency:
+        measurement["node_latency_seconds"] = node_latencies(result)
+    return measurement
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            tolerance: float) -> List[str]:
+    regressions = []
+    for name, measurement in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = measurement["seconds"] / base["seconds"] if base["seconds"] else 1.0
+        measurement["vs_baseline"] = round(ratio, 3)
+        if ratio > 1.0 + tolerance:
+            regressions.append(f"{name}: {ratio:.2f}x slower ({base['seconds']:.6f}s -> {measurement['seconds']:.6f}s)")
+        memory_ratio = measurement["peak_bytes"] / base["peak_bytes"] if base.get("peak_bytes") else 1.0
+        if memory_ratio > 1.0 + tolerance:
+            regressions.append(f"{name}: {memory_ratio:.2f}x more peak memory")
+    return regressions
+
+
+def print_table(results: Dict[str, Dict[str, Any]]):
+    print(f"{'case':48} {'best s':>12} {'throughput':>24} {'peak MB':>10} {'vs base':>8}")
+    for name, m in results.items():
+        throughput = f"{m['throughput']:.1f} {m['unit']}" if m["throughput"] else "-"
+        vs = f"{m['vs_baseline']:.2f}x" if "vs_baseline" in m else ""
+        print(f"{name:48} {m['seconds']:12.6f} {throughput:>24} {m['peak_bytes'] / 1e6:10.2f} {vs:>8}")
+        for node_id, latency in m.get("node_latency_seconds", {}).items():
+            if len(m["node_latency_seconds"]) <= 8:
+                print(f"    {node_id:44} {latency:12.6f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated text sizes, e.g. 1KB,1MB,100MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this string")
+    parser.add_argument("--save", help="write results as a baseline JSON file")
+    parser.add_argument("--baseline", help="compare against a saved baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    # Engine logging per node would dominate the engine micro-benchmarks.
+    import logging
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    cases = engine_cases()
+    for label in args.sizes.split(","):
+        size = parse_size(label)
+        cases.extend(tool_cases(size, label.strip()))
+        cases.append(workflow_case(size, label.strip()))
+    cases = [case for case in cases if args.filter in case.name]
+
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        for case in cases:
+            results[case.name] = measure(case, args.repeat)
+            print(f"  {case.name}: {results[case.name]['seconds']:.6f}s", file=sys.stderr)
+    finally:
+        shutdown_pools()
+
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+
+    print_table(results)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, f, indent=2)
+    if regressions:
+        print("\nRegressions:")
+        for line in regressions:
+            print(f"  {line}")
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""End-to-end load test of the HTTP API (app.main).
+
+Run from the repository root:
+
+    python -m benchmarks.load_test                                  # in-process, 30s closed loop
+    python -m benchmarks.load_test --rate 50 --concurrency 64 --duration 60
+    python -m benchmarks.load_test --mix sync=1,async=2,state=7 --sizes 1KB:0.8,100KB:0.2
+    python -m benchmarks.load_test --uvicorn --save benchmarks/load_baseline.json
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --baseline benchmarks/load_baseline.json
+
+Requests are drawn from --mix: "sync" runs (POST /graph/run, run_mode sync),
+"async" runs (run_mode async) and "state" polls (GET /graph/state of a recent
+async run, fields=status). Documents are drawn from the --sizes distribution.
+
+With --rate, arrivals are open-loop (Poisson, at most --concurrency in flight) and
+latency is measured from the scheduled arrival, so time spent waiting for a free
+slot counts. Without it, --concurrency clients send requests back to back.
+
+The app runs in this process by default (httpx ASGI transport), where event-loop
+lag is the server's own. With --uvicorn (a local server started here) or --url it
+is the load generator's loop, i.e. a sign the generator itself is saturated.
+Store and cache sizes are sampled from /metrics, resident memory from /proc (n/a
+with --url: the server's memory is not visible from here).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.bench_engine import make_text, parse_size
+
+ENDPOINTS = ("sync", "async", "state")
+DEFAULT_MIX = "sync=2,async=3,state=5"
+DEFAULT_SIZES = "1KB:0.6,10KB:0.3,100KB:0.1"
+# /metrics samples tracked over the run, and the names they are reported under.
+TRACKED_METRICS = {
+    "workflow_store_resident_runs": "store_resident_runs",
+    "workflow_cache_bytes": "cache_bytes",
+    "workflow_blob_mapped_bytes": "blob_mapped_bytes",
+    "workflow_queue_depth": "queue_depth",
+}
+
+
+def parse_weights(text: str, parse_key=str) -> List[Tuple[Any, float]]:
+    """"a=1,b=3" (or "1KB:0.6,...") as [(key, weight), ...]."""
+    weights = []
+    for part in text.split(","):
+        key, _, weight = part.replace(":", "=").partition("=")
+        weights.append((parse_key(key.strip()), float(weight or 1)))
+    return weights
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def rss_bytes(pid: Optional[int]) -> Optional[int]:
+    if pid is None:
+        return None # a remote server
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None # not Linux
+
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    values = {}
+    for line in text.splitlines():
+        name, _, value = line.partition(" ")
+        if name in TRACKED_METRICS:
+            values[TRACKED_METRICS[name]] = float(value)
+    return values
+
+
+# Targets
+
+@asynccontextmanager
+async def in_process_client() -> AsyncIterator[Tuple[httpx.AsyncClient, Optional[int]]]:
+    from app.main import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as client:
+            yield client, os.getpid()
+
+
+@asynccontextmanager
+async def uvicorn_client(port: int) -> AsyncIterator[Tuple[httpx.AsyncClient, Optional[int]]]:
+    if not port:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+                               "--log-level", "warning"])
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+            for _ in range(200):
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    if server.poll() is not None:
+                        raise SystemExit("uvicorn exited before accepting requests")
+                    await asyncio.sleep(0.05)
+            yield client, server.pid
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+@asynccontextmanager
+async def url_client(url: str) -> AsyncIterator[Tuple[httpx.AsyncClient, Optional[int]]]:
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        yield client, None
+
+
+# Load generation
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace, server_pid: Optional[int]):
+        self.client = client
+        self.args = args
+        self.server_pid = server_pid
+        self.rng = random.Random(args.seed)
+        mix = parse_weights(args.mix)
+        unknown = {name for name, _ in mix} - set(ENDPOINTS)
+        if unknown:
+            raise SystemExit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+        self.endpoints, self.endpoint_weights = zip(*mix)
+        sizes = parse_weights(args.sizes, parse_size)
+        self.documents = {size: make_text(size) for size, _ in sizes}
+        self.sizes, self.size_weights = zip(*sizes)
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.statuses: Dict[str, Dict[int, int]] = {name: {} for name in ENDPOINTS}
+        self.run_ids: List[str] = []
+        self.loop_lag: List[float] = []
+        self.samples: List[Dict[str, Any]] = []
+
+    def _document(self) -> Dict[str, Any]:
+        size = self.rng.choices(self.sizes, self.size_weights)[0]
+        # A varying prefix keeps the node cache from turning repeated documents into hits.
+        return {"text": f"Request {self.rng.random()}. " + self.documents[size], "max_length": 200}
+
+    async def request(self, endpoint: str, scheduled: float):
+        if endpoint == "state" and not self.run_ids:
+            endpoint = "async" # nothing to poll yet
+        if endpoint == "state":
+            run_id = self.rng.choice(self.run_ids[-100:])
+            response = await self.client.get(f"/graph/state/{run_id}", params={"fields": "status"})
+        else:
+            response = await self.client.post("/graph/run", json={
+                "graph_id": self.args.graph, "run_mode": endpoint, "initial_state": self._document()
+            })
+            if endpoint == "async" and response.status_code == 200:
+                self.run_ids.append(response.json()["run_id"])
+        self.latencies[endpoint].append(time.perf_counter() - scheduled)
+        codes = self.statuses[endpoint]
+        codes[response.status_code] = codes.get(response.status_code, 0) + 1
+
+    async def _send(self, endpoint: str, scheduled: float, slots: asyncio.Semaphore):
+        async with slots:
+            try:
+                await self.request(endpoint, scheduled)
+            except httpx.HTTPError as e:
+                self.statuses[endpoint][-1] = self.statuses[endpoint].get(-1, 0) + 1
+                print(f"  {endpoint}: {e!r}", file=sys.stderr)
+
+    async def open_loop(self, end: float):
+        slots = asyncio.Semaphore(self.args.concurrency)
+        tasks = set()
+        scheduled = time.perf_counter()
+        while scheduled < end:
+            scheduled += self.rng.expovariate(self.args.rate)
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            endpoint = self.rng.choices(self.endpoints, self.endpoint_weights)[0]
+            task = asyncio.create_task(self._send(endpoint, scheduled, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+
+    async def closed_loop(self, end: float):
+        slots = asyncio.Semaphore(self.args.concurrency)
+
+        async def client_loop():
+            while time.perf_counter() < end:
+                endpoint = self.rng.choices(self.endpoints, self.endpoint_weights)[0]
+                await self._send(endpoint, time.perf_counter(), slots)
+
+        await asyncio.gather(*(client_loop() for _ in range(self.args.concurrency)))
+
+    async def monitor_loop_lag(self, interval: float = 0.05):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(time.perf_counter() - started - interval)
+
+    async def sample(self, started: float):
+        try:
+            metrics = parse_metrics((await self.client.get("/metrics")).text)
+        except httpx.HTTPError:
+            metrics = {}
+        self.samples.append({"t": round(time.perf_counter() - started, 3), "rss_bytes": rss_bytes(self.server_pid),
+                             **metrics})
+
+    async def monitor_memory(self, started: float):
+        while True:
+            await self.sample(started)
+            await asyncio.sleep(self.args.sample_interval)
+
+    async def run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        monitors = [asyncio.create_task(self.monitor_loop_lag()), asyncio.create_task(self.monitor_memory(started))]
+        try:
+            end = started + self.args.duration
+            await (self.open_loop(end) if self.args.rate else self.closed_loop(end))
+            elapsed = time.perf_counter() - started
+        finally:
+            for monitor in monitors:
+                monitor.cancel()
+            await asyncio.gather(*monitors, return_exceptions=True)
+        await self.sample(started)
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        endpoints = {}
+        for name in ENDPOINTS:
+            latencies = self.latencies[name]
+            if not latencies:
+                continue
+            codes = self.statuses[name]
+            endpoints[name] = {
+                "requests": len(latencies),
+                "throughput": len(latencies) / elapsed,
+                "errors": sum(count for code, count in codes.items() if not 200 <= code < 300),
+                "status_codes": {str(code): count for code, count in sorted(codes.items())},
+                "mean_seconds": statistics.mean(latencies),
+                "p50_seconds": percentile(latencies, 0.50),
+                "p95_seconds": percentile(latencies, 0.95),
+                "p99_seconds": percentile(latencies, 0.99),
+                "max_seconds": max(latencies),
+            }
+        first, last = self.samples[0], self.samples[-1]
+        return {
+            "seconds": elapsed,
+            "throughput": sum(m["requests"] for m in endpoints.values()) / elapsed,
+            "endpoints": endpoints,
+            "loop_lag": {
+                "source": "server" if self.args.target == "in-process" else "load generator",
+                "p50_seconds": percentile(self.loop_lag, 0.50),
+                "p99_seconds": percentile(self.loop_lag, 0.99),
+                "max_seconds": max(self.loop_lag, default=None),
+            },
+            "growth": {key: last[key] - first[key] for key in last
+                              if key != "t" and first.get(key) is not None and last[key] is not None},
+            "memory_samples": self.samples,
+        }
+
+
+# Reporting
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for name, measurement in result["endpoints"].items():
+        base = baseline["endpoints"].get(name)
+        if not base:
+            continue
+        for key in ("p50_seconds", "p95_seconds", "p99_seconds"):
+            ratio = measurement[key] / base[key] if base[key] else 1.0
+            measurement.setdefault("vs_baseline", {})[key] = round(ratio, 3)
+            if ratio > 1.0 + tolerance:
+                regressions.append(f"{name} {key[:3]}: {ratio:.2f}x slower ({base[key]:.4f}s -> {measurement[key]:.4f}s)")
+    ratio = result["throughput"] / baseline["throughput"] if baseline["throughput"] else 1.0
+    if ratio < 1.0 - tolerance:
+        regressions.append(f"throughput: {ratio:.2f}x ({baseline['throughput']:.1f} -> {result['throughput']:.1f} req/s)")
+    return regressions
+
+
+def print_report(result: Dict[str, Any]):
+    print(f"{'endpoint':10} {'requests':>9} {'req/s':>9} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, m in result["endpoints"].items():
+        print(f"{name:10} {m['requests']:9} {m['throughput']:9.1f} {m['errors']:7} "
+              f"{m['p50_seconds'] * 1e3:9.1f} {m['p95_seconds'] * 1e3:9.1f} {m['p99_seconds'] * 1e3:9.1f}")
+    print(f"{'total':10} {'':9} {result['throughput']:9.1f}")
+    lag = result["loop_lag"]
+    if lag["max_seconds"] is not None:
+        print(f"\nEvent-loop lag ({lag['source']}): p50 {lag['p50_seconds'] * 1e3:.1f} ms, "
+              f"p99 {lag['p99_seconds'] * 1e3:.1f} ms, max {lag['max_seconds'] * 1e3:.1f} ms")
+    growth = [f"{key} {value / 1e6:+.1f} MB" if key.endswith("bytes") else f"{key} {value:+.0f}"
+              for key, value in result["growth"].items()]
+    if "rss_bytes" not in result["growth"]:
+        growth.append("rss_bytes n/a")
+    print("Growth over the run: " + ", ".join(growth))
+
+
+async def _main(args: argparse.Namespace) -> Dict[str, Any]:
+    if args.url:
+        target = url_client(args.url)
+    elif args.uvicorn:
+        target = uvicorn_client(args.port)
+    else:
+        target = in_process_client()
+    async with target as (client, server_pid):
+        return await LoadTest(client, args, server_pid).run()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="load an already running server")
+    parser.add_argument("--uvicorn", action="store_true", help="start a local uvicorn server and load it")
+    parser.add_argument("--port", type=int, default=0, help="port for --uvicorn (default: a free one)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to generate load for")
+    parser.add_argument("--rate", type=float, default=0.0, help="open-loop arrivals per second (0: closed loop)")
+    parser.add_argument("--concurrency", type=int, default=16, help="maximum requests in flight")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="relative weights of sync, async and state requests")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="document sizes and their weights, e.g. 1KB:0.9,1MB:0.1")
+    parser.add_argument("--graph", default="summarization_workflow")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between memory samples")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write results as a baseline JSON file")
+    parser.add_argument("--baseline", help="compare against a saved baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+    args.target = args.url or ("uvicorn" if args.uvicorn else "in-process")
+
+    # Engine logging per node (and httpx logging per request) would dominate in-process runs.
+    import logging
+    logging.getLogger("app").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    result = asyncio.run(_main(args))
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline["results"], args.tolerance)
+        changed = [key for key, value in baseline.get("settings", {}).items() if getattr(args, key) != value]
+        if changed:
+            print(f"Note: baseline was recorded with different {', '.join(changed)}", file=sys.stderr)
+
+    print_report(result)
+    if args.save:
+        settings = {key: getattr(args, key) for key in ("target", "duration", "rate", "concurrency", "mix", "sizes",
+                                                         "graph", "seed")}
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "settings": settings, "results": result},
+                      f, indent=2)
+    if regressions:
+        print("\nRegressions:")
+        for line in regressions:
+            print(f"  {line}")
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import pickle
+
+from fastapi.testclient import TestClient
+
+from app import blobs
+from app.blobs import BlobRef, BlobStore, configure_blob_store, get_blob_store
+from app.cache import MISSING, get_cache
+from app.engine import WorkflowEngine
+from app.executors import shutdown_pools
+from app.main import app
+from app.run_store import InMemoryRunStore, SqliteRunStore, configure_store, get_plan, get_store
+
+client = TestClient(app)
+TEXT = "Large inputs are stored once. They are split into views! Ünïcode stays intact. " * 40
+
+
+def _with_blobs(tmp_path, test, private=False):
+    previous = get_blob_store()
+    configure_blob_store(BlobStore(str(tmp_path / "blobs"), min_bytes=1000, private=private))
+    shutdown_pools()  # pool processes started from now on inherit the store
+    get_cache().clear()  # entries may hold handles into the other store
+    try:
+        test()
+    finally:
+        get_blob_store().close()
+        configure_blob_store(previous)
+        shutdown_pools()
+        get_cache().clear()
+
+
+def test_large_inputs_become_handles_and_chunks_views(tmp_path):
+    def test():
+        engine = WorkflowEngine(get_plan("keyword_summarization_workflow"))
+        run = asyncio.run(engine.run_sync({"text": TEXT, "max_length": 60}))
+        assert run["status"] == "completed", run.get("error")
+
+        text = run["initial_state"]["text"]
+        assert isinstance(text, BlobRef) and run["state"]["text"] is text
+        chunks = run["state"]["chunks"]
+        assert all(isinstance(chunk, BlobRef) and chunk.digest == text.digest for chunk in chunks)
+        assert "".join(chunk.text() for chunk in chunks) == TEXT
+        assert len(pickle.dumps(chunks[0])) < 200  # what a process pool receives per item
+
+        store = SqliteRunStore(str(tmp_path / "runs.db"))
+        store.save_run("r", run)
+        store.close()
+        reopened = SqliteRunStore(str(tmp_path / "runs.db"))
+        assert reopened.get_run("r")["state"]["chunks"] == chunks
+        reopened.close()
+
+        response = client.get(f"/graph/state/{run['run_id']}?fields=state").json()
+        assert response["state"]["text"] == TEXT
+        assert response["state"]["final_summary"] == run["state"]["final_summary"]
+
+    _with_blobs(tmp_path, test)
+
+
+def test_blob_runs_summarize_like_plain_runs(tmp_path):
+    payload = {"graph_id": "summarization_workflow", "run_mode": "sync",
+               "initial_state": {"text": TEXT, "max_length": 200}}
+    plain = client.post("/graph/run", json=payload).json()
+    results = []
+    _with_blobs(tmp_path, lambda: results.append(client.post("/graph/run", json=payload).json()))
+    assert results[0]["state"]["final_summary"] == plain["state"]["final_summary"]
+    assert results[0]["state"]["chunks"] == plain["state"]["chunks"]
+
+
+def _run(text):
+    run = asyncio.run(WorkflowEngine(get_plan("keyword_summarization_workflow")).run_sync(
+        {"text": text, "max_length": 60}))
+    assert run["status"] == "completed", run.get("error")
+    return run["initial_state"]["text"]
+
+
+def _sweep_at_once(monkeypatch):
+    monkeypatch.setitem(blobs._sweep_config, "interval_seconds", 0)
+    monkeypatch.setitem(blobs._sweep_config, "grace_seconds", 0)
+    previous = get_store()
+    configure_store(InMemoryRunStore(max_runs=1))
+    return previous
+
+
+def test_blobs_of_evicted_runs_are_unmapped_and_deleted(tmp_path, monkeypatch):
+    def test():
+        store = get_blob_store()
+        first = _run(TEXT)
+        assert first.digest in store._maps
+        get_cache().put("chunks", {"chunks": first.views(["Large inputs", " are stored once."])})
+        _run(TEXT + " Second.") # evicts the first run, but a cache entry still holds its chunks
+        assert os.path.exists(store._path(first.digest))
+
+        get_cache().clear()
+        second = _run(TEXT + " Third.") # evicts the second run
+        assert first.digest not in store._maps and not os.path.exists(store._path(first.digest))
+        assert second.text() == TEXT + " Third."
+
+        children = BlobStore(store.directory, max_maps=1) # as in pool processes
+        first, second = store.put(TEXT), store.put(TEXT + " Again.")
+        children.buffer(first.digest), children.buffer(second.digest)
+        assert list(children._maps) == [second.digest]
+        children.close()
+
+    previous = _sweep_at_once(monkeypatch)
+    try:
+        _with_blobs(tmp_path, test, private=True)
+    finally:
+        configure_store(previous)
+    assert not os.path.exists(tmp_path / "blobs") # removed with the private store
+
+
+def test_shared_blob_directories_are_only_swept_against_a_shared_store(tmp_path, monkeypatch):
+    def test():
+        store = get_blob_store()
+        first = _run(TEXT)
+        get_cache().clear()
+        _run(TEXT + " Second.") # evicts the first run from this process' store
+        # Another process sharing the directory may still reference it: unmapped, not deleted.
+        assert first.digest not in store._maps and os.path.exists(store._path(first.digest))
+
+        get_cache().put("key", {"text": first})
+        os.remove(store._path(first.digest)) # deleted by another process' sweep
+        assert get_cache().get("key") is MISSING and "key" not in get_cache()._entries
+
+    previous = _sweep_at_once(monkeypatch)
+    try:
+        _with_blobs(tmp_path, test)
+    finally:
+        configure_store(previous)
@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+import pytest
+
+from app.compiler import GraphCompilationError, compile_graph
+from app.engine import WorkflowEngine
+from app.executors import THREAD
+from app.models.api_models import GraphDefinition, NodeDefinition, EdgeDefinition
+from app.registry import ToolRegistry
+from app.state import materialize_log
+
+
+@ToolRegistry.register_tool(policy=THREAD)
+def slow_tag(state):
+    time.sleep(0.2)
+    tag = state["_node_config"]["tag"]
+    return {"tags": [tag], "owner": tag, tag: True}
+
+
+def _node(node_id, **kwargs):
+    return NodeDefinition(id=node_id, action_name="slow_tag", config={"tag": node_id}, **kwargs)
+
+
+def _run(nodes, edges, merge=None, start="start"):
+    nodes = nodes + [NodeDefinition(id="join", action_name="passthrough", type="join", merge=merge or {})]
+    plan = compile_graph(GraphDefinition(id="branches", start_node_id=start, nodes=nodes, edges=edges))
+    return asyncio.run(WorkflowEngine(plan).run_sync({}, {}))
+
+
+def _fan(source, targets):
+    return [EdgeDefinition(source_id=source, target_id=target, parallel=True) for target in targets]
+
+
+def test_branches_run_concurrently_and_merge_at_join():
+    started = time.perf_counter()
+    run = _run(
+        [NodeDefinition(id="start", action_name="passthrough"), _node("a"), _node("b"), _node("c")],
+        _fan("start", ["a", "b", "c"]) + [EdgeDefinition(source_id=n, target_id="join") for n in "abc"],
+        merge={"tags": "extend"}
+    )
+    elapsed = time.perf_counter() - started
+
+    assert run["status"] == "completed", run.get("error")
+    assert elapsed < 0.5  # critical path is one 0.2s node, not three
+    state = run["state"]
+    assert state["tags"] == ["a", "b", "c"]  # branch (edge) order, not finish order
+    assert state["owner"] == "c"  # default rule: last branch wins
+    assert state["a"] and state["b"] and state["c"]
+    assert {entry["branch"] for entry in run["execution_log"] if entry["node_id"] in "abc"} == {"0", "1", "2"}
+    # Replaying the logged deltas reproduces the merged state.
+    assert materialize_log(run["initial_state"], run["execution_log"])[-1]["state_snapshot"] == state
+
+
+def test_nested_fan_out_joins_inside_branch():
+    run = _run(
+        [NodeDefinition(id="start", action_name="passthrough"), _node("a"), _node("b"), _node("b1"), _node("b2"),
+         NodeDefinition(id="inner", action_name="passthrough", type="join", merge={"tags": "extend"})],
+        _fan("start", ["a", "b"]) + _fan("b", ["b1", "b2"]) + [
+            EdgeDefinition(source_id="b1", target_id="inner"),
+            EdgeDefinition(source_id="b2", target_id="inner"),
+            EdgeDefinition(source_id="inner", target_id="join"),
+            EdgeDefinition(source_id="a", target_id="join"),
+        ],
+        merge={"tags": "list"}
+    )
+    assert run["status"] == "completed", run.get("error")
+    assert run["state"]["tags"] == [["a"], ["b1", "b2"]]
+    assert {entry["branch"] for entry in run["execution_log"] if entry["node_id"] in ("b1", "b2")} == {"1.0", "1.1"}
+
+
+def test_conflicting_branches_fail_with_error_rule():
+    run = _run(
+        [NodeDefinition(id="start", action_name="passthrough"), _node("a"), _node("b")],
+        _fan("start", ["a", "b"]) + [EdgeDefinition(source_id=n, target_id="join") for n in "ab"],
+        merge={"owner": "error"}
+    )
+    assert run["status"] == "failed"
+    assert "owner" in run["error"]
+
+
+def test_rejects_mixed_parallel_and_sequential_edges():
+    with pytest.raises(GraphCompilationError, match="mixes parallel"):
+        compile_graph(GraphDefinition(
+            id="mixed", start_node_id="start",
+            nodes=[NodeDefinition(id="start", action_name="passthrough"), _node("a"), _node("b")],
+            edges=[EdgeDefinition(source_id="start", target_id="a", parallel=True),
+                   EdgeDefinition(source_id="start", target_id="b")]
+        ))
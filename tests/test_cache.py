@@ -0,0 +1,91 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.cache import MISSING, NodeCache, cache_key
+from app.compiler import GraphCompilationError
+from app.main import app
+from app.registry import ToolRegistry
+from app.run_store import save_graph
+from app.workflows.summarization_workflow import create_summarization_workflow
+
+client = TestClient(app)
+
+
+def cached(graph):
+    """graph with the node cache switched on for every node whose tool declares its reads."""
+    graph = graph.model_copy(deep=True)
+    graph.id = f"cached_{graph.id}"
+    for node in graph.nodes:
+        if ToolRegistry.get_tool_options(node.action_name)["reads"] is not None:
+            node.config["cache"] = True
+    return graph
+
+
+def test_node_cache_evicts_least_recently_used_by_bytes():
+    cache = NodeCache(max_bytes=300)
+    cache.put("a", "x" * 100)
+    cache.put("b", "y" * 100)
+    assert cache.get("a") == "x" * 100  # a is now most recent
+    cache.put("c", "z" * 100)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == "x" * 100
+    assert cache.size_bytes <= 300
+
+
+def test_node_cache_disk_tier_survives_memory_eviction(tmp_path):
+    cache = NodeCache(max_bytes=10_000, disk_dir=str(tmp_path))
+    key = cache_key("tool", {"k": 1}, [("text", "hello")])
+    cache.put(key, {"chunks": ["hello"]})
+    cache.clear()
+
+    assert cache.get(key) == {"chunks": ["hello"]}
+    assert key != cache_key("tool", {"k": 2}, [("text", "hello")])
+
+
+def test_node_cache_disk_tier_is_bounded_by_bytes(tmp_path):
+    cache = NodeCache(max_bytes=10_000, disk_dir=str(tmp_path), disk_max_bytes=2_500)
+    for key in ("a", "b", "c"):
+        cache.put(key, key * 1000)
+    cache.flush()
+    cache.clear()
+
+    assert cache.stats()["disk_bytes"] <= 2_500
+    assert cache.get("a") is MISSING  # the oldest file was deleted
+    assert cache.get("c") == "c" * 1000
+    assert cache.stats()["disk_entries"] == 2
+
+    reopened = NodeCache(disk_dir=str(tmp_path))  # another process sharing the directory
+    assert reopened.get("b") == "b" * 1000
+
+def test_repeat_document_is_served_from_cache():
+    save_graph(cached(create_summarization_workflow()))
+    payload = {
+        "graph_id": "cached_summarization_workflow",
+        "initial_state": {"text": "Cache me if you can. Another line here. " * 10, "max_length": 45},
+        "run_mode": "sync"
+    }
+    first = client.post("/graph/run", json=payload).json()
+    second = client.post("/graph/run", json=payload).json()
+
+    assert second["state"]["final_summary"] == first["state"]["final_summary"]
+    hits = {entry["node_id"]: entry["cache_hits"] for entry in second["execution_log"]}
+    assert hits["split_text"] == 1
+    assert hits["summarize_chunks"] == len(second["state"]["chunks"])
+    assert hits["merge_summaries"] == 1
+
+
+def test_nodes_opt_into_the_cache():
+    payload = {
+        "graph_id": "summarization_workflow",
+        "initial_state": {"text": "Not cached by default. Another line here. " * 10, "max_length": 45},
+        "run_mode": "sync"
+    }
+    client.post("/graph/run", json=payload)
+    second = client.post("/graph/run", json=payload).json()
+    assert not any(entry.get("cache_hits") for entry in second["execution_log"])
+
+    graph = create_summarization_workflow()
+    graph.nodes[-1].config["cache"] = True # refine_final_summary's tool does not declare its reads
+    with pytest.raises(GraphCompilationError, match="does not declare its reads"):
+        save_graph(graph)
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from app.engine import _executions, cancel_run, run_batch
+from app.job_queue import SqliteJobQueue
+from app.main import app
+from app.models.api_models import GraphDefinition, NodeDefinition, EdgeDefinition
+from app.registry import ToolRegistry
+from app.metrics import RUNS_TOTAL
+from app.run_store import get_plan, get_run, save_graph
+
+client = TestClient(app)
+
+
+@ToolRegistry.register_tool()
+async def sleep_for(state):
+    await asyncio.sleep(state.get("sleep", 0))
+    return {"slept": state.get("slept", 0) + 1}
+
+
+def _save_sleepy(graph_id, timeout_s=None):
+    config = {"timeout_s": timeout_s} if timeout_s else {}
+    save_graph(GraphDefinition(
+        id=graph_id,
+        start_node_id="first",
+        nodes=[NodeDefinition(id="first", action_name="sleep_for"),
+               NodeDefinition(id="second", action_name="sleep_for", config=config)],
+        edges=[EdgeDefinition(source_id="first", target_id="second")]
+    ))
+
+
+def test_node_timeout_and_run_deadline_fail_the_run():
+    _save_sleepy("sleepy_timeout", timeout_s=0.05)
+    data = client.post("/graph/run", json={
+        "graph_id": "sleepy_timeout", "run_mode": "sync", "initial_state": {"sleep": 0.5}
+    }).json()
+    assert data["status"] == "failed"
+    assert "Node second timed out after 0.05s" in data["error"]
+
+    _save_sleepy("sleepy_deadline")
+    data = client.post("/graph/run", json={
+        "graph_id": "sleepy_deadline", "run_mode": "sync", "initial_state": {"sleep": 0.2}, "config": {"deadline_s": 0.3}
+    }).json()
+    assert data["status"] == "failed"
+    assert "deadline" in data["error"]
+    assert data["state"]["slept"] == 1  # the first node finished within the deadline
+
+    response = client.post("/graph/run", json={"graph_id": "sleepy_deadline", "config": {"deadline_s": -1}})
+    assert response.status_code == 400
+    response = client.post("/graph/run/batch", json={
+        "graph_id": "sleepy_deadline", "initial_states": [{}], "config": {"deadline_s": "x"}
+    })
+    assert response.status_code == 400
+
+
+def test_delete_cancels_a_running_run():
+    _save_sleepy("sleepy_cancel")
+    with TestClient(app) as live:  # keeps one event loop alive for the background run
+        run_id = live.post("/graph/run", json={
+            "graph_id": "sleepy_cancel", "run_mode": "async", "initial_state": {"sleep": 30}
+        }).json()["run_id"]
+        while get_run(run_id)["status"] != "running":
+            time.sleep(0.01)
+
+        response = live.delete(f"/graph/run/{run_id}")
+        assert response.status_code == 200
+        assert response.json()["status"] == "cancelled"
+        assert get_run(run_id)["status"] == "cancelled"
+        assert live.delete(f"/graph/run/{run_id}").status_code == 409
+        assert live.delete("/graph/run/missing").status_code == 404
+
+
+def test_cancelled_batch_run_leaves_the_batch():
+    _save_sleepy("sleepy_batch")
+    before = RUNS_TOTAL.get(("sleepy_batch", "completed"))
+
+    async def drive():
+        batch = asyncio.create_task(run_batch(get_plan("sleepy_batch"), [{"sleep": 0.2}, {"sleep": 0.2}]))
+        await asyncio.sleep(0.05)
+        run_id = next(iter(_executions))
+        assert await cancel_run(get_run(run_id)) == "cancelled"
+        return run_id, await batch
+
+    run_id, runs = asyncio.run(drive())
+    statuses = {run["run_id"]: run["status"] for run in runs}
+    assert statuses.pop(run_id) == "cancelled"
+    assert list(statuses.values()) == ["completed"]
+    assert [entry["node_id"] for entry in get_run(run_id)["execution_log"]] == []  # never finished "first"
+    assert RUNS_TOTAL.get(("sleepy_batch", "completed")) == before + 1
+
+
+def test_job_queue_cancel_drops_queued_jobs_and_flags_claimed_ones(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue("waiting")
+    queue.enqueue("working", priority=1)
+    job = queue.claim("w1")
+
+    assert queue.cancel("waiting") is False  # never started: nothing left to stop
+    assert queue.depth() == 0
+    assert queue.cancel("working") is True
+    assert queue.heartbeat([job["job_id"]]) == [job["job_id"]]
+    queue.close()
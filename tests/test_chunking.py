@@ -0,0 +1,12 @@
+from app.chunking import iter_sentence_chunks
+
+
+def test_chunks_follow_sentence_boundaries_regardless_of_piece_size():
+    text = "Short one. " * 30 + "x" * 130 + ". Last sentence!"
+    whole = list(iter_sentence_chunks([text], 50))
+    pieces = list(iter_sentence_chunks([text[i:i + 7] for i in range(0, len(text), 7)], 50))
+
+    assert whole == pieces
+    assert "".join(whole) == text
+    assert all(len(chunk) <= 50 for chunk in whole)
+    assert whole[0] == "Short one. " * 4
@@ -0,0 +1,67 @@
+import asyncio
+import random
+
+from app.compiler import compile_graph
+from app.engine import WorkflowEngine
+from app.models.api_models import GraphDefinition, NodeDefinition, EdgeDefinition
+from app.registry import ToolRegistry, refine_summary, summary_length_above_limit
+
+
+@ToolRegistry.register_tool()
+def decrement_counter(state):
+    return {"counter": state["counter"] - 1, "visits": state.get("visits", 0) + 1}
+
+
+@ToolRegistry.register_condition()
+def counter_positive(state):
+    return state["counter"] > 0
+
+
+def _countdown_plan():
+    return compile_graph(GraphDefinition(
+        id="countdown",
+        start_node_id="tick",
+        nodes=[NodeDefinition(id="tick", action_name="decrement_counter")],
+        edges=[EdgeDefinition(source_id="tick", target_id="tick", condition_name="counter_positive", loop=True)]
+    ))
+
+
+def _run(initial_state, config):
+    engine = WorkflowEngine(_countdown_plan())
+    return asyncio.run(engine.run_sync(initial_state, config))
+
+
+def test_fused_self_loop_matches_per_iteration_execution():
+    fused = _run({"counter": 7}, {})
+    stepped = _run({"counter": 7}, {"fuse_loops": False})
+
+    assert fused["state"] == stepped["state"] == {"counter": 0, "visits": 7, "_node_config": {}}
+    assert len(stepped["execution_log"]) == 7
+    assert len(fused["execution_log"]) == 1
+    assert fused["execution_log"][0]["iterations"] == 7
+    assert fused["execution_log"][0]["delta"]["counter"] == 0
+
+
+def test_fused_self_loop_respects_max_iterations():
+    fused = _run({"counter": 50}, {"max_iterations": 5})
+    stepped = _run({"counter": 50}, {"max_iterations": 5, "fuse_loops": False})
+
+    assert fused["state"] == stepped["state"]
+    assert fused["state"]["visits"] == 5
+
+
+def test_single_pass_refine_matches_iterative_refine():
+    def refine_until_done(state):
+        state = dict(state)
+        for _ in range(200):
+            state.update(refine_summary(state))
+            if not summary_length_above_limit(state):
+                break
+        return state["final_summary"]
+
+    rng = random.Random(7)
+    for _ in range(2000):
+        text = "".join(rng.choice("ab. .\n") for _ in range(rng.randint(0, 40)))
+        state = {"merged_summary": text, "max_length": rng.randint(0, 45)}
+        expected = refine_until_done({**state, "_node_config": {}})
+        assert refine_until_done({**state, "_node_config": {"mode": "single_pass"}}) == expected
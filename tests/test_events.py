@@ -0,0 +1,36 @@
+import asyncio
+import json
+from datetime import datetime
+
+from app.engine import WorkflowEngine
+from app.events import _subscribers, format_sse, subscribe, unsubscribe
+from app.responses import dumps
+from app.run_store import get_plan, save_graph
+from app.workflows.summarization_workflow import create_summarization_workflow
+
+
+def test_engine_pushes_node_and_status_events():
+    save_graph(create_summarization_workflow())
+
+    async def scenario():
+        engine = WorkflowEngine(get_plan("summarization_workflow"))
+        queue = subscribe(engine.run_id)
+        await engine.run_sync({"text": "Push events. Not polls. " * 5, "max_length": 30})
+        events = []
+        while not queue.empty():
+            events.append(queue.get_nowait())
+        unsubscribe(engine.run_id, queue)
+        return engine.run_id, events
+
+    run_id, events = asyncio.run(scenario())
+    names = [event["event"] for event in events]
+    assert names[:2] == ["node_start", "node_end"]
+    assert events[1]["node_id"] == "split_text" and "chunks" in events[1]["delta"]
+    assert events[-1] == {"event": "status", "run_id": run_id, "status": "completed"}
+    assert run_id not in _subscribers  # the last unsubscribe drops the run's entry
+
+
+def test_sse_timestamps_match_the_json_api():
+    entry = {"event": "node_end", "end_ts": datetime(2024, 5, 1, 12, 30, 5, 250)}
+    data = json.loads(format_sse(entry).split("data: ", 1)[1])
+    assert data["end_ts"] == json.loads(dumps(entry))["end_ts"] == "2024-05-01T12:30:05.000250"
@@ -0,0 +1,49 @@
+import asyncio
+
+from app.executors import INLINE, THREAD, PROCESS, run_tool, run_map, process_payload
+from app.registry import summarize_chunk_rule_based
+
+
+def test_policies_return_same_result():
+    state = {"chunks": ["First. Second.", "Third. Fourth."], "text": "unused"}
+
+    async def run_all():
+        return [await run_tool(summarize_chunk_rule_based, policy, state, ("chunks",))
+                for policy in (INLINE, THREAD, PROCESS)]
+
+    results = asyncio.run(run_all())
+    assert results[0] == {"summaries": ["First.", "Third."]}
+    assert results[0] == results[1] == results[2]
+
+
+def test_process_payload_ships_only_declared_keys():
+    state = {"text": "x" * 1000, "chunks": ["a"], "_node_config": {"k": 1}}
+    assert process_payload(state, ("chunks",)) == {"chunks": ["a"], "_node_config": {"k": 1}}
+    assert process_payload(state, None) == state
+
+
+def test_run_map_preserves_order_with_bounded_concurrency():
+    in_flight = 0
+    peak = 0
+
+    async def slow_upper(payload):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        # Later items finish first
+        await asyncio.sleep(0.001 * (10 - payload["index"]))
+        in_flight -= 1
+        return payload["item"].upper()
+
+    items = [f"chunk{i}" for i in range(10)]
+    results = asyncio.run(run_map(slow_upper, INLINE, True, items, {}, max_concurrency=3))
+    assert results == [item.upper() for item in items]
+    assert peak <= 3
+
+
+def test_run_map_batches_through_process_pool():
+    from app.registry import summarize_text_rule_based
+
+    items = [f"Sentence {i}. Tail." for i in range(7)]
+    results = asyncio.run(run_map(summarize_text_rule_based, PROCESS, False, items, {}, batch_size=3))
+    assert results == [f"Sentence {i}." for i in range(7)]
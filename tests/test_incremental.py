@@ -0,0 +1,78 @@
+import random
+
+from fastapi.testclient import TestClient
+
+from app.chunking import resplit_chunks, split_chunks
+from app.main import app
+from app.registry import ToolRegistry
+
+client = TestClient(app)
+
+
+def test_resplit_matches_a_full_split_after_edits():
+    rng = random.Random(7)
+    words = ["alpha", "beta.", "gamma!", "delta", "eps?", "  ", "\n"]
+
+    def text(n):
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    for _ in range(500):
+        sentence_aware = rng.random() < 0.7
+        max_chars = rng.choice([5, 20, 50])
+        previous = text(rng.randint(0, 80))
+        cut = rng.randint(0, len(previous))
+        edited = previous[:cut] + text(rng.randint(0, 3)) + previous[cut + rng.randint(0, 10):] + text(rng.randint(0, 9))
+        chunks, _ = resplit_chunks(previous, split_chunks(previous, max_chars, sentence_aware), edited,
+                                   max_chars, sentence_aware)
+        assert chunks == split_chunks(edited, max_chars, sentence_aware)
+
+
+def test_resplit_only_cuts_the_edited_region():
+    previous = "One sentence here. Another one there! " * 500
+    chunks = split_chunks(previous, 100)
+    middle = len(previous) // 2
+    edited = previous[:middle] + "An edit. " + previous[middle:] + "Appended at the end."
+
+    resplit, cut_count = resplit_chunks(previous, chunks, edited, 100)
+    assert resplit == split_chunks(edited, 100)
+    assert cut_count <= 4
+
+
+calls = []
+
+
+@ToolRegistry.register_tool(policy="inline", reads=["item"])
+def counted_first_sentence(state):
+    calls.append(state["item"])
+    return state["item"].split(".")[0] + "."
+
+
+def test_run_with_previous_run_id_resummarizes_only_new_chunks():
+    graph = client.get("/graph/summarization_workflow").json()
+    graph["id"] = "incremental_summarization"
+    graph["nodes"][1]["action_name"] = "counted_first_sentence"
+    assert client.post("/graph/create", json=graph).status_code == 200
+
+    text = "".join(f"Sentence number {i} is here. " for i in range(40))
+    first = client.post("/graph/run", json={
+        "graph_id": "incremental_summarization", "run_mode": "sync",
+        "initial_state": {"text": text, "max_length": 5000}
+    }).json()
+    first_calls = len(calls)
+
+    second = client.post("/graph/run", json={
+        "graph_id": "incremental_summarization", "run_mode": "sync",
+        "initial_state": {"text": text + "A new sentence arrives. ", "max_length": 5000},
+        "config": {"previous_run_id": first["run_id"]}
+    }).json()
+    assert second["status"] == "completed", second["error"]
+    assert len(calls) - first_calls <= 2
+    kept = len(first["state"]["summaries"]) - 1
+    assert second["state"]["summaries"][:kept] == first["state"]["summaries"][:kept]
+    assert second["execution_log"][1]["cache_hits"] >= len(first["state"]["summaries"]) - 1
+
+    response = client.post("/graph/run", json={
+        "graph_id": "summarization_workflow", "run_mode": "sync", "initial_state": {"text": text},
+        "config": {"previous_run_id": first["run_id"]}
+    })
+    assert response.status_code == 400
@@ -0,0 +1,38 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.metrics import Histogram, NODE_DURATION, RUNS_TOTAL
+
+client = TestClient(app)
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_latency_seconds", "Test histogram.", ("node",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(("a",), value)
+
+    lines = histogram.render()
+    assert 'test_latency_seconds_bucket{node="a",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{node="a",le="1"} 3' in lines
+    assert 'test_latency_seconds_bucket{node="a",le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_count{node="a"} 4' in lines
+
+
+def test_metrics_endpoint_reports_runs_and_nodes():
+    completed_before = RUNS_TOTAL.get(("summarization_workflow", "completed"))
+    split_before = NODE_DURATION.count(("summarization_workflow", "split_text"))
+    payload = {
+        "graph_id": "summarization_workflow",
+        "initial_state": {"text": "Measure this. Then that. " * 8, "max_length": 40},
+        "run_mode": "sync"
+    }
+    assert client.post("/graph/run", json=payload).status_code == 200
+
+    assert RUNS_TOTAL.get(("summarization_workflow", "completed")) == completed_before + 1
+    assert NODE_DURATION.count(("summarization_workflow", "split_text")) == split_before + 1
+
+    body = client.get("/metrics").text
+    assert "# TYPE workflow_node_duration_seconds histogram" in body
+    assert 'workflow_state_bytes{graph="summarization_workflow",node="refine_final_summary"}' in body
+    assert "workflow_queue_depth 0" in body
+    assert 'workflow_store_seconds_total{operation="append_log"}' in body
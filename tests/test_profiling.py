@@ -0,0 +1,69 @@
+import asyncio
+import uuid
+
+from fastapi.testclient import TestClient
+
+from app.engine import WorkflowEngine
+from app.main import app
+from app.run_store import get_plan, get_run
+
+client = TestClient(app)
+
+
+def _run(config):
+    # Unique text so the node cache can't answer the tools.
+    text = f"Profiling run {uuid.uuid4()}. " + "Another sentence to summarize. " * 20
+    response = client.post("/graph/run", json={
+        "graph_id": "summarization_workflow",
+        "initial_state": {"text": text, "max_length": 40},
+        "run_mode": "sync",
+        "config": config
+    })
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_profiled_run_exposes_cpu_and_memory_per_node():
+    data = _run({"profile": ["cpu", "memory"]})
+    assert data["status"] == "completed"
+
+    response = client.get(f"/graph/profile/{data['run_id']}")
+    assert response.status_code == 200
+    profile = response.json()
+    assert profile["modes"] == ["cpu", "memory"]
+    nodes = {node["node_id"]: node for node in profile["nodes"]}
+    assert set(nodes) == {"split_text", "summarize_chunks", "merge_summaries", "refine_final_summary"}
+    # Tools run inline while cpu-profiled, so their own frames are in the profile.
+    functions = [f["function"] for f in nodes["split_text"]["cpu"]["functions"]]
+    assert any("split_text_to_chunks" in name for name in functions)
+    assert nodes["summarize_chunks"]["peak_bytes"] > 0
+    assert profile["allocations"]
+
+
+def test_unprofiled_run_has_no_profile():
+    data = _run({})
+    assert client.get(f"/graph/profile/{data['run_id']}").status_code == 404
+    assert client.get("/graph/profile/missing").status_code == 404
+
+
+def test_rejects_unknown_profile_mode():
+    response = client.post("/graph/run", json={
+        "graph_id": "summarization_workflow", "run_mode": "sync", "config": {"profile": "gpu"}
+    })
+    assert response.status_code == 400
+
+
+def test_profiled_runs_take_turns():
+    async def both():
+        engine = lambda: WorkflowEngine(get_plan("summarization_workflow"))
+        text = f"Profiling run {uuid.uuid4()}. " + "Another sentence to summarize. " * 20
+        return await asyncio.gather(*(engine().run_sync({"text": text + str(i), "max_length": 40},
+                                                        config={"profile": "cpu"}) for i in range(2)))
+
+    runs = asyncio.run(both())
+    assert all(run["status"] == "completed" for run in runs)
+    profiles = [get_run(run["run_id"])["profile"] for run in runs]
+    # Both hold the cpu profiler, one after the other.
+    assert all(len(profile["nodes"]) == 4 and "cpu" in profile["nodes"][0] for profile in profiles)
+    assert any(note.startswith("waited") for profile in profiles for note in profile["notes"])
+    assert all(any("whole process" in note for note in profile["notes"]) for profile in profiles)
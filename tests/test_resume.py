@@ -0,0 +1,87 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models.api_models import GraphDefinition, NodeDefinition, EdgeDefinition
+from app.registry import ToolRegistry
+from app.run_store import SqliteRunStore, save_graph
+
+client = TestClient(app)
+
+
+@ToolRegistry.register_tool()
+def count_prepare(state):
+    return {"prepared": state.get("prepared", 0) + 1}
+
+
+@ToolRegistry.register_tool()
+def double_unless_broken(state):
+    if state.get("broken"):
+        raise RuntimeError("tool exploded")
+    return {"value": state["value"] * 2}
+
+
+save_graph(GraphDefinition(
+    id="resumable",
+    start_node_id="prepare",
+    nodes=[NodeDefinition(id="prepare", action_name="count_prepare"),
+           NodeDefinition(id="double", action_name="double_unless_broken")],
+    edges=[EdgeDefinition(source_id="prepare", target_id="double")]
+))
+
+
+def _failed_run():
+    response = client.post("/graph/run", json={
+        "graph_id": "resumable", "run_mode": "sync", "initial_state": {"value": 21, "broken": True}
+    })
+    data = response.json()
+    assert data["status"] == "failed"
+    return data["run_id"]
+
+
+def test_resume_continues_after_last_successful_node():
+    run_id = _failed_run()
+    response = client.post(f"/graph/resume/{run_id}", json={"run_mode": "sync", "state_patch": {"broken": False}})
+    assert response.status_code == 200
+    data = response.json()
+
+    assert data["run_id"] == run_id
+    assert data["status"] == "completed"
+    assert data["error"] is None
+    assert data["state"]["value"] == 42
+    assert data["state"]["prepared"] == 1  # "prepare" was not run again
+    assert [entry["node_id"] for entry in data["execution_log"]] == ["prepare", "_resume", "double"]
+    assert data["execution_log"][-1]["state_snapshot"]["value"] == 42
+
+
+def test_resume_with_start_node_override_and_conflicts():
+    run_id = _failed_run()
+    assert client.post(f"/graph/resume/{run_id}", json={"start_node_id": "nope"}).status_code == 409
+    response = client.post(f"/graph/resume/{run_id}", json={
+        "run_mode": "sync", "start_node_id": "prepare", "state_patch": {"broken": False}
+    })
+    assert response.json()["state"]["prepared"] == 2
+
+    # Bad config is rejected before the completed run is touched.
+    response = client.post(f"/graph/resume/{run_id}", json={
+        "run_mode": "sync", "start_node_id": "prepare", "config": {"profile": "bogus"}
+    })
+    assert response.status_code == 400
+    assert client.get(f"/graph/state/{run_id}").json()["status"] == "completed"
+
+    # Completed: nothing left to resume unless a start node is given.
+    assert client.post(f"/graph/resume/{run_id}", json={"run_mode": "sync"}).status_code == 409
+    assert client.post("/graph/resume/missing", json={}).status_code == 404
+
+
+def test_sqlite_store_marks_runs_from_a_previous_process_interrupted(tmp_path):
+    path = str(tmp_path / "runs.db")
+    store = SqliteRunStore(path)
+    store.save_run("left-running", {"run_id": "left-running", "status": "running", "execution_log": []})
+    store.save_run("done", {"run_id": "done", "status": "completed", "execution_log": []})
+    store.close()
+
+    restarted = SqliteRunStore(path)
+    assert restarted.mark_interrupted() == ["left-running"]
+    assert restarted.get_run("left-running")["status"] == "interrupted"
+    assert restarted.get_run("done")["status"] == "completed"
+    restarted.close()
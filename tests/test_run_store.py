@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from app.run_store import InMemoryRunStore, SqliteRunStore
+
+
+def _record(run_id):
+    return {"run_id": run_id, "status": "running", "initial_state": {"text": "abc"},
+            "state": {"text": "abc"}, "execution_log": []}
+
+
+def test_sqlite_store_appends_log_and_reads_finished_runs_from_disk(tmp_path):
+    path = str(tmp_path / "runs.db")
+    store = SqliteRunStore(path, batch_size=2)
+    store.save_run("r1", _record("r1"))
+    for i in range(3):
+        store.append_log("r1", {"node_id": f"n{i}", "start_ts": datetime.utcnow(),
+                                "end_ts": datetime.utcnow(), "delta": {"i": i}})
+    store.update_run("r1", {"status": "completed", "state": {"text": "abc", "i": 2}})
+    store.close()
+
+    reopened = SqliteRunStore(path)
+    run = reopened.get_run("r1")
+    assert run["status"] == "completed"
+    assert run["state"] == {"text": "abc", "i": 2}
+    assert [entry["node_id"] for entry in run["execution_log"]] == ["n0", "n1", "n2"]
+    assert reopened.get_run("missing") is None
+    reopened.close()
+
+
+def test_stores_evict_oldest_finished_runs(tmp_path):
+    for store in (InMemoryRunStore(max_runs=2), SqliteRunStore(str(tmp_path / "evict.db"), max_runs=2)):
+        for run_id in ("a", "b", "c"):
+            store.save_run(run_id, _record(run_id))
+            store.update_run(run_id, {"status": "completed"})
+        store.save_run("live", _record("live"))
+
+        assert store.get_run("a") is None
+        assert store.get_run("c")["status"] == "completed"
+        assert store.get_run("live")["status"] == "running"
+        store.close()
+
+
+def test_sqlite_store_writes_state_only_at_checkpoints(tmp_path):
+    path = str(tmp_path / "runs.db")
+    store = SqliteRunStore(path, batch_size=1)
+    record = _record("r1")
+    store.save_run("r1", record)
+    other = SqliteRunStore(path)  # another process reading the active run
+
+    record["state"]["i"] = 1  # the engine mutates the state in place
+    store.append_log("r1", {"node_id": "n0", "start_ts": datetime.utcnow(),
+                            "end_ts": datetime.utcnow(), "delta": {"i": 1}})
+    run = other.get_run("r1")
+    assert run["state"] == {"text": "abc"} and len(run["execution_log"]) == 1
+    row = other._conn.execute("SELECT record FROM runs WHERE run_id = 'r1'").fetchone()
+    assert '"state"' not in row[0]
+
+    store.update_run("r1", {"checkpoint": {"next": [], "after": "n0"}})
+    assert other.get_run("r1")["state"] == {"text": "abc", "i": 1}
+    store.close()
+    other.close()
@@ -50,6 +50,103 @@ def test_run_workflow_sync():
     assert "merge_summaries" in node_ids
     assert "refine_final_summary" in node_ids
 
+def test_create_graph_rejects_unknown_tool():
+    payload = {
+        "id": "broken_workflow",
+        "start_node_id": "a",
+        "nodes": [{"id": "a", "action_name": "no_such_tool"}],
+        "edges": [{"source_id": "a", "target_id": "a", "condition_name": "no_such_condition"}]
+    }
+
+    response = client.post("/graph/create", json=payload)
+    assert response.status_code == 400
+    assert "no_such_tool" in response.json()["detail"]
+    assert "no_such_condition" in response.json()["detail"]
+
+    assert client.get("/graph/broken_workflow").status_code == 404
+
+def test_run_workflow_streamed_body():
+    def body():
+        for _ in range(20):
+            yield b"First sentence of the part. Second sentence follows here. "
+
+    response = client.post(
+        "/graph/run/stream",
+        params={"graph_id": "summarization_workflow", "max_chunk_chars": 60, "initial_state": '{"max_length": 40}'},
+        content=body()
+    )
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["status"] == "completed"
+    # Sentence-aligned chunks summarize to whole first sentences
+    assert data["state"]["summaries"][0] == "First sentence of the part."
+    assert "chunks" not in data["state"]
+    assert len(data["state"]["final_summary"]) <= 40
+    assert data["execution_log"][0]["node_id"] == "summarize_chunks"
+
+def test_run_workflow_batch():
+    texts = [f"Document {i} opens here. It then goes on for a while. " * (i + 3) for i in range(4)]
+    payload = {
+        "graph_id": "summarization_workflow",
+        "initial_states": [{"text": text, "max_length": 60} for text in texts],
+        "config": {"max_iterations": 50}
+    }
+
+    response = client.post("/graph/run/batch", json=payload)
+    assert response.status_code == 200
+
+    runs = response.json()["runs"]
+    assert len(runs) == 4
+    assert len({run["run_id"] for run in runs}) == 4
+    for i, run in enumerate(runs):
+        assert run["status"] == "completed"
+        assert run["state"]["text"] == texts[i]
+        assert run["state"]["summaries"][0] == f"Document {i} opens here."
+        assert len(run["state"]["final_summary"]) <= 60
+
+    # Each item is a normal run record
+    single = client.get(f"/graph/state/{runs[2]['run_id']}").json()
+    assert single["state"]["final_summary"] == runs[2]["state"]["final_summary"]
+
+def test_keyword_workflow_runs_branches_and_joins():
+    text = "Graphs route state between tools. Tools update graphs quickly. " * 10
+    response = client.post("/graph/run", json={
+        "graph_id": "keyword_summarization_workflow",
+        "initial_state": {"text": text, "max_length": 60},
+        "run_mode": "sync"
+    })
+    data = response.json()
+    assert data["status"] == "completed"
+    assert data["state"]["keywords"][:2] == ["graphs", "tools"]
+    assert len(data["state"]["final_summary"]) <= 60
+    assert data["execution_log"][-1]["node_id"] == "combine"
+
+def test_run_state_projections():
+    run = client.post("/graph/run", json={
+        "graph_id": "summarization_workflow",
+        "initial_state": {"text": "Short runs page too. " * 20, "max_length": 40},
+        "run_mode": "sync"
+    }).json()
+    run_id = run["run_id"]
+    total = len(run["execution_log"])
+    assert run["log_total"] == total
+
+    assert client.get(f"/graph/state/{run_id}?fields=status").json() == {"run_id": run_id, "status": "completed"}
+    assert client.get(f"/graph/state/{run_id}?fields=status,bogus").status_code == 400
+
+    data = client.get(f"/graph/state/{run_id}?fields=state,execution_log&state_keys=max_length,final_summary"
+                      f"&log_offset=1&log_limit=2").json()
+    assert set(data["state"]) == {"max_length", "final_summary"}
+    assert data["log_total"] == total
+    assert [entry["node_id"] for entry in data["execution_log"]] == [e["node_id"] for e in run["execution_log"][1:3]]
+    assert data["execution_log"][0]["state_snapshot"] == {"max_length": 40}
+    assert data["execution_log"][0]["start_ts"] == run["execution_log"][1]["start_ts"]
+
+    slim = client.get(f"/graph/state/{run_id}?fields=execution_log&snapshots=false").json()
+    assert all(entry["state_snapshot"] is None for entry in slim["execution_log"])
+    assert "state" not in slim
+
 if __name__ == "__main__":
     test_run_workflow_sync()
     print("Test passed!")
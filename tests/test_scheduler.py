@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.scheduler import QueueFullError, RunScheduler, configure_scheduler, get_scheduler
+
+
+def test_scheduler_rejects_when_full_and_honours_priority():
+    async def scenario():
+        scheduler = RunScheduler(workers=1, max_queue=2)
+        gate = asyncio.Event()
+        order = []
+
+        async def job(name):
+            if name == "blocker":
+                await gate.wait()
+            order.append(name)
+
+        scheduler.submit("g", lambda: job("blocker"))
+        await asyncio.sleep(0)  # worker picks up the blocker
+        scheduler.submit("g", lambda: job("low"), priority=0)
+        scheduler.submit("g", lambda: job("high"), priority=5)
+        with pytest.raises(QueueFullError) as excinfo:
+            scheduler.submit("g", lambda: job("rejected"))
+        assert excinfo.value.retry_after >= 1
+        assert scheduler.stats()["queue_depth"] == 2
+
+        gate.set()
+        await scheduler._queue.join()
+        await scheduler.stop()
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["blocker", "high", "low"]
+    assert stats["rejected"] == 1 and stats["finished"] == 3
+
+
+def test_scheduler_limits_concurrency_per_graph():
+    async def scenario():
+        scheduler = RunScheduler(workers=4, per_graph_limit=1)
+        running = {"busy": 0}
+        peak = {"busy": 0}
+
+        async def job(graph_id):
+            running[graph_id] = running.get(graph_id, 0) + 1
+            peak[graph_id] = max(peak.get(graph_id, 0), running[graph_id])
+            await asyncio.sleep(0.01)
+            running[graph_id] -= 1
+
+        for _ in range(3):
+            scheduler.submit("busy", lambda: job("busy"))
+        scheduler.submit("other", lambda: job("other"))
+        while scheduler.stats()["finished"] < 4:
+            await asyncio.sleep(0.005)
+        await scheduler.stop()
+        return peak
+
+    peak = asyncio.run(scenario())
+    assert peak == {"busy": 1, "other": 1}
+
+
+def test_batches_are_admitted_by_their_size():
+    client = TestClient(app)
+    states = [{"text": "One sentence. Two.", "max_length": 20}] * 3
+    payload = {"graph_id": "summarization_workflow", "initial_states": states}
+    assert client.post("/graph/run/batch", json={**payload, "initial_states": states * 34}).status_code == 422
+
+    previous = get_scheduler()
+    configure_scheduler(RunScheduler(workers=1, max_queue=2))
+    try:
+        response = client.post("/graph/run/batch", json=payload)
+        assert response.status_code == 429 and int(response.headers["Retry-After"]) >= 1
+        response = client.post("/graph/run/batch", json={**payload, "initial_states": states[:2]})
+        assert [run["status"] for run in response.json()["runs"]] == ["completed"] * 2
+    finally:
+        configure_scheduler(previous)
@@ -0,0 +1,29 @@
+import pytest
+
+from app.state import RunState, materialize_log
+
+
+def test_apply_records_only_changed_keys():
+    text = "x" * 10_000
+    state = RunState({"text": text, "max_length": 50})
+
+    delta = state.apply({"text": text, "max_length": 50, "chunks": ["a", "b"]})
+    assert delta == {"chunks": ["a", "b"]}
+    assert state.data["text"] is text
+
+    with pytest.raises(TypeError):
+        state.view()["text"] = "mutated"
+
+
+def test_materialize_log_rebuilds_snapshots():
+    initial = {"text": "abc"}
+    log = [
+        {"node_id": "split", "delta": {"chunks": ["abc"]}},
+        {"node_id": "refine", "delta": {"final_summary": "a"}},
+        {"node_id": "refine", "delta": {}},
+    ]
+
+    entries = materialize_log(initial, log)
+    assert entries[0]["state_snapshot"] == {"text": "abc", "chunks": ["abc"]}
+    assert entries[2]["state_snapshot"] == {"text": "abc", "chunks": ["abc"], "final_summary": "a"}
+    assert "state_snapshot" not in log[0]
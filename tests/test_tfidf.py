@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.registry import summarize_chunks_tfidf
+from app.tfidf import score_sentences
+
+client = TestClient(app)
+
+TEXT = (
+    "Graph engines run tools over shared state. "
+    "The weather was nice. "
+    "Tools in a graph engine update the shared state and the graph routes between tools! "
+    "Lunch was late? "
+    "A graph engine compiles each graph before running its tools on the state."
+)
+
+
+def test_scores_every_sentence_and_prefers_central_ones():
+    sentences, scores = score_sentences(TEXT)
+    assert [s.strip() for s in sentences][1] == "The weather was nice."
+    assert len(scores) == 5
+    assert scores[2] > scores[1] and scores[2] > scores[3]
+
+
+def test_selects_top_sentences_in_order_within_budget():
+    chunks = [TEXT[:60], TEXT[60:]]  # sentence split across chunks is rejoined
+    summaries = summarize_chunks_tfidf({"chunks": chunks, "_node_config": {"max_chars": 130}})["summaries"]
+    assert len(" ".join(summaries)) <= 130
+    assert "The weather was nice." not in summaries
+    assert summaries == sorted(summaries, key=TEXT.index)
+    assert summarize_chunks_tfidf({"chunks": [], "max_length": 50})["summaries"] == []
+
+
+def test_extractive_workflow_needs_no_refine_trimming():
+    response = client.post("/graph/run", json={
+        "graph_id": "extractive_summarization_workflow",
+        "initial_state": {"text": TEXT * 3, "max_length": 120},
+        "run_mode": "sync"
+    })
+    data = response.json()
+    assert data["status"] == "completed"
+    assert 0 < len(data["state"]["final_summary"]) <= 120
+    refine = [entry for entry in data["execution_log"] if entry["node_id"] == "refine_final_summary"]
+    assert len(refine) == 1 and refine[0]["iterations"] == 1
+    assert data["state"]["final_summary"] == data["state"]["merged_summary"]
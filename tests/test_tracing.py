@@ -0,0 +1,107 @@
+import json
+import logging
+import uuid
+
+from fastapi.testclient import TestClient
+
+from app.logs import RunSampleFilter, run_logged, sampled
+from app.main import app
+from app.run_store import save_graph
+from app.tracing import Tracer, configure_tracer
+from app.workflows.summarization_workflow import create_summarization_workflow
+
+client = TestClient(app)
+
+
+def _run(config):
+    text = f"Traced run {uuid.uuid4()}. " + "Another sentence to summarize. " * 20
+    data = client.post("/graph/run", json={
+        "graph_id": "cached_summarization_workflow",
+        "initial_state": {"text": text, "max_length": 40},
+        "run_mode": "sync",
+        "config": config
+    }).json()
+    assert data["status"] == "completed"
+    return data["run_id"]
+
+
+def test_runs_are_traced_as_nested_chrome_trace_spans(tmp_path):
+    graph = create_summarization_workflow()
+    graph.id = "cached_summarization_workflow"
+    for node in graph.nodes[:3]: # the tools with declared reads
+        node.config["cache"] = True
+    graph.nodes[0].config["sentence_aware"] = True # repeated sentences become repeated chunks
+    save_graph(graph)
+    path = tmp_path / "trace.json"
+    configure_tracer(Tracer(str(path), sample_rate=0.0))
+    try:
+        run_id = _run({"trace": True})
+        _run({}) # not sampled
+    finally:
+        configure_tracer(None) # flushes the file
+
+    text = path.read_text()
+    events = json.loads(text.rstrip().rstrip(",") + "]") # the array is left open for appending
+    spans = [event for event in events if event["ph"] == "X"]
+    assert {span["cat"] for span in spans} == {"run", "node", "tool"}
+    (run,) = [span for span in spans if span["cat"] == "run"]
+    assert run["args"] == {"run_id": run_id, "status": "completed"}
+
+    nodes = [span for span in spans if span["cat"] == "node"]
+    assert [span["name"] for span in nodes] == [
+        "split_text", "summarize_chunks", "merge_summaries", "refine_final_summary"
+    ]
+    tool = next(span for span in spans if span["cat"] == "tool" and span["args"]["node_id"] == "summarize_chunks")
+    assert tool["args"]["map_over"] == "chunks"
+    assert tool["args"]["cache_hits"] == nodes[1]["args"]["cache_hits"] > 0 # repeated chunks
+    for span in nodes + [tool]:
+        assert span["tid"] == run["tid"]
+        assert run["ts"] <= span["ts"] and span["ts"] + span["dur"] <= run["ts"] + run["dur"]
+
+
+def test_info_logs_of_unsampled_runs_are_dropped():
+    assert sampled("any-run", 1.0) and not sampled("any-run", 0.0)
+    log_filter = RunSampleFilter()
+
+    def record(level):
+        return logging.LogRecord("app.engine", level, __file__, 1, "message", None, None)
+
+    token = run_logged.set(False)
+    try:
+        assert not log_filter.filter(record(logging.INFO))
+        assert log_filter.filter(record(logging.ERROR))
+    finally:
+        run_logged.reset(token)
+    assert log_filter.filter(record(logging.INFO))
+
+
+def test_batch_runs_are_sampled_and_traced_per_run(tmp_path, monkeypatch):
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    handler.addFilter(RunSampleFilter())
+    engine_logger = logging.getLogger("app.engine")
+    engine_logger.addHandler(handler)
+    level = engine_logger.level
+    engine_logger.setLevel(logging.INFO)
+    monkeypatch.setenv("WORKFLOW_LOG_SAMPLE", "0")
+    path = tmp_path / "trace.json"
+    configure_tracer(Tracer(str(path), sample_rate=0.0))
+    try:
+        data = client.post("/graph/run/batch", json={
+            "graph_id": "summarization_workflow",
+            "initial_states": [{"text": "Batched. Traced. " * 5, "max_length": 20}] * 2,
+            "config": {"trace": True}
+        }).json()
+    finally:
+        configure_tracer(None)
+        engine_logger.removeHandler(handler)
+        engine_logger.setLevel(level)
+
+    assert not [record for record in records if record.levelno < logging.WARNING] # not sampled
+    events = json.loads(path.read_text().rstrip().rstrip(",") + "]")
+    runs = [event for event in events if event["ph"] == "X" and event["cat"] == "run"]
+    assert sorted(span["args"]["run_id"] for span in runs) == sorted(run["run_id"] for run in data["runs"])
+    assert all(span["args"]["status"] == "completed" for span in runs)
+    nodes = [event for event in events if event["ph"] == "X" and event["cat"] == "node"]
+    assert len(nodes) == 2 * 4
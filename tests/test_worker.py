@@ -0,0 +1,73 @@
+import asyncio
+
+from app.engine import WorkflowEngine
+from app.job_queue import SqliteJobQueue
+from fastapi.testclient import TestClient
+
+from app.main import _poll_run_events, app
+from app.run_store import SqliteRunStore, configure_store, get_log_since, get_plan, get_run, get_store, save_graph
+from app.worker import Worker
+from app.workflows.summarization_workflow import create_summarization_workflow
+
+
+def test_job_queue_claims_by_priority_once_and_requeues_stale(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue("low")
+    queue.enqueue("high", priority=5)
+    other = SqliteJobQueue(str(tmp_path / "jobs.db"))  # a second process sharing the file
+
+    first = queue.claim("w1")
+    second = other.claim("w2")
+    assert (first["run_id"], second["run_id"]) == ("high", "low")
+    assert queue.claim("w1") is None
+
+    assert queue.requeue_stale(stale_after=-1) == 2  # nobody heartbeated "in the future"
+    queue.complete(queue.claim("w1")["job_id"])
+    assert queue.depth() == 1
+    queue.close()
+    other.close()
+
+
+def test_worker_executes_runs_queued_by_the_api_tier(tmp_path):
+    previous = get_store()
+    path = str(tmp_path / "runs.db")
+    store = SqliteRunStore(path)
+    queue = SqliteJobQueue(path)
+    configure_store(store)
+    try:
+        save_graph(create_summarization_workflow())
+        engine = WorkflowEngine(get_plan("summarization_workflow"))
+        run_id = engine.run_remote(queue, {"text": "Remote runs work. They really do. " * 5, "max_length": 30})
+        assert get_run(run_id)["status"] == "queued"
+        assert queue.depth() == 1
+
+        worker = Worker(queue, concurrency=2, poll_interval=0.01)
+
+        async def drive():
+            task = asyncio.create_task(worker.run())
+            # What /graph/stream sends for runs executing elsewhere: events read from the store.
+            events = [message async for message in _poll_run_events(get_run(run_id), 15.0, 0.01)]
+            worker.stop()
+            await task
+            return events
+
+        events = asyncio.run(asyncio.wait_for(drive(), timeout=30))
+        assert events[0].startswith("event: snapshot")
+        assert sum(message.startswith("event: node_end") for message in events) == 4
+        assert '"status": "completed"' in events[-1]
+        run = get_run(run_id)
+        assert run["status"] == "completed", run.get("error")
+        assert len(run["state"]["final_summary"]) <= 30
+        progress = get_log_since(run_id, 3)
+        assert progress["status"] == "completed" and len(progress["log"]) == 1
+        assert queue.depth() == 0
+    finally:
+        configure_store(previous)
+        store.close()
+        queue.close()
+
+
+def test_stream_rejects_spinning_poll_intervals():
+    client = TestClient(app)
+    assert client.get("/graph/stream/any?poll_seconds=0").status_code == 422
+    assert client.get("/graph/stream/any?keepalive_seconds=0").status_code == 422